@@ -1,45 +1,248 @@
 # aggregate_daily_metrics.py
 import os
-import psycopg2
+import sys
+import psycopg2.errors
 from dotenv import load_dotenv
+import db
 
 load_dotenv()
 
-# Connect to DB
-conn = psycopg2.connect(
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT")
-)
-cursor = conn.cursor()
-
-print("📊 Aggregating daily metrics for all historical data...")
-
-cursor.execute("""
-    INSERT INTO daily_metrics (
-        date, region, total_orders, total_revenue, avg_order_value, is_promo_day
-    )
-    SELECT
-        DATE(timestamp) AS date,
-        region,
-        COUNT(*) AS total_orders,
-        SUM(total_price) AS total_revenue,
-        AVG(total_price) AS avg_order_value,
-        CASE WHEN EXTRACT(DAY FROM DATE(timestamp)) = 10 THEN TRUE ELSE FALSE END AS is_promo_day
-    FROM orders
-    GROUP BY DATE(timestamp), region
+# --- Configs ---
+# "incremental" only recomputes the (date, region) groups touched since the last run;
+# "full" (or passing --full) re-aggregates the whole orders table.
+AGGREGATION_MODE = os.getenv("AGGREGATION_MODE", "incremental")
+WATERMARK_NAME = "daily_metrics"
+# ingest_seq values are handed out at INSERT time but become visible at COMMIT,
+# so a slow batch can commit below a watermark another worker already moved past.
+# Every run re-scans this many sequence numbers below the watermark to catch them.
+AGGREGATION_SEQ_OVERLAP = int(os.getenv("AGGREGATION_SEQ_OVERLAP", 100_000))
+# Reruns after a live_rollups compaction overlapped the run's snapshot
+AGGREGATION_RETRIES = int(os.getenv("AGGREGATION_RETRIES", 3))
+
+UPSERT_DAILY_METRICS = """
     ON CONFLICT (date, region) DO UPDATE
     SET
         total_orders = EXCLUDED.total_orders,
         total_revenue = EXCLUDED.total_revenue,
         avg_order_value = EXCLUDED.avg_order_value,
-        is_promo_day = EXCLUDED.is_promo_day;
-""")
+        is_promo_day = EXCLUDED.is_promo_day
+"""
+
+# Rollup grain for the dashboard: (date, hour, region, category, user_segment)
+UPSERT_ORDER_ROLLUPS = """
+    ON CONFLICT (region, date, hour, category, user_segment) DO UPDATE
+    SET
+        total_orders = EXCLUDED.total_orders,
+        total_revenue = EXCLUDED.total_revenue
+"""
+# Orders without a category/segment (e.g. from the Kafka stream) roll up under this value
+UNKNOWN_DIMENSION = "Unknown"
+
+
+def get_watermark(cursor, name):
+    cursor.execute("SELECT watermark FROM pipeline_state WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def set_watermark(cursor, name, value):
+    cursor.execute("""
+        INSERT INTO pipeline_state (name, watermark, updated_at)
+        VALUES (%s, %s, NOW())
+        ON CONFLICT (name) DO UPDATE
+        SET watermark = EXCLUDED.watermark, updated_at = EXCLUDED.updated_at
+    """, (name, value))
+
+
+def aggregate_full(cursor):
+    cursor.execute(f"""
+        INSERT INTO daily_metrics (
+            date, region, total_orders, total_revenue, avg_order_value, is_promo_day
+        )
+        SELECT
+            DATE(timestamp) AS date,
+            region,
+            COUNT(*) AS total_orders,
+            SUM(total_price) AS total_revenue,
+            AVG(total_price) AS avg_order_value,
+            CASE WHEN EXTRACT(DAY FROM DATE(timestamp)) = 10 THEN TRUE ELSE FALSE END AS is_promo_day
+        FROM orders
+        GROUP BY DATE(timestamp), region
+        {UPSERT_DAILY_METRICS};
+    """)
+    return cursor.rowcount
+
+
+def stage_touched_groups(cursor, low_seq, high_seq):
+    # The (date, region) groups that received new orders since the last run,
+    # plus those of late commits within the overlap window below the watermark
+    cursor.execute("""
+        CREATE TEMP TABLE touched_groups ON COMMIT DROP AS
+        SELECT DISTINCT DATE(timestamp) AS date, region
+        FROM orders
+        WHERE ingest_seq > %(low)s AND ingest_seq <= %(high)s
+    """, {"low": max(low_seq - AGGREGATION_SEQ_OVERLAP, 0), "high": high_seq})
+    cursor.execute("SELECT COUNT(*) FROM touched_groups")
+    return cursor.fetchone()[0]
+
+
+def aggregate_incremental(cursor):
+    # Rebuild just the touched groups. The range predicate on timestamp lets
+    # Postgres use the (region, timestamp) index.
+    cursor.execute(f"""
+        INSERT INTO daily_metrics (
+            date, region, total_orders, total_revenue, avg_order_value, is_promo_day
+        )
+        SELECT
+            t.date,
+            t.region,
+            COUNT(*) AS total_orders,
+            SUM(o.total_price) AS total_revenue,
+            AVG(o.total_price) AS avg_order_value,
+            CASE WHEN EXTRACT(DAY FROM t.date) = 10 THEN TRUE ELSE FALSE END AS is_promo_day
+        FROM touched_groups t
+        JOIN orders o
+          ON o.region = t.region
+         AND o.timestamp >= t.date
+         AND o.timestamp < t.date + 1
+        GROUP BY t.date, t.region
+        {UPSERT_DAILY_METRICS};
+    """)
+    return cursor.rowcount
+
+
+def rollup_full(cursor):
+    cursor.execute(f"""
+        INSERT INTO order_rollups (
+            date, hour, region, category, user_segment, total_orders, total_revenue
+        )
+        SELECT
+            DATE(timestamp) AS date,
+            EXTRACT(HOUR FROM timestamp)::INT AS hour,
+            region,
+            COALESCE(category, '{UNKNOWN_DIMENSION}') AS category,
+            COALESCE(user_segment, '{UNKNOWN_DIMENSION}') AS user_segment,
+            COUNT(*) AS total_orders,
+            SUM(total_price) AS total_revenue
+        FROM orders
+        GROUP BY 1, 2, 3, 4, 5
+        {UPSERT_ORDER_ROLLUPS};
+    """)
+    return cursor.rowcount
+
+
+def rollup_incremental(cursor):
+    cursor.execute(f"""
+        INSERT INTO order_rollups (
+            date, hour, region, category, user_segment, total_orders, total_revenue
+        )
+        SELECT
+            t.date,
+            EXTRACT(HOUR FROM o.timestamp)::INT AS hour,
+            t.region,
+            COALESCE(o.category, '{UNKNOWN_DIMENSION}') AS category,
+            COALESCE(o.user_segment, '{UNKNOWN_DIMENSION}') AS user_segment,
+            COUNT(*) AS total_orders,
+            SUM(o.total_price) AS total_revenue
+        FROM touched_groups t
+        JOIN orders o
+          ON o.region = t.region
+         AND o.timestamp >= t.date
+         AND o.timestamp < t.date + 1
+        GROUP BY 1, 2, 3, 4, 5
+        {UPSERT_ORDER_ROLLUPS};
+    """)
+    return cursor.rowcount
+
+
+def refresh_dimensions(cursor, incremental):
+    # Distinct filter values for the dashboard sidebar, read from the (much smaller)
+    # rollups; incremental runs only look at the touched groups.
+    source = "order_rollups r"
+    if incremental:
+        source += " JOIN touched_groups t ON r.date = t.date AND r.region = t.region"
+    cursor.execute(f"""
+        INSERT INTO order_dimensions (dimension, value)
+        SELECT DISTINCT 'category', r.category FROM {source}
+        WHERE r.category <> '{UNKNOWN_DIMENSION}'
+        UNION
+        SELECT DISTINCT 'user_segment', r.user_segment FROM {source}
+        WHERE r.user_segment <> '{UNKNOWN_DIMENSION}'
+        UNION
+        SELECT DISTINCT 'hour', r.hour::TEXT FROM {source}
+        ON CONFLICT (dimension, value) DO NOTHING
+    """)
+    return cursor.rowcount
+
+
+def clear_live_rollups(cursor, incremental):
+    # The consumer's live deltas (daily_rollups.py) for the recomputed groups are
+    # now counted in the batch tables. Deltas committed after this run's snapshot
+    # are invisible to the DELETE, just like their orders were to the aggregation.
+    if incremental:
+        cursor.execute("""
+            DELETE FROM live_rollups l
+            USING touched_groups t
+            WHERE l.date = t.date AND l.region = t.region
+        """)
+    else:
+        cursor.execute("DELETE FROM live_rollups")
+    return cursor.rowcount
+
+
+def run_aggregation(conn, full_rebuild=False, retries=AGGREGATION_RETRIES):
+    # A consumer compacting live_rollups mid-run makes the DELETE in
+    # clear_live_rollups fail with a serialization error. Nothing has been
+    # committed at that point, so the run simply starts over on a new snapshot.
+    for attempt in range(retries + 1):
+        try:
+            return aggregate_once(conn, full_rebuild)
+        except psycopg2.errors.SerializationFailure:
+            conn.rollback()
+            if attempt == retries:
+                raise
+            print("🔁 live_rollups changed under the aggregation, retrying...")
+
+
+def aggregate_once(conn, full_rebuild=False):
+    with conn.cursor() as cursor:
+        # One snapshot for the whole run, so the orders aggregated and the live
+        # deltas cleared below are exactly the same set
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        # Pin the upper bound first so rows arriving mid-run are picked up next time
+        cursor.execute("SELECT COALESCE(MAX(ingest_seq), 0) FROM orders")
+        high_seq = cursor.fetchone()[0]
+        low_seq = 0 if full_rebuild else get_watermark(cursor, WATERMARK_NAME)
+
+        if full_rebuild or low_seq == 0:
+            print("📊 Aggregating daily metrics for all historical data...")
+            groups = aggregate_full(cursor)
+            rollups = rollup_full(cursor)
+            refresh_dimensions(cursor, incremental=False)
+            clear_live_rollups(cursor, incremental=False)
+        elif stage_touched_groups(cursor, low_seq, high_seq) == 0:
+            print("📊 No new orders since the last aggregation.")
+            groups = rollups = 0
+        else:
+            print(f"📊 Aggregating daily metrics for orders {low_seq + 1:,} – {high_seq:,} "
+                  f"(re-checking {AGGREGATION_SEQ_OVERLAP:,} below for late commits)...")
+            groups = aggregate_incremental(cursor)
+            rollups = rollup_incremental(cursor)
+            refresh_dimensions(cursor, incremental=True)
+            clear_live_rollups(cursor, incremental=True)
+
+        print(f"🧮 Refreshed {rollups} dashboard rollup rows.")
+        set_watermark(cursor, WATERMARK_NAME, max(high_seq, low_seq))
+    conn.commit()
+    return groups
+
+
+def main():
+    full_rebuild = AGGREGATION_MODE == "full" or "--full" in sys.argv[1:]
+    with db.connection() as conn:
+        groups = run_aggregation(conn, full_rebuild=full_rebuild)
+    print(f"✅ Daily metrics aggregation complete ({groups} groups updated).")
 
-conn.commit()
-cursor.close()
-conn.close()
 
-print("✅ Daily metrics aggregation complete.")
+if __name__ == "__main__":
+    main()
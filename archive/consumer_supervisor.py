@@ -0,0 +1,337 @@
+# consumer_supervisor.py
+# Runs the batched order consumer as N worker processes in one consumer group,
+# so ingest scales with partitions and cores instead of stopping at one.
+# Each worker owns whichever partitions the group assigns it, its own DB
+# connection and its own BatchIngestor; buffered orders are written and their
+# offsets committed before a rebalance hands partitions to another worker.
+# The supervisor restarts workers that die and reports the group's throughput.
+#
+#   python archive/consumer_supervisor.py --workers 4
+#   python archive/consumer_supervisor.py --scale 1,2,4,8 --partitions 8 --messages 200000
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import signal
+import sys
+import time
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+load_dotenv()
+
+import db  # noqa: E402
+import instrumentation  # noqa: E402
+from daily_rollups import DailyRollups  # noqa: E402
+from intraday_reforecast import BandMonitor  # noqa: E402
+from kafka_consumer import (  # noqa: E402
+    BOOTSTRAP_SERVERS, CONSUMER_INTRADAY, CONSUMER_ROLLUPS, GROUP_ID, TOPIC, BatchIngestor, create_consumer,
+)
+
+# --- Configs ---
+SUPERVISOR_WORKERS = int(os.getenv("SUPERVISOR_WORKERS", os.cpu_count() or 1))
+SUPERVISOR_REPORT_SECONDS = float(os.getenv("SUPERVISOR_REPORT_SECONDS", 5))
+SUPERVISOR_RESTART_DELAY_SECONDS = float(os.getenv("SUPERVISOR_RESTART_DELAY_SECONDS", 2))
+SUPERVISOR_SHUTDOWN_SECONDS = float(os.getenv("SUPERVISOR_SHUTDOWN_SECONDS", 30))
+SCALE_MESSAGES = int(os.getenv("SCALE_MESSAGES", 200_000))
+SCALE_TIMEOUT_SECONDS = float(os.getenv("SCALE_TIMEOUT_SECONDS", 600))
+
+
+# --- Worker process ---
+
+def run_worker(worker_id, stats, stop, group_id, start_offsets=None):
+    # Ctrl-C reaches the whole process group; the supervisor decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pool = db.get_pool()
+    conn = pool.getconn()
+    consumer = create_consumer(batch_mode=True, group_id=group_id, subscribe=False)
+    rollups = DailyRollups() if CONSUMER_ROLLUPS else None
+    # Running totals are only complete per region when the producer keys by region
+    monitor = BandMonitor() if CONSUMER_INTRADAY else None
+    ingestor = BatchIngestor(consumer, conn, rollups=rollups, monitor=monitor)
+
+    def on_assign(consumer, partitions):
+        if start_offsets:
+            # Partitions with no committed offset in this group start at the
+            # given offsets rather than at the start of the log
+            committed = {tp.partition: tp.offset for tp in consumer.committed(partitions, timeout=10)}
+            for tp in partitions:
+                if committed.get(tp.partition, -1) < 0:
+                    tp.offset = start_offsets.get(tp.partition, tp.offset)
+            consumer.assign(partitions)
+        if monitor is not None:
+            monitor.stale = True  # reload running totals for the new set of regions
+        stats.put(("assigned", worker_id, sorted(tp.partition for tp in partitions)))
+
+    consumer.subscribe([TOPIC], on_assign=on_assign, on_revoke=ingestor.on_revoke, on_lost=ingestor.on_lost)
+
+    reported = 0
+    started = False
+    try:
+        while not stop.is_set():
+            msgs = consumer.consume(num_messages=ingestor.room(), timeout=min(ingestor.poll_timeout(), 0.5))
+            for msg in msgs:
+                if msg.error():
+                    print(f"❌ Worker {worker_id} consumer error:", msg.error())
+                    continue
+                ingestor.add(msg)
+            if msgs and not started:
+                started = True
+                stats.put(("started", worker_id, time.time()))
+            if ingestor.should_flush():
+                ingestor.flush()
+            # Rows flushed by a rebalance callback are picked up here too
+            if ingestor.flushed_rows > reported:
+                stats.put(("rows", worker_id, ingestor.flushed_rows - reported, time.time()))
+                reported = ingestor.flushed_rows
+            if rollups is not None:
+                rollups.maybe_compact(conn)
+            if monitor is not None and monitor.due():
+                monitor.reforecast(conn)
+    finally:
+        ingestor.flush()
+        if ingestor.flushed_rows > reported:
+            stats.put(("rows", worker_id, ingestor.flushed_rows - reported, time.time()))
+        consumer.close()  # leaves the group so the rest rebalance straight away
+        pool.putconn(conn)
+        db.close_pool()
+
+
+# --- Supervisor ---
+
+class Supervisor:
+    def __init__(self, workers, group_id=GROUP_ID, start_offsets=None):
+        # Spawned rather than forked: Kafka clients do not survive a fork
+        self.ctx = mp.get_context("spawn")
+        self.workers = workers
+        self.group_id = group_id
+        self.start_offsets = start_offsets
+        self.stats = self.ctx.Queue()
+        self.stop = self.ctx.Event()
+        self.processes = {}
+        self.rows = {worker_id: 0 for worker_id in range(workers)}
+        self.total_rows = 0
+        self.first_started_at = None
+        self.last_rows_at = None
+        self.window_start = time.monotonic()
+        self.window_rows = 0
+
+    def start_worker(self, worker_id):
+        process = self.ctx.Process(
+            target=run_worker,
+            args=(worker_id, self.stats, self.stop, self.group_id, self.start_offsets),
+            name=f"consumer-worker-{worker_id}",
+        )
+        process.start()
+        self.processes[worker_id] = process
+
+    def start(self):
+        print(f"👷 Starting {self.workers} consumer workers in group '{self.group_id}' on '{TOPIC}'...")
+        for worker_id in range(self.workers):
+            self.start_worker(worker_id)
+
+    def drain(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                event = self.stats.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return
+            kind, worker_id = event[0], event[1]
+            if kind == "rows":
+                rows, at = event[2], event[3]
+                self.rows[worker_id] += rows
+                self.total_rows += rows
+                self.window_rows += rows
+                self.last_rows_at = at if self.last_rows_at is None else max(self.last_rows_at, at)
+                instrumentation.inc("consumer_group_rows_total", rows, worker=worker_id)
+            elif kind == "started":
+                at = event[2]
+                self.first_started_at = at if self.first_started_at is None else min(self.first_started_at, at)
+            elif kind == "assigned":
+                partitions = event[2]
+                print(f"🧩 Worker {worker_id} assigned partitions {partitions or '(none)'}")
+                instrumentation.set_gauge("consumer_group_worker_partitions", len(partitions), worker=worker_id)
+
+    def check_workers(self):
+        for worker_id, process in list(self.processes.items()):
+            if process.is_alive() or self.stop.is_set():
+                continue
+            print(f"💥 Worker {worker_id} exited with code {process.exitcode}, restarting")
+            instrumentation.inc("consumer_group_worker_restarts_total", worker=worker_id)
+            time.sleep(SUPERVISOR_RESTART_DELAY_SECONDS)
+            self.start_worker(worker_id)
+
+    def report(self):
+        now = time.monotonic()
+        elapsed = now - self.window_start
+        rate = self.window_rows / elapsed if elapsed > 0 else 0.0
+        instrumentation.set_gauge("consumer_group_rows_per_second", rate)
+        instrumentation.set_gauge("consumer_group_workers", sum(p.is_alive() for p in self.processes.values()))
+        per_worker = " ".join(f"w{worker_id}={rows:,}" for worker_id, rows in sorted(self.rows.items()))
+        print(f"📊 {rate:,.0f} rows/sec across {self.workers} workers | total={self.total_rows:,} | {per_worker}")
+        self.window_start = now
+        self.window_rows = 0
+
+    def run(self, until_rows=None, timeout=None):
+        started = time.monotonic()
+        next_report = started + SUPERVISOR_REPORT_SECONDS
+        while not self.stop.is_set():
+            self.drain(0.5)
+            if until_rows is not None and self.total_rows >= until_rows:
+                return True
+            if timeout is not None and time.monotonic() - started >= timeout:
+                return False
+            self.check_workers()
+            if time.monotonic() >= next_report:
+                self.report()
+                next_report = time.monotonic() + SUPERVISOR_REPORT_SECONDS
+        return False
+
+    def shutdown(self):
+        self.stop.set()
+        deadline = time.monotonic() + SUPERVISOR_SHUTDOWN_SECONDS
+        for worker_id, process in self.processes.items():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                print(f"⚠️ Worker {worker_id} did not stop in time, terminating")
+                process.terminate()
+                process.join()
+        self.drain(0)
+
+
+# --- Scaling run ---
+
+def ensure_topic(partitions):
+    # Creates the topic, or adds partitions to it, so it has at least this many
+    from confluent_kafka.admin import AdminClient, NewPartitions, NewTopic
+
+    admin = AdminClient({"bootstrap.servers": BOOTSTRAP_SERVERS})
+    topic = admin.list_topics(timeout=10).topics.get(TOPIC)
+    if topic is None or topic.error is not None:
+        futures = admin.create_topics([NewTopic(TOPIC, num_partitions=partitions, replication_factor=1)])
+    elif len(topic.partitions) < partitions:
+        futures = admin.create_partitions([NewPartitions(TOPIC, partitions)])
+    else:
+        return len(topic.partitions)
+    for future in futures.values():
+        future.result()
+    print(f"🧱 Topic '{TOPIC}' now has {partitions} partitions")
+    return partitions
+
+
+def high_watermarks(partitions):
+    from confluent_kafka import TopicPartition
+
+    consumer = create_consumer(group_id=f"{GROUP_ID}-watermarks", subscribe=False)
+    try:
+        return {
+            partition: consumer.get_watermark_offsets(TopicPartition(TOPIC, partition), timeout=10)[1]
+            for partition in range(partitions)
+        }
+    finally:
+        consumer.close()
+
+
+def produce_messages(n):
+    from kafka_producer import CODEC, HEADERS, KEY_COLUMNS, PRODUCER_KEY, create_producer
+    from simulate_orders import generate_keyed_payloads
+
+    producer = create_producer(load_mode=True)
+    produced = 0
+    while produced < n:
+        for key, payload in generate_keyed_payloads(min(10_000, n - produced), KEY_COLUMNS[PRODUCER_KEY], CODEC):
+            while True:
+                try:
+                    producer.produce(TOPIC, payload, key=key, headers=HEADERS)
+                    break
+                except BufferError:
+                    producer.poll(0.05)
+            produced += 1
+        producer.poll(0)
+    producer.flush(60)
+
+
+def run_scaling(worker_counts, partitions, messages):
+    # For each worker count: produce a fresh set of orders, then time a new
+    # consumer group from its first consumed message until all of them are written
+    partitions = ensure_topic(partitions)
+    results = []
+    for workers in worker_counts:
+        before = high_watermarks(partitions)
+        produce_messages(messages)
+        after = high_watermarks(partitions)
+        active = sum(after[partition] > before[partition] for partition in after)
+        if active < workers:
+            print(
+                f"⚠️ Only {active} partitions received orders, so {workers} workers cannot all be busy; "
+                "add partitions or produce with PRODUCER_KEY=order"
+            )
+
+        supervisor = Supervisor(workers, group_id=f"{GROUP_ID}-scale-{workers}-{int(time.time())}", start_offsets=before)
+        supervisor.start()
+        try:
+            finished = supervisor.run(until_rows=messages, timeout=SCALE_TIMEOUT_SECONDS)
+        finally:
+            supervisor.shutdown()
+        if not finished or supervisor.first_started_at is None:
+            print(f"❌ {workers} workers did not ingest {messages:,} orders within {SCALE_TIMEOUT_SECONDS:.0f}s")
+            continue
+        seconds = supervisor.last_rows_at - supervisor.first_started_at
+        results.append({
+            "workers": workers,
+            "active_partitions": active,
+            "rows": supervisor.total_rows,
+            "seconds": seconds,
+            "rows_per_second": supervisor.total_rows / seconds if seconds > 0 else float("inf"),
+        })
+        print(f"⏱️  {workers} workers: {supervisor.total_rows:,} rows in {seconds:.2f}s")
+
+    if not results:
+        return results
+    per_worker = results[0]["rows_per_second"] / results[0]["workers"]
+    print(f"\n📈 Ingest scaling on '{TOPIC}' ({partitions} partitions, {messages:,} orders per run):")
+    print(f"{'workers':>8} {'partitions':>10} {'rows/sec':>12} {'speedup':>8} {'efficiency':>10}")
+    for result in results:
+        speedup = result["rows_per_second"] / per_worker
+        print(
+            f"{result['workers']:>8} {result['active_partitions']:>10} {result['rows_per_second']:>12,.0f} "
+            f"{speedup:>7.2f}x {speedup / result['workers']:>9.0%}"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process Kafka consumer group for orders")
+    parser.add_argument("--workers", type=int, default=SUPERVISOR_WORKERS)
+    parser.add_argument("--partitions", type=int, default=0, help="make sure the topic has at least this many partitions")
+    parser.add_argument("--scale", help="comma-separated worker counts to benchmark, e.g. 1,2,4,8")
+    parser.add_argument("--messages", type=int, default=SCALE_MESSAGES, help="orders produced per scaling run")
+    args = parser.parse_args()
+
+    if args.scale:
+        worker_counts = [int(n) for n in args.scale.split(",") if n.strip()]
+        run_scaling(worker_counts, max(args.partitions, max(worker_counts)), args.messages)
+        instrumentation.export()
+        return
+
+    if args.partitions:
+        ensure_topic(args.partitions)
+    supervisor = Supervisor(args.workers)
+    signal.signal(signal.SIGTERM, lambda signum, frame: supervisor.stop.set())
+    instrumentation.serve()
+    supervisor.start()
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        print("🛑 Stopping consumer workers...")
+    finally:
+        supervisor.shutdown()
+        supervisor.report()
+        instrumentation.export()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,242 @@
 # kafka_consumer.py
-import json
 import os
+import time
+import pandas as pd
 import psycopg2
 from dotenv import load_dotenv
 from confluent_kafka import Consumer
+from daily_rollups import DailyRollups
+import db
+import instrumentation
+from intraday_reforecast import BandMonitor
+from order_generator import ORDER_COLUMNS
+import order_codec
 
 load_dotenv()
 
-# Load DB credentials from .env
-conn = psycopg2.connect(
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT")
-)
-cursor = conn.cursor()
-
-# Kafka consumer config
-consumer = Consumer({
-    'bootstrap.servers': 'localhost:9092',
-    'group.id': 'order-group',
-    'auto.offset.reset': 'earliest'
-})
-
-consumer.subscribe(['orders'])
-
-def insert_order(order):
-    cursor.execute("""
-        INSERT INTO orders (
-            order_id, timestamp, product_id, user_id, region, quantity,
-            unit_price, total_price, device_type, promo_applied
-        ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-        ON CONFLICT (order_id) DO NOTHING
-    """, (
-        order["order_id"],
-        order["timestamp"],
-        order["product_id"],
-        order["user_id"],
-        order["region"],
-        order["quantity"],
-        order["unit_price"],
-        order["total_price"],
-        order["device_type"],
-        order["promo_applied"]
-    ))
+# --- Configs ---
+BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+GROUP_ID = os.getenv("CONSUMER_GROUP_ID", "order-group")
+TOPIC = "orders"
+# CONSUMER_MODE=batch turns on micro-batched ingest; "single" keeps one insert per message
+CONSUMER_MODE = os.getenv("CONSUMER_MODE", "single")
+BATCH_SIZE = int(os.getenv("CONSUMER_BATCH_SIZE", 500))
+LINGER_MS = int(os.getenv("CONSUMER_LINGER_MS", 200))
+MAX_INFLIGHT_BYTES = int(os.getenv("CONSUMER_MAX_INFLIGHT_BYTES", 8 * 1024 * 1024))
+# CONSUMER_ROLLUPS=1 records live deltas in live_rollups between cron aggregation
+# runs, which keeps the dashboard's history current for today
+CONSUMER_ROLLUPS = os.getenv("CONSUMER_ROLLUPS", "1") == "1"
+# CONSUMER_INTRADAY=1 refits series whose same-day totals leave today's forecast band
+CONSUMER_INTRADAY = os.getenv("CONSUMER_INTRADAY", "0") == "1"
+LAG_REPORT_SECONDS = float(os.getenv("CONSUMER_LAG_REPORT_SECONDS", 10))
+
+
+def create_consumer(batch_mode=False, group_id=GROUP_ID, subscribe=True):
+    # Kafka consumer config
+    config = {
+        'bootstrap.servers': BOOTSTRAP_SERVERS,
+        'group.id': group_id,
+        'auto.offset.reset': 'earliest'
+    }
+    if batch_mode:
+        # Offsets are committed by hand once the DB commit for a batch succeeds
+        config['enable.auto.commit'] = False
+    consumer = Consumer(config)
+    if subscribe:
+        consumer.subscribe([TOPIC])
+    return consumer
+
+
+def insert_order(conn, order, rollups=None):
+    # Returns the (timestamp, region, total_price, category, user_segment) of the row if it was new
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO orders ({", ".join(ORDER_COLUMNS)})
+            VALUES ({", ".join(["%s"] * len(ORDER_COLUMNS))})
+            ON CONFLICT (order_id, timestamp) DO NOTHING
+            RETURNING timestamp, region, total_price, category, user_segment
+        """, tuple(order[col] for col in ORDER_COLUMNS))
+        inserted = cursor.fetchone()
+        if inserted and rollups is not None:
+            rollups.write(cursor, [inserted])
     conn.commit()
+    return inserted
+
+
+class LagReporter:
+    # Periodically records how far each assigned partition is behind its high watermark
+    def __init__(self, consumer, interval=LAG_REPORT_SECONDS):
+        self.consumer = consumer
+        self.interval = interval
+        self.next_report = time.monotonic()
+
+    def maybe_report(self):
+        if time.monotonic() < self.next_report:
+            return
+        self.next_report = time.monotonic() + self.interval
+        try:
+            total = 0
+            for tp in self.consumer.position(self.consumer.assignment()):
+                low, high = self.consumer.get_watermark_offsets(tp, timeout=1.0)
+                lag = high - tp.offset if tp.offset >= 0 else high - low
+                instrumentation.set_gauge("consumer_lag_messages", lag, topic=tp.topic, partition=tp.partition)
+                total += lag
+            instrumentation.set_gauge("consumer_lag_total", total)
+        except Exception as e:
+            print("⚠️ Could not read consumer lag:", e)
+
+
+class BatchIngestor:
+    # Buffers raw payloads until the size, linger or memory limit is hit, then
+    # decodes them into columns, COPYs them into a staging table, merges into
+    # orders and commits the Kafka offsets afterwards.
+
+    def __init__(self, consumer, conn, batch_size=BATCH_SIZE, linger_ms=LINGER_MS,
+                 max_inflight_bytes=MAX_INFLIGHT_BYTES, rollups=None, monitor=None):
+        self.consumer = consumer
+        self.conn = conn
+        self.rollups = rollups
+        self.monitor = monitor
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self.max_inflight_bytes = max_inflight_bytes
+        self.payloads = []
+        self.inflight_bytes = 0
+        self.first_buffered_at = None
+        self.flushed_rows = 0
+
+    def room(self):
+        return max(self.batch_size - len(self.payloads), 1)
+
+    def poll_timeout(self):
+        if self.first_buffered_at is None:
+            return 1.0
+        return max(self.linger - (time.monotonic() - self.first_buffered_at), 0)
+
+    def add(self, msg):
+        if self.first_buffered_at is None:
+            self.first_buffered_at = time.monotonic()
+        value = msg.value()
+        self.payloads.append((order_codec.codec_of(msg), value))
+        self.inflight_bytes += len(value)
+
+    def should_flush(self):
+        if not self.payloads:
+            return False
+        return (
+            len(self.payloads) >= self.batch_size
+            or self.inflight_bytes >= self.max_inflight_bytes
+            or time.monotonic() - self.first_buffered_at >= self.linger
+        )
+
+    def _decode(self):
+        # A message the codec chokes on must not stall its partition forever:
+        # fall back to one message at a time and drop the ones that still fail,
+        # so their offsets are committed with the rest of the batch
+        try:
+            return order_codec.decode_batch(self.payloads)
+        except Exception as e:
+            print(f"⚠️ Batch decode failed ({e}), decoding message by message")
+        frames = []
+        for payload in self.payloads:
+            try:
+                frames.append(order_codec.decode_batch([payload]))
+            except Exception as e:
+                print("⚠️ Skipping undecodable message:", e)
+        frames = [frame for frame in frames if not frame.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=ORDER_COLUMNS)
+
+    def _write_frame(self, orders):
+        # Only rows that were actually inserted come back, so replays are not double
+        # counted; their live deltas commit (or roll back) together with them
+        with self.conn.cursor() as cursor:
+            inserted = db.merge_frame(
+                cursor, "orders", orders, "(order_id, timestamp)",
+                returning="timestamp, region, total_price, category, user_segment", columns=ORDER_COLUMNS,
+            )
+            if self.rollups is not None:
+                self.rollups.write(cursor, inserted)
+            return inserted
 
-print("📥 Kafka consumer started...")
+    def _write_row_by_row(self, orders):
+        # A bad payload should not take the whole batch down with it
+        inserted = []
+        for i in range(len(orders)):
+            try:
+                inserted.extend(self._write_frame(orders.iloc[i:i + 1]))
+                self.conn.commit()
+            except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                self.conn.rollback()
+                print(f"⚠️ Failed to insert order {orders['order_id'].iloc[i]}: {e}")
+        return inserted
 
-try:
+    def flush(self):
+        if not self.payloads:
+            return 0
+
+        start = time.perf_counter()
+        orders = self._decode()
+        try:
+            inserted = self._write_frame(orders) if not orders.empty else []
+            self.conn.commit()
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            self.conn.rollback()
+            print(f"⚠️ Batch insert failed ({e}), retrying row by row")
+            inserted = self._write_row_by_row(orders)
+        except Exception:
+            # Offsets stay uncommitted so the batch is redelivered after a restart
+            self.conn.rollback()
+            raise
+
+        self.consumer.commit(asynchronous=False)
+        if self.monitor is not None:
+            self.monitor.add_rows(inserted)
+
+        written = len(orders)
+        elapsed = time.perf_counter() - start
+        rate = written / elapsed if elapsed > 0 else float("inf")
+        instrumentation.inc("consumer_rows_total", written)
+        instrumentation.inc("consumer_rows_inserted_total", len(inserted))
+        instrumentation.observe("consumer_flush_seconds", elapsed)
+        instrumentation.set_gauge("consumer_rows_per_second", rate)
+        print(
+            f"⬇️  Inserted batch of {written} orders ({len(inserted)} new) "
+            f"in {elapsed * 1000:.1f} ms ({rate:,.0f} rows/sec)"
+        )
+
+        self.payloads = []
+        self.inflight_bytes = 0
+        self.first_buffered_at = None
+        self.flushed_rows += written
+        return written
+
+    # Rebalance callbacks, for consumers that share the group with other workers
+
+    def on_revoke(self, consumer, partitions):
+        # Write and commit what was read from these partitions before another
+        # worker takes them over, so it starts exactly where this one stopped
+        if self.payloads:
+            print(f"🔀 Flushing {len(self.payloads)} buffered orders before giving up {len(partitions)} partitions")
+        self.flush()
+
+    def on_lost(self, consumer, partitions):
+        # The partitions already belong to someone else, so offsets can no longer
+        # be committed; the new owner rereads the buffered orders
+        print(f"⚠️ Lost {len(partitions)} partitions, dropping {len(self.payloads)} buffered orders")
+        self.payloads = []
+        self.inflight_bytes = 0
+        self.first_buffered_at = None
+
+
+def run_single(consumer, conn, rollups=None, monitor=None):
+    lag = LagReporter(consumer)
     while True:
+        lag.maybe_report()
+        if rollups is not None:
+            rollups.maybe_compact(conn)
+        if monitor is not None and monitor.due():
+            monitor.reforecast(conn)
+
         msg = consumer.poll(1.0)
         if msg is None:
             continue
@@ -59,16 +245,69 @@ try:
             continue
 
         try:
-            order = json.loads(msg.value().decode('utf-8'))
-            insert_order(order)
+            order = order_codec.decode_order(order_codec.codec_of(msg), msg.value())
+            with instrumentation.timer("consumer_insert_seconds"):
+                inserted = insert_order(conn, order, rollups=rollups)
+            instrumentation.inc("consumer_rows_total")
+            if inserted and monitor is not None:
+                monitor.add(*inserted[:3])
             print(f"⬇️  Inserted order {order['order_id']}")
         except Exception as e:
+            conn.rollback()
             print("⚠️ Failed to insert order:", e)
 
-except KeyboardInterrupt:
-    print("🛑 Consumer stopped.")
 
-finally:
-    consumer.close()
-    cursor.close()
-    conn.close()
+def run_batched(consumer, conn, rollups=None, monitor=None):
+    ingestor = BatchIngestor(consumer, conn, rollups=rollups, monitor=monitor)
+    lag = LagReporter(consumer)
+    try:
+        while True:
+            lag.maybe_report()
+            msgs = consumer.consume(num_messages=ingestor.room(), timeout=ingestor.poll_timeout())
+            for msg in msgs:
+                if msg.error():
+                    print("❌ Consumer error:", msg.error())
+                    continue
+                ingestor.add(msg)
+            if ingestor.should_flush():
+                ingestor.flush()
+            if rollups is not None:
+                rollups.maybe_compact(conn)
+            if monitor is not None and monitor.due():
+                monitor.reforecast(conn)
+    finally:
+        ingestor.flush()
+
+
+def main():
+    batch_mode = CONSUMER_MODE == "batch"
+    pool = db.get_pool()
+    conn = pool.getconn()
+    consumer = create_consumer(batch_mode=batch_mode)
+    rollups = DailyRollups() if CONSUMER_ROLLUPS else None
+    monitor = BandMonitor() if CONSUMER_INTRADAY else None
+    instrumentation.serve()
+
+    if batch_mode:
+        print(f"📥 Kafka consumer started in batch mode (batch={BATCH_SIZE}, linger={LINGER_MS}ms)...")
+    else:
+        print("📥 Kafka consumer started...")
+
+    try:
+        if batch_mode:
+            run_batched(consumer, conn, rollups=rollups, monitor=monitor)
+        else:
+            run_single(consumer, conn, rollups=rollups, monitor=monitor)
+
+    except KeyboardInterrupt:
+        print("🛑 Consumer stopped.")
+
+    finally:
+        consumer.close()
+        pool.putconn(conn)
+        db.close_pool()
+        instrumentation.export()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,57 @@
 # kafka_producer.py
-import json
+import os
 import time
 from confluent_kafka import Producer
-from simulate_orders import generate_order
+import inprocess_kafka
+import order_codec
+from simulate_orders import generate_keyed_payloads, generate_order
 
-producer = Producer({'bootstrap.servers': 'localhost:9092'})
+# --- Configs ---
+# PRODUCER_MODE=load turns on the high-rate load generator; "trickle" sends one order every 2 seconds
+PRODUCER_MODE = os.getenv("PRODUCER_MODE", "trickle")
+# KAFKA_BACKEND=inprocess swaps the broker for an in-process stand-in so load tests run offline
+KAFKA_BACKEND = os.getenv("KAFKA_BACKEND", "kafka")
+BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 TOPIC = "orders"
+# Messages are keyed by region so each region's orders stay in order on one
+# partition. With only a handful of regions that caps how many partitions carry
+# traffic; PRODUCER_KEY=order spreads orders evenly (no cross-order ordering)
+# and "none" leaves them unkeyed.
+PRODUCER_KEY = os.getenv("PRODUCER_KEY", "region")
+KEY_COLUMNS = {"region": "region", "order": "order_id", "none": None}
+# ORDER_CODEC=bin1 sends compact binary records instead of JSON
+CODEC = order_codec.ORDER_CODEC
+HEADERS = order_codec.headers_for(CODEC)
+
+LOADGEN_EVENTS_PER_SEC = float(os.getenv("LOADGEN_EVENTS_PER_SEC", 5000))
+LOADGEN_DURATION_SECONDS = float(os.getenv("LOADGEN_DURATION_SECONDS", 60))  # 0 = until stopped
+LOADGEN_BATCH_SIZE = int(os.getenv("LOADGEN_BATCH_SIZE", 500))
+LOADGEN_REPORT_SECONDS = float(os.getenv("LOADGEN_REPORT_SECONDS", 5))
+LOADGEN_MAX_LATENCY_SAMPLES = 100_000
+
+PRODUCER_LINGER_MS = int(os.getenv("PRODUCER_LINGER_MS", 5))
+PRODUCER_BATCH_SIZE = int(os.getenv("PRODUCER_BATCH_SIZE", 65536))
+PRODUCER_COMPRESSION = os.getenv("PRODUCER_COMPRESSION", "lz4")
+
+
+def create_producer(load_mode=False):
+    config = {'bootstrap.servers': BOOTSTRAP_SERVERS}
+    if load_mode:
+        config.update({
+            'linger.ms': PRODUCER_LINGER_MS,
+            'batch.size': PRODUCER_BATCH_SIZE,
+            'compression.type': PRODUCER_COMPRESSION,
+            'queue.buffering.max.messages': 1_000_000,
+        })
+    if KAFKA_BACKEND == "inprocess":
+        return inprocess_kafka.Producer(config)
+    return Producer(config)
+
+
+def message_key(order):
+    column = KEY_COLUMNS[PRODUCER_KEY]
+    return order[column] if column else None
+
 
 def delivery_report(err, msg):
     if err is not None:
@@ -13,9 +59,113 @@ def delivery_report(err, msg):
     else:
         print(f'✅ Order delivered to {msg.topic()} [{msg.partition()}]')
 
-if __name__ == "__main__":
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(int(q / 100 * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class DeliveryStats:
+    # Aggregates delivery reports into periodic throughput/latency summaries
+    # instead of printing every message.
+
+    def __init__(self):
+        self.delivered = 0
+        self.failed = 0
+        self.bytes = 0
+        self.latencies = []
+        self.window_start = time.monotonic()
+        self.window_delivered = 0
+
+    def callback(self, err, msg):
+        if err is not None:
+            self.failed += 1
+            return
+        self.delivered += 1
+        self.window_delivered += 1
+        self.bytes += len(msg.value())
+        if len(self.latencies) < LOADGEN_MAX_LATENCY_SAMPLES:
+            self.latencies.append(msg.latency())
+
+    def report(self, sent, behind):
+        now = time.monotonic()
+        elapsed = now - self.window_start
+        latencies = sorted(self.latencies)
+        print(
+            f"📤 sent={sent:,} delivered={self.delivered:,} failed={self.failed:,} | "
+            f"{self.window_delivered / elapsed:,.0f} msg/s | "
+            f"latency p50={percentile(latencies, 50) * 1000:.1f}ms "
+            f"p95={percentile(latencies, 95) * 1000:.1f}ms "
+            f"p99={percentile(latencies, 99) * 1000:.1f}ms | "
+            f"behind schedule={behind:,}"
+        )
+        self.latencies = []
+        self.window_start = now
+        self.window_delivered = 0
+
+
+def run_trickle(producer):
     while True:
         order = generate_order()
-        producer.produce(TOPIC, json.dumps(order).encode('utf-8'), callback=delivery_report)
+        producer.produce(
+            TOPIC, order_codec.encode_order(order, CODEC), key=message_key(order),
+            headers=HEADERS, callback=delivery_report,
+        )
         producer.poll(0)
         time.sleep(2)  # simulate 1 order every 2 seconds
+
+
+def run_load(producer):
+    # Open-loop pacing: the number of events due is derived from the wall clock,
+    # not from when the previous send finished, so a slow broker shows up as
+    # latency and backlog instead of silently lowering the offered rate.
+    stats = DeliveryStats()
+    sent = 0
+    start = time.monotonic()
+    next_report = start + LOADGEN_REPORT_SECONDS
+
+    print(f"🚀 Load generator targeting {LOADGEN_EVENTS_PER_SEC:,.0f} events/sec on '{TOPIC}' ({CODEC})...")
+    try:
+        while True:
+            now = time.monotonic()
+            if LOADGEN_DURATION_SECONDS and now - start >= LOADGEN_DURATION_SECONDS:
+                break
+
+            due = int((now - start) * LOADGEN_EVENTS_PER_SEC) - sent
+            if due <= 0:
+                producer.poll(min(1 / LOADGEN_EVENTS_PER_SEC, 0.01))
+            else:
+                for key, payload in generate_keyed_payloads(min(due, LOADGEN_BATCH_SIZE), KEY_COLUMNS[PRODUCER_KEY], CODEC):
+                    while True:
+                        try:
+                            producer.produce(TOPIC, payload, key=key, headers=HEADERS, callback=stats.callback)
+                            break
+                        except BufferError:
+                            # Local queue is full: serve delivery reports and retry
+                            producer.poll(0.05)
+                    sent += 1
+                producer.poll(0)
+
+            if now >= next_report:
+                behind = int((now - start) * LOADGEN_EVENTS_PER_SEC) - sent
+                stats.report(sent, max(behind, 0))
+                next_report = now + LOADGEN_REPORT_SECONDS
+    finally:
+        producer.flush(30)
+        elapsed = time.monotonic() - start
+        print(f"🏁 Sent {sent:,} events in {elapsed:.1f}s ({sent / elapsed:,.0f} events/sec offered)")
+        stats.report(sent, 0)
+
+
+if __name__ == "__main__":
+    load_mode = PRODUCER_MODE == "load"
+    producer = create_producer(load_mode=load_mode)
+    try:
+        if load_mode:
+            run_load(producer)
+        else:
+            run_trickle(producer)
+    except KeyboardInterrupt:
+        print("🛑 Producer stopped.")
@@ -1,12 +1,207 @@
-import subprocess
+# run_pipeline.py
+# Runs the daily pipeline in one process: stages are imported as functions and
+# share a connection pool, so pandas/Prophet are imported and .env is loaded once.
+# A stage is skipped when its input fingerprint matches its last successful run,
+# and a failed stage stops everything downstream of it.
+import os
+import sys
+import time
+from datetime import datetime
+from dotenv import load_dotenv
 
-print("📦 Generating today's orders")
-subprocess.run(["python", "simulate_daily_orders.py"])
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
 
-print("📊 Aggregating daily metrics")
-subprocess.run(["python", "aggregate_daily_metrics.py"])
+load_dotenv()
 
-print("🔮 Forecasting next 7 days")
-subprocess.run(["python", "forecast_and_store.py"])
+import db  # noqa: E402
+import instrumentation  # noqa: E402
+from partition_maintenance import run_maintenance  # noqa: E402
+from simulate_daily_orders import simulate_day  # noqa: E402
+from aggregate_daily_metrics import AGGREGATION_SEQ_OVERLAP, WATERMARK_NAME, run_aggregation  # noqa: E402
+from forecast_and_store import forecast_and_email  # noqa: E402
+from snapshot_store import FULL_TABLES, PARTITIONED_TABLES, export_snapshots  # noqa: E402
 
-print("✅ Daily pipeline complete.")
+# --- Configs ---
+# PIPELINE_SNAPSHOTS=1 refreshes the Parquet snapshots: the data tables right
+# after aggregation (so DATA_SOURCE=snapshot forecasts see today's metrics),
+# then forecast_metrics once the new forecasts are stored
+PIPELINE_SNAPSHOTS = os.getenv("PIPELINE_SNAPSHOTS", "0") == "1"
+
+
+def query_fingerprint(conn, sql):
+    with conn.cursor() as cursor:
+        cursor.execute(sql)
+        row = cursor.fetchone()
+    conn.commit()
+    return "|".join(str(value) for value in row)
+
+
+# Input fingerprints: a stage whose fingerprint is unchanged since its last
+# successful run has nothing new to do.
+def simulate_fingerprint(conn):
+    return datetime.utcnow().date().isoformat()
+
+
+def aggregate_fingerprint(conn):
+    # The newest ingest_seq, plus a count of the rows in the overlap window below
+    # it, so orders that commit late under the newest one still change the
+    # fingerprint. Neither depends on the watermark the stage itself moves.
+    return query_fingerprint(conn, f"""
+        WITH newest AS (SELECT COALESCE(MAX(ingest_seq), 0) AS seq FROM orders)
+        SELECT newest.seq, (
+            SELECT COUNT(*) FROM orders WHERE ingest_seq > newest.seq - {AGGREGATION_SEQ_OVERLAP}
+        )
+        FROM newest
+    """)
+
+
+def snapshot_fingerprint(conn):
+    return query_fingerprint(conn, f"""
+        SELECT (SELECT COALESCE(MAX(ingest_seq), 0) FROM orders),
+               (SELECT COALESCE(MAX(watermark), 0) FROM pipeline_state WHERE name = '{WATERMARK_NAME}')
+    """)
+
+
+def forecast_snapshot_fingerprint(conn):
+    return query_fingerprint(conn, "SELECT MAX(created_at) FROM forecast_metrics")
+
+
+def forecast_fingerprint(conn):
+    return query_fingerprint(conn, """
+        SELECT COUNT(*), MAX(date), SUM(total_orders), SUM(total_revenue)
+        FROM daily_metrics
+    """)
+
+
+SNAPSHOT_DATA_TABLES = list(PARTITIONED_TABLES) + [table for table in FULL_TABLES if table != "forecast_metrics"]
+
+STAGES = [
+    {
+        "name": "partition_maintenance",
+        "label": "🧱 Maintaining orders partitions",
+        "run": run_maintenance,
+        "fingerprint": simulate_fingerprint,
+        "depends_on": [],
+    },
+    {
+        "name": "simulate_daily_orders",
+        "label": "📦 Generating today's orders",
+        "run": lambda conn: simulate_day(conn, datetime.utcnow().date()),
+        "fingerprint": simulate_fingerprint,
+        "depends_on": ["partition_maintenance"],
+    },
+    {
+        "name": "aggregate_daily_metrics",
+        "label": "📊 Aggregating daily metrics",
+        "run": run_aggregation,
+        "fingerprint": aggregate_fingerprint,
+        "depends_on": ["simulate_daily_orders"],
+    },
+    *([{
+        "name": "export_snapshots",
+        "label": "🗂️  Refreshing Parquet snapshots",
+        "run": lambda conn: export_snapshots(conn, SNAPSHOT_DATA_TABLES),
+        "fingerprint": snapshot_fingerprint,
+        "depends_on": ["aggregate_daily_metrics"],
+    }] if PIPELINE_SNAPSHOTS else []),
+    {
+        "name": "forecast_and_store",
+        "label": "🔮 Forecasting next 7 days",
+        "run": forecast_and_email,
+        "fingerprint": forecast_fingerprint,
+        "depends_on": ["aggregate_daily_metrics", *(["export_snapshots"] if PIPELINE_SNAPSHOTS else [])],
+    },
+    *([{
+        "name": "export_forecast_snapshot",
+        "label": "🗂️  Refreshing the forecast snapshot",
+        "run": lambda conn: export_snapshots(conn, ["forecast_metrics"]),
+        "fingerprint": forecast_snapshot_fingerprint,
+        "depends_on": ["forecast_and_store"],
+    }] if PIPELINE_SNAPSHOTS else []),
+]
+
+
+def last_success_fingerprint(conn, stage):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT input_fingerprint FROM pipeline_runs
+            WHERE stage = %s AND status = 'success'
+            ORDER BY finished_at DESC
+            LIMIT 1
+        """, (stage,))
+        row = cursor.fetchone()
+    conn.commit()
+    return row[0] if row else None
+
+
+def record_run(conn, stage, status, started_at, wall_seconds, rows, fingerprint, error=None):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO pipeline_runs (
+                stage, status, started_at, finished_at, wall_seconds, rows, input_fingerprint, error
+            ) VALUES (%s, %s, %s, NOW(), %s, %s, %s, %s)
+        """, (stage, status, started_at, round(wall_seconds, 3), rows, fingerprint, error))
+    conn.commit()
+
+
+def run_pipeline(pool, force=False):
+    statuses = {}
+    for stage in STAGES:
+        name = stage["name"]
+        blocked = [dep for dep in stage["depends_on"] if statuses.get(dep) in ("failed", "blocked")]
+        if blocked:
+            print(f"⛔ Skipping {name}: upstream {', '.join(blocked)} failed")
+            statuses[name] = "blocked"
+            continue
+
+        print(stage["label"])
+        conn = pool.getconn()
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        fingerprint = None
+        try:
+            fingerprint = stage["fingerprint"](conn)
+            if not force and fingerprint == last_success_fingerprint(conn, name):
+                print(f"⏭️  {name}: inputs unchanged since the last successful run, skipping")
+                statuses[name] = "skipped"
+                record_run(conn, name, "skipped", started_at, time.perf_counter() - start, 0, fingerprint)
+                continue
+
+            with instrumentation.profile_stage(name):
+                rows = stage["run"](conn)
+            wall_seconds = time.perf_counter() - start
+            instrumentation.observe("pipeline_stage_seconds", wall_seconds, stage=name)
+            instrumentation.set_gauge("pipeline_stage_rows", rows or 0, stage=name)
+            print(f"✅ {name} finished in {wall_seconds:.2f}s ({rows} rows)")
+            statuses[name] = "success"
+            record_run(conn, name, "success", started_at, wall_seconds, rows, fingerprint)
+        except Exception as e:
+            conn.rollback()
+            wall_seconds = time.perf_counter() - start
+            print(f"❌ {name} failed after {wall_seconds:.2f}s: {e}")
+            statuses[name] = "failed"
+            instrumentation.observe("pipeline_stage_seconds", wall_seconds, stage=name)
+            record_run(conn, name, "failed", started_at, wall_seconds, None, fingerprint, str(e))
+        finally:
+            instrumentation.inc("pipeline_stage_runs_total", stage=name, status=statuses[name])
+            pool.putconn(conn)
+    return statuses
+
+
+def main():
+    force = "--force" in sys.argv[1:]
+    try:
+        statuses = run_pipeline(db.get_pool(), force=force)
+    finally:
+        db.close_pool()
+        instrumentation.export()
+
+    if "failed" in statuses.values():
+        print("❌ Daily pipeline finished with failures.")
+        sys.exit(1)
+    print("✅ Daily pipeline complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,81 +1,121 @@
 # backfill_orders.py (supercharged version)
-from faker import Faker
-import psycopg2
-import uuid
-import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
 import time
+import db
+import instrumentation
+import partition_maintenance
+from order_generator import ORDER_COLUMNS, generate_orders, make_rng
 
 load_dotenv()
-fake = Faker()
-
-conn = psycopg2.connect(
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT")
-)
-cursor = conn.cursor()
 
 # --- Configs ---
-REGIONS = ['Northeast', 'Midwest', 'South', 'West']
-PRODUCT_IDS = ['SKU-001', 'SKU-002', 'SKU-003']
-CATEGORIES = ['Electronics', 'Clothing', 'Books', 'Home Goods', 'Toys']
-DEVICE_TYPES = ['mobile', 'desktop', 'tablet']
-USER_SEGMENTS = ['new_user', 'returning', 'VIP', 'guest']
-
-NUM_DAYS = 90
-ORDERS_PER_DAY = 400  # Final count: NUM_DAYS * ORDERS_PER_DAY
-
-print(f"📦 Starting backfill of {NUM_DAYS * ORDERS_PER_DAY:,} orders...")
-start_time = time.time()
-
-for day_offset in range(NUM_DAYS):
-    order_date = datetime.utcnow() - timedelta(days=day_offset)
-    orders = []
-    print(f"📅 Inserting {ORDERS_PER_DAY} orders for {order_date.date()}... ", end='', flush=True)
-
-    for _ in range(ORDERS_PER_DAY):
-        random_time = order_date.replace(
-            hour=random.randint(0, 23),
-            minute=random.randint(0, 59),
-            second=random.randint(0, 59)
-        )
-        hour = random_time.hour
-        region = random.choice(REGIONS)
-        product_id = random.choice(PRODUCT_IDS)
-        category = random.choice(CATEGORIES)
-        user_segment = random.choice(USER_SEGMENTS)
-        device_type = random.choice(DEVICE_TYPES)
-        quantity = random.randint(1, 5)
-        unit_price = round(random.uniform(10, 100), 2)
-        total_price = round(quantity * unit_price, 2)
-        promo_applied = random.choice([True, False])
-        user_id = f"USER-{uuid.uuid4().hex[:8]}"
-        order_id = f"ORD-{uuid.uuid4().hex[:10]}"
-
-        orders.append((
-            order_id, random_time, product_id, category, user_id, user_segment,
-            region, quantity, unit_price, total_price, device_type, promo_applied, hour
-        ))
-
-    cursor.executemany("""
-        INSERT INTO orders (
-            order_id, timestamp, product_id, category, user_id, user_segment,
-            region, quantity, unit_price, total_price,
-            device_type, promo_applied, hour
-        ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-    """, orders)
-    print("✅")
-
-
-# Final commit after all inserts
-conn.commit()
-cursor.close()
-conn.close()
-
-elapsed = time.time() - start_time
-print(f"✅ Backfill complete in {elapsed:.2f} seconds.")
+NUM_DAYS = int(os.getenv("BACKFILL_DAYS", 90))
+ORDERS_PER_DAY = int(os.getenv("BACKFILL_ORDERS_PER_DAY", 400))  # Final count: NUM_DAYS * ORDERS_PER_DAY
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", 4))
+# Upper bound on rows held in memory per COPY; a day is streamed in chunks of this size
+BACKFILL_CHUNK_ROWS = int(os.getenv("BACKFILL_CHUNK_ROWS", 100_000))
+# Each day's rows are derived from (seed, day), so a rerun regenerates identical orders
+BACKFILL_SEED = int(os.getenv("BACKFILL_SEED", 42))
+
+
+def completed_days(cursor):
+    cursor.execute("SELECT day FROM backfill_progress WHERE seed = %s", (BACKFILL_SEED,))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def copy_day(cursor, day):
+    # Each generated chunk is COPYed into a staging table and merged; the merge
+    # skips order_ids that already exist.
+    rng = make_rng([BACKFILL_SEED, day.toordinal()])
+    inserted = 0
+    remaining = ORDERS_PER_DAY
+    while remaining > 0:
+        n = min(BACKFILL_CHUNK_ROWS, remaining)
+        orders = generate_orders(n, day=day, rng=rng)
+        inserted += db.merge_frame(cursor, "orders", orders, "(order_id, timestamp)", columns=ORDER_COLUMNS)
+        remaining -= n
+
+    cursor.execute("""
+        INSERT INTO backfill_progress (seed, day, rows, loaded_at)
+        VALUES (%s, %s, %s, NOW())
+    """, (BACKFILL_SEED, day, inserted))
+    return inserted
+
+
+def backfill_days(days):
+    # One worker process: own pool, one commit per day so a failure
+    # only loses the day in flight
+    rows = 0
+    start = time.perf_counter()
+    try:
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                done = completed_days(cursor)
+
+                for day in days:
+                    if day in done:
+                        print(f"⏭️  {day} already loaded, skipping")
+                        continue
+                    day_start = time.perf_counter()
+                    inserted = copy_day(cursor, day)
+                    conn.commit()
+                    rows += inserted
+                    day_elapsed = time.perf_counter() - day_start
+                    print(f"📅 {day}: {inserted:,} orders in {day_elapsed:.2f}s ({inserted / day_elapsed:,.0f} rows/sec)")
+    finally:
+        db.close_pool()
+    return rows, time.perf_counter() - start
+
+
+def split_days(days, workers):
+    # Contiguous date spans, one per worker
+    span = -(-len(days) // workers)
+    return [days[i:i + span] for i in range(0, len(days), span)]
+
+
+def main():
+    today = datetime.utcnow().date()
+    days = sorted(today - timedelta(days=offset) for offset in range(NUM_DAYS))
+    spans = split_days(days, max(BACKFILL_WORKERS, 1))
+
+    # Partitions for the whole range exist before any worker starts loading
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            partition_maintenance.ensure_partitions(cursor, days[0], days[-1])
+        conn.commit()
+    db.close_pool()  # workers open their own pools
+
+    print(f"📦 Starting backfill of {NUM_DAYS * ORDERS_PER_DAY:,} orders across {len(spans)} workers...")
+    start_time = time.time()
+
+    total_rows = 0
+    failed = False
+    with ProcessPoolExecutor(max_workers=len(spans)) as pool:
+        futures = {pool.submit(backfill_days, span): span for span in spans}
+        for future in as_completed(futures):
+            span = futures[future]
+            try:
+                rows, worker_seconds = future.result()
+                total_rows += rows
+                instrumentation.observe("backfill_worker_seconds", worker_seconds)
+                instrumentation.inc("backfill_rows_total", rows)
+            except Exception as e:
+                failed = True
+                instrumentation.inc("backfill_failed_spans_total")
+                print(f"❌ Backfill failed for {span[0]} – {span[-1]}: {e}")
+
+    elapsed = time.time() - start_time
+    rate = total_rows / elapsed if elapsed > 0 else 0
+    instrumentation.set_gauge("backfill_rows_per_second", rate)
+    instrumentation.set_gauge("backfill_seconds", elapsed)
+    instrumentation.export()
+    print(f"✅ Backfill complete: {total_rows:,} rows in {elapsed:.2f} seconds ({rate:,.0f} rows/sec).")
+    if failed:
+        print("⚠️ Some days failed; rerun to resume from the last committed day.")
+
+
+if __name__ == "__main__":
+    main()
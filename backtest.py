@@ -0,0 +1,259 @@
+# backtest.py
+# Rolling-origin backtest of every forecasting engine on daily_metrics history.
+# For each (region, metric) series and each origin, the engine is fit on the
+# history up to the origin (expanding window, or the last BACKTEST_WINDOW_DAYS
+# days for a sliding one) and scored on the following horizon. Folds run in a
+# process pool; fitted folds are cached on disk by training-data hash, so a
+# rerun only fits origins that are new since the last run.
+#
+#   python backtest.py --engines prophet,holt_winters,ses,seasonal_naive --window expanding
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+import db
+import fast_forecast
+
+load_dotenv()
+
+# --- Configs ---
+BACKTEST_ENGINES = os.getenv("BACKTEST_ENGINES", "prophet,numpy,holt_winters,ses,seasonal_naive")
+BACKTEST_WINDOW = os.getenv("BACKTEST_WINDOW", "expanding")  # expanding | sliding
+BACKTEST_INITIAL_DAYS = int(os.getenv("BACKTEST_INITIAL_DAYS", 28))
+BACKTEST_WINDOW_DAYS = int(os.getenv("BACKTEST_WINDOW_DAYS", 56))
+BACKTEST_STEP_DAYS = int(os.getenv("BACKTEST_STEP_DAYS", 7))
+BACKTEST_HORIZON = int(os.getenv("BACKTEST_HORIZON", 7))
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", os.cpu_count() or 1))
+BACKTEST_CACHE_DIR = os.getenv("BACKTEST_CACHE_DIR", ".backtest_cache")
+METRICS = ["total_orders", "total_revenue"]
+
+
+def load_series(conn):
+    history = db.read_frame(conn, f"""
+        SELECT date, region, {", ".join(METRICS)} FROM daily_metrics
+        ORDER BY region, date
+    """)
+    conn.commit()
+    series = {}
+    for region, region_df in history.groupby("region", sort=True):
+        for metric_col in METRICS:
+            df = region_df[["date", metric_col]].dropna()
+            df.columns = ["ds", "y"]
+            df = df.assign(ds=pd.to_datetime(df["ds"]), y=df["y"].astype(float))
+            series[(region, metric_col)] = df.reset_index(drop=True)
+    return series
+
+
+def make_folds(series, window=BACKTEST_WINDOW, initial=BACKTEST_INITIAL_DAYS,
+               step=BACKTEST_STEP_DAYS, horizon=BACKTEST_HORIZON):
+    # [(fold key, training frame, actuals frame)]; origins step back from the
+    # latest one so each new day of data adds a fold instead of shifting all of them.
+    # Today's row is a partial day, so it is neither trained on nor scored against.
+    today = pd.Timestamp(datetime.utcnow().date())
+    folds = []
+    for (region, metric_col), df in series.items():
+        df = df[df["ds"] < today].reset_index(drop=True)
+        last_origin = len(df) - horizon
+        for end in range(last_origin, initial - 1, -step):
+            start = max(end - BACKTEST_WINDOW_DAYS, 0) if window == "sliding" else 0
+            train = df.iloc[start:end]
+            origin = train["ds"].iloc[-1]
+            # Actuals by date, so a missing day in the history does not shift them
+            actual = df[(df["ds"] > origin) & (df["ds"] <= origin + pd.Timedelta(days=horizon))]
+            key = (region, metric_col, origin.date().isoformat())
+            folds.append((key, train, actual))
+    return folds
+
+
+def fold_hash(engine, train, horizon):
+    payload = train[["ds", "y"]].to_csv(index=False, date_format="%Y-%m-%d").encode("utf-8")
+    return hashlib.sha256(f"{engine}|{horizon}|".encode("utf-8") + payload).hexdigest()
+
+
+def cache_path(engine, digest):
+    return os.path.join(BACKTEST_CACHE_DIR, engine, f"{digest}.json")
+
+
+def load_cached(engine, digest):
+    try:
+        with open(cache_path(engine, digest)) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    forecast = pd.DataFrame(entry["forecast"])
+    forecast["ds"] = pd.to_datetime(forecast["ds"])
+    return forecast, entry["fit_seconds"]
+
+
+def save_cached(engine, digest, forecast, fit_seconds):
+    path = cache_path(engine, digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    entry = {
+        "fit_seconds": fit_seconds,
+        "forecast": forecast.assign(ds=forecast["ds"].dt.strftime("%Y-%m-%d")).to_dict(orient="list"),
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+
+
+def fit_prophet_folds(folds, horizon):
+    from prophet import Prophet
+
+    results = {}
+    for key, train in folds:
+        start = time.perf_counter()
+        model = Prophet()
+        model.fit(train)
+        forecast = model.predict(model.make_future_dataframe(periods=horizon))
+        fit_seconds = time.perf_counter() - start
+        trimmed = forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]].tail(horizon).reset_index(drop=True)
+        results[key] = (trimmed, fit_seconds)
+    return results
+
+
+def fit_fast_folds(engine, folds, horizon):
+    # Every fold is one row of the matrix, so a chunk of folds fits in one pass;
+    # the chunk's time is split evenly across its folds
+    start = time.perf_counter()
+    forecasts, _ = fast_forecast.forecast_many(folds, horizon, model="auto" if engine == "numpy" else engine)
+    per_fold = (time.perf_counter() - start) / len(folds)
+    return {key: (forecast, per_fold) for key, forecast in forecasts.items()}
+
+
+def fit_fold_chunk(engine, folds, horizon):
+    # Runs in a worker process
+    if engine == "prophet":
+        results = fit_prophet_folds(folds, horizon)
+    else:
+        results = fit_fast_folds(engine, folds, horizon)
+    for key, train in folds:
+        forecast, fit_seconds = results[key]
+        save_cached(engine, fold_hash(engine, train, horizon), forecast, fit_seconds)
+    return results
+
+
+def chunked(items, n_chunks):
+    size = -(-len(items) // max(n_chunks, 1))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def run_engine(engine, folds, horizon, workers, use_cache):
+    results = {}
+    pending = []
+    for key, train, _ in folds:
+        cached = load_cached(engine, fold_hash(engine, train, horizon)) if use_cache else None
+        if cached is not None:
+            results[key] = cached
+        else:
+            pending.append((key, train))
+    print(f"🔁 {engine}: {len(results)} cached folds, fitting {len(pending)}")
+    if not pending:
+        return results
+
+    # Prophet folds are spread one per task; fast-engine folds in one chunk per worker
+    chunks = [[fold] for fold in pending] if engine == "prophet" else chunked(pending, workers)
+    if workers <= 1:
+        for chunk in chunks:
+            try:
+                results.update(fit_fold_chunk(engine, chunk, horizon))
+            except Exception as e:
+                print(f"❌ {engine} fold failed: {e}")
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fit_fold_chunk, engine, chunk, horizon) for chunk in chunks]
+        for future in as_completed(futures):
+            try:
+                results.update(future.result())
+            except Exception as e:
+                print(f"❌ {engine} fold failed: {e}")
+    return results
+
+
+def score_folds(engine, folds, results):
+    rows = []
+    for key, train, actual in folds:
+        if key not in results:
+            continue
+        forecast, fit_seconds = results[key]
+        scored = forecast.merge(actual[["ds", "y"]], on="ds", how="inner")
+        if scored.empty:
+            continue
+        y = scored["y"].to_numpy(dtype=float)
+        yhat = scored["yhat"].to_numpy(dtype=float)
+        lower = scored["yhat_lower"].to_numpy(dtype=float)
+        upper = scored["yhat_upper"].to_numpy(dtype=float)
+        nonzero = y != 0
+        region, metric_col, origin = key
+        rows.append({
+            "engine": engine,
+            "region": region,
+            "metric": metric_col,
+            "origin": origin,
+            "train_days": len(train),
+            "mape": float(np.mean(np.abs((y - yhat)[nonzero] / y[nonzero]))) if nonzero.any() else np.nan,
+            "coverage": float(np.mean((y >= lower) & (y <= upper))),
+            "fit_seconds": fit_seconds,
+        })
+    return rows
+
+
+def summarize(folds):
+    if folds.empty:
+        return pd.DataFrame(columns=["folds", "mape", "coverage", "fit_seconds", "fit_ms_per_fold"])
+    summary = folds.groupby("engine").agg(
+        folds=("origin", "size"),
+        mape=("mape", "mean"),
+        coverage=("coverage", "mean"),
+        fit_seconds=("fit_seconds", "sum"),
+        fit_ms_per_fold=("fit_seconds", lambda s: s.mean() * 1000),
+    )
+    return summary.sort_values("mape")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin forecast backtest")
+    parser.add_argument("--engines", default=BACKTEST_ENGINES, help="comma-separated: prophet, numpy, holt_winters, ses, seasonal_naive")
+    parser.add_argument("--window", default=BACKTEST_WINDOW, choices=["expanding", "sliding"])
+    parser.add_argument("--workers", type=int, default=BACKTEST_WORKERS)
+    parser.add_argument("--no-cache", action="store_true", help="refit every fold")
+    parser.add_argument("--output", default="backtest_folds.csv", help="per-fold results")
+    args = parser.parse_args()
+
+    with db.connection() as conn:
+        series = load_series(conn)
+    db.close_pool()  # workers never touch the database
+
+    folds = make_folds(series, window=args.window)
+    print(f"📐 {len(folds)} folds over {len(series)} series ({args.window} window, horizon {BACKTEST_HORIZON})")
+    if not folds:
+        print("⚠️ Not enough history to backtest.")
+        return
+
+    rows = []
+    for engine in filter(None, (name.strip() for name in args.engines.split(","))):
+        start = time.perf_counter()
+        results = run_engine(engine, folds, BACKTEST_HORIZON, args.workers, use_cache=not args.no_cache)
+        rows.extend(score_folds(engine, folds, results))
+        print(f"⏱️  {engine} finished in {time.perf_counter() - start:.2f}s")
+
+    fold_results = pd.DataFrame(rows)
+    if fold_results.empty:
+        print("⚠️ No successful folds to summarize.")
+        return
+    fold_results.to_csv(args.output, index=False)
+    print("\n📊 Backtest summary (mean MAPE and interval coverage per engine):")
+    print(summarize(fold_results).round(4).to_string())
+    print(f"\n💾 Per-fold results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
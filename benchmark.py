@@ -0,0 +1,336 @@
+# benchmark.py
+# End-to-end benchmark: seeds a scratch Postgres database with synthetic orders
+# at each requested scale and times generation, ingest, aggregation, forecasting
+# and the dashboard query paths. Results are written as JSON so runs can be
+# compared between commits.
+#
+#   BENCH_DB_NAME=forecast_bench python benchmark.py --rows 100k,1m,10m
+#
+# The benchmark TRUNCATES every pipeline table, so it only runs against the
+# database named in BENCH_DB_NAME and refuses to run against DB_NAME.
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "archive"))
+
+load_dotenv()
+# Benchmark fits must not read from or overwrite the pipeline's model cache
+os.environ.setdefault("MODEL_CACHE", "0")
+
+from order_generator import ORDER_COLUMNS, REGIONS, generate_orders, make_rng  # noqa: E402
+import order_codec  # noqa: E402
+import db  # noqa: E402
+import partition_maintenance  # noqa: E402
+
+# --- Configs ---
+BENCH_DAYS = int(os.getenv("BENCH_DAYS", 90))
+BENCH_SEED = int(os.getenv("BENCH_SEED", 7))
+BENCH_CHUNK_ROWS = int(os.getenv("BENCH_CHUNK_ROWS", 100_000))
+BENCH_INGEST_MAX = int(os.getenv("BENCH_INGEST_MAX", 500_000))
+BENCH_INGEST_BATCH = int(os.getenv("BENCH_INGEST_BATCH", 5000))
+BENCH_QUERY_REPEATS = int(os.getenv("BENCH_QUERY_REPEATS", 20))
+PIPELINE_TABLES = [
+    "orders", "daily_metrics", "forecast_metrics", "order_rollups", "live_rollups",
+    "order_dimensions", "pipeline_state", "pipeline_runs", "backfill_progress",
+]
+
+
+def connect_bench_db():
+    name = os.getenv("BENCH_DB_NAME")
+    if not name:
+        sys.exit("❌ Set BENCH_DB_NAME to a scratch database; the benchmark truncates its tables.")
+    if name == os.getenv("DB_NAME") and os.getenv("BENCH_DB_HOST", os.getenv("DB_HOST")) == os.getenv("DB_HOST"):
+        sys.exit("❌ BENCH_DB_NAME points at the pipeline database; refusing to truncate it.")
+    return psycopg2.connect(
+        dbname=name,
+        user=os.getenv("BENCH_DB_USER", os.getenv("DB_USER")),
+        password=os.getenv("BENCH_DB_PASSWORD", os.getenv("DB_PASSWORD")),
+        host=os.getenv("BENCH_DB_HOST", os.getenv("DB_HOST")),
+        port=os.getenv("BENCH_DB_PORT", os.getenv("DB_PORT"))
+    )
+
+
+def parse_rows(value):
+    scales = []
+    for token in value.split(","):
+        token = token.strip().lower()
+        multiplier = {"k": 1_000, "m": 1_000_000}.get(token[-1:], 1)
+        scales.append(int(float(token.rstrip("km")) * multiplier))
+    return scales
+
+
+def label_for(rows):
+    if rows >= 1_000_000 and rows % 1_000_000 == 0:
+        return f"{rows // 1_000_000}m"
+    if rows >= 1_000 and rows % 1_000 == 0:
+        return f"{rows // 1_000}k"
+    return str(rows)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def reset_peak_rss():
+    # Linux lets a process reset its peak RSS counter, which gives per-stage peaks
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+class Stage:
+    # Times one stage; individual operations inside it are recorded with lap()
+    # to get latency percentiles.
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.laps = []
+
+    def __enter__(self):
+        print(f"⏱️  {self.name}...")
+        reset_peak_rss()
+        self.start = time.perf_counter()
+        return self
+
+    def lap(self, seconds, rows=0):
+        self.laps.append(seconds)
+        self.rows += rows
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        self.peak_rss_mb = peak_rss_mb()
+        return False
+
+    def result(self):
+        laps = np.array(self.laps or [self.seconds]) * 1000
+        return {
+            "seconds": round(self.seconds, 4),
+            "rows": self.rows,
+            "throughput_rows_per_sec": round(self.rows / self.seconds, 1) if self.seconds > 0 else None,
+            "operations": len(self.laps),
+            "latency_ms": {
+                "p50": round(float(np.percentile(laps, 50)), 3),
+                "p95": round(float(np.percentile(laps, 95)), 3),
+            },
+            "peak_rss_mb": round(self.peak_rss_mb, 1),
+        }
+
+
+def reset_database(conn):
+    # The scratch database is truncated anyway, so an old unpartitioned orders
+    # table is simply replaced
+    partition_maintenance.migrate_legacy(conn, drop_legacy=True)
+    today = datetime.utcnow().date()
+    with conn.cursor() as cursor:
+        with open(os.path.join(ROOT, "postgres_init.sql")) as f:
+            cursor.execute(f.read())
+        cursor.execute(f"TRUNCATE {', '.join(PIPELINE_TABLES)}")
+        partition_maintenance.ensure_partitions(cursor, today - timedelta(days=BENCH_DAYS), today)
+    conn.commit()
+
+
+def copy_orders(cursor, orders):
+    db.merge_frame(cursor, "orders", orders, "(order_id, timestamp)", columns=ORDER_COLUMNS)
+
+
+def day_chunks(rows):
+    # Spread rows evenly across BENCH_DAYS days ending today, chunked for memory
+    today = datetime.utcnow().date()
+    per_day = -(-rows // BENCH_DAYS)
+    remaining = rows
+    for offset in range(BENCH_DAYS - 1, -1, -1):
+        day = today - timedelta(days=offset)
+        day_rows = min(per_day, remaining)
+        while day_rows > 0:
+            n = min(day_rows, BENCH_CHUNK_ROWS)
+            yield day, n
+            day_rows -= n
+            remaining -= n
+
+
+def bench_generation(rows):
+    rng = make_rng(BENCH_SEED)
+    with Stage("generate orders") as stage:
+        for day, n in day_chunks(rows):
+            start = time.perf_counter()
+            generate_orders(n, day=day, rng=rng)
+            stage.lap(time.perf_counter() - start, n)
+    return stage
+
+
+def bench_seed(conn, rows):
+    rng = make_rng(BENCH_SEED)
+    with Stage("seed orders (COPY)") as stage:
+        with conn.cursor() as cursor:
+            for day, n in day_chunks(rows):
+                start = time.perf_counter()
+                copy_orders(cursor, generate_orders(n, day=day, rng=rng))
+                conn.commit()
+                stage.lap(time.perf_counter() - start, n)
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE orders")
+        conn.commit()
+    return stage
+
+
+def bench_ingest(conn, rows):
+    import inprocess_kafka
+    from kafka_consumer import BatchIngestor
+    from simulate_orders import generate_payloads
+
+    n_messages = min(rows, BENCH_INGEST_MAX)
+    broker = inprocess_kafka.InProcessBroker(retention=n_messages)
+    producer = inprocess_kafka.Producer(broker=broker)
+    headers = order_codec.headers_for(order_codec.BINARY)
+    produced = 0
+    while produced < n_messages:
+        for payload in generate_payloads(min(BENCH_CHUNK_ROWS, n_messages - produced), order_codec.BINARY):
+            producer.produce("orders", payload, headers=headers)
+            produced += 1
+
+    consumer = inprocess_kafka.Consumer({"group.id": "bench", "auto.offset.reset": "earliest"}, broker=broker)
+    consumer.subscribe(["orders"])
+    ingestor = BatchIngestor(consumer, conn, batch_size=BENCH_INGEST_BATCH, linger_ms=1000)
+    with Stage(f"consumer ingest ({n_messages:,} bin1 messages)") as stage:
+        consumed = 0
+        while consumed < n_messages:
+            msgs = consumer.consume(num_messages=ingestor.room(), timeout=0.1)
+            for msg in msgs:
+                ingestor.add(msg)
+            consumed += len(msgs)
+            if ingestor.should_flush() or consumed >= n_messages:
+                start = time.perf_counter()
+                written = ingestor.flush()
+                stage.lap(time.perf_counter() - start, written)
+    return stage
+
+
+def bench_aggregation(conn, full_rebuild):
+    from aggregate_daily_metrics import run_aggregation
+
+    label = "aggregate_daily_metrics (full)" if full_rebuild else "aggregate_daily_metrics (incremental)"
+    with Stage(label) as stage:
+        start = time.perf_counter()
+        groups = run_aggregation(conn, full_rebuild=full_rebuild)
+        stage.lap(time.perf_counter() - start, groups)
+    return stage
+
+
+def bench_forecast(conn):
+    from forecast_and_store import load_daily_metrics, run_forecasts, split_series, store_forecasts
+
+    with Stage("forecast_and_store") as stage:
+        start = time.perf_counter()
+        history = load_daily_metrics(conn)
+        results = run_forecasts(split_series(history))
+        rows = store_forecasts(conn, results)
+        stage.lap(time.perf_counter() - start, rows)
+    return stage
+
+
+def bench_queries(conn):
+    # The SQL behind get_history (rollup RPC) and get_forecast
+    today = datetime.utcnow().date()
+    history = Stage("get_history query path")
+    forecast = Stage("get_forecast query path")
+    with conn.cursor() as cursor:
+        with history:
+            for _ in range(BENCH_QUERY_REPEATS):
+                for region in REGIONS:
+                    for lookback in (7, 30, 90):
+                        for category in (None, "Electronics"):
+                            start = time.perf_counter()
+                            cursor.execute(
+                                "SELECT * FROM get_history_rollup(%s, %s, %s, NULL, NULL)",
+                                (region, today - timedelta(days=lookback), category)
+                            )
+                            fetched = len(cursor.fetchall())
+                            history.lap(time.perf_counter() - start, fetched)
+        with forecast:
+            for _ in range(BENCH_QUERY_REPEATS):
+                for region in REGIONS:
+                    for metric in ("total_orders", "total_revenue"):
+                        start = time.perf_counter()
+                        cursor.execute("""
+                            SELECT forecast_date, forecast_value FROM forecast_metrics
+                            WHERE region = %s AND metric = %s
+                              AND category = 'All' AND user_segment = 'All'
+                            ORDER BY forecast_date
+                        """, (region, metric))
+                        fetched = len(cursor.fetchall())
+                        forecast.lap(time.perf_counter() - start, fetched)
+    conn.rollback()
+    return history, forecast
+
+
+def run_scale(conn, rows, skip_forecast):
+    print(f"\n📦 Benchmark at {rows:,} orders")
+    reset_database(conn)
+    stages = [bench_generation(rows), bench_seed(conn, rows)]
+    stages.append(bench_aggregation(conn, full_rebuild=True))
+    stages.append(bench_ingest(conn, rows))
+    stages.append(bench_aggregation(conn, full_rebuild=False))
+    if not skip_forecast:
+        stages.append(bench_forecast(conn))
+    stages.extend(bench_queries(conn))
+    return {stage.name: stage.result() for stage in stages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark")
+    parser.add_argument("--rows", default="100k,1m,10m", help="comma-separated scales, e.g. 100k,1m,10m")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--skip-forecast", action="store_true", help="skip the Prophet stage")
+    args = parser.parse_args()
+
+    conn = connect_bench_db()
+    results = {
+        "commit": git_commit(),
+        "started_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scales": {},
+    }
+    try:
+        for rows in parse_rows(args.rows):
+            results["scales"][label_for(rows)] = run_scale(conn, rows, args.skip_forecast)
+    finally:
+        conn.close()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Benchmark results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
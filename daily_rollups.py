@@ -0,0 +1,87 @@
+# daily_rollups.py
+import os
+import time
+from collections import defaultdict
+import db
+from aggregate_daily_metrics import UNKNOWN_DIMENSION
+
+# --- Configs ---
+# How often a consumer folds live_rollups down to one row per key
+LIVE_ROLLUP_COMPACT_SECONDS = float(os.getenv("LIVE_ROLLUP_COMPACT_SECONDS", 60))
+# Any one consumer worker may compact; the others skip while it holds this lock
+COMPACT_LOCK_ID = 7_263_001
+
+
+class DailyRollups:
+    # Live per-(date, hour, region, category, user_segment) deltas from the
+    # consumer, appended to live_rollups in the same transaction as the orders
+    # they count. The cron aggregation owns daily_metrics and order_rollups; when
+    # it recomputes a (date, region) group it deletes that group's live rows in
+    # the same snapshot, so a delta is counted either live or in the batch
+    # tables, never both. Readers merge the two (daily_metrics_live,
+    # get_history_rollup). Every LIVE_ROLLUP_COMPACT_SECONDS the appended rows
+    # are summed into one row per key, so the table stays the size of a day's
+    # rollup grain rather than growing with the order count.
+
+    def __init__(self, compact_seconds=LIVE_ROLLUP_COMPACT_SECONDS):
+        self.compact_seconds = compact_seconds
+        self.next_compact = time.monotonic() + compact_seconds
+
+    def write(self, cursor, rows):
+        # rows: (timestamp, region, total_price, category, user_segment) of newly inserted orders
+        counts = defaultdict(int)
+        revenue = defaultdict(float)
+        for timestamp, region, total_price, category, user_segment in rows:
+            key = (timestamp.date(), timestamp.hour, region,
+                   category or UNKNOWN_DIMENSION, user_segment or UNKNOWN_DIMENSION)
+            counts[key] += 1
+            revenue[key] += float(total_price)
+        if not counts:
+            return 0
+
+        # Append-only, so concurrent consumer workers never wait on each other's row locks
+        db.insert_values(cursor, """
+            INSERT INTO live_rollups (
+                date, hour, region, category, user_segment, total_orders, total_revenue
+            ) VALUES %s
+        """, [(*key, count, round(revenue[key], 2)) for key, count in counts.items()])
+        return len(counts)
+
+    def due(self):
+        return time.monotonic() >= self.next_compact
+
+    def maybe_compact(self, conn):
+        if not self.due():
+            return 0
+        try:
+            return self.compact(conn)
+        except Exception as e:
+            conn.rollback()
+            print("⚠️ Could not compact live rollups:", e)
+            return 0
+
+    def compact(self, conn):
+        # Moves every visible row into one summed row per key in one statement.
+        # Rows appended meanwhile are not visible to it and stay as they are. An
+        # aggregation run that overlaps it fails with a serialization error and
+        # retries, rather than deleting or keeping rows it has not seen.
+        self.next_compact = time.monotonic() + self.compact_seconds
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (COMPACT_LOCK_ID,))
+            if not cursor.fetchone()[0]:
+                conn.commit()
+                return 0
+            cursor.execute("""
+                WITH moved AS (
+                    DELETE FROM live_rollups RETURNING *
+                )
+                INSERT INTO live_rollups (
+                    date, hour, region, category, user_segment, total_orders, total_revenue
+                )
+                SELECT date, hour, region, category, user_segment, SUM(total_orders), SUM(total_revenue)
+                FROM moved
+                GROUP BY date, hour, region, category, user_segment
+            """)
+            rows = cursor.rowcount
+        conn.commit()
+        return rows
@@ -0,0 +1,140 @@
+# db.py
+# Shared Postgres access: one connection pool per process, server-side cursors
+# that stream large reads into pandas in fixed-size chunks, and bulk-write
+# helpers (COPY through a staging table, execute_values).
+import io
+import itertools
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+import pandas as pd
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configs ---
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 4))
+DB_FETCH_CHUNK_ROWS = int(os.getenv("DB_FETCH_CHUNK_ROWS", 50_000))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_cursor_ids = itertools.count()
+
+
+def connect_params(prefix="DB_"):
+    return {
+        "dbname": os.getenv(f"{prefix}NAME"),
+        "user": os.getenv(f"{prefix}USER"),
+        "password": os.getenv(f"{prefix}PASSWORD"),
+        "host": os.getenv(f"{prefix}HOST"),
+        "port": os.getenv(f"{prefix}PORT"),
+    }
+
+
+def get_pool():
+    # Created lazily, and again after a fork so worker processes never share sockets
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **connect_params())
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+
+
+@contextmanager
+def connection():
+    # Borrow a pooled connection; callers commit, failures are rolled back
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+# --- Reads ---
+
+def stream_frames(conn, sql, params=None, chunk_size=DB_FETCH_CHUNK_ROWS):
+    # A named (server-side) cursor keeps the result set in Postgres; only one
+    # chunk of rows is held in Python at a time. An empty result still yields
+    # one empty frame so callers see the columns.
+    with conn.cursor(name=f"stream_{next(_cursor_ids)}") as cursor:
+        cursor.itersize = chunk_size
+        cursor.execute(sql, params)
+        yielded = False
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows and yielded:
+                break
+            yield pd.DataFrame(rows, columns=[col[0] for col in cursor.description])
+            yielded = True
+            if not rows:
+                break
+
+
+def read_frame(conn, sql, params=None, chunk_size=DB_FETCH_CHUNK_ROWS):
+    frames = list(stream_frames(conn, sql, params, chunk_size))
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+# --- Writes ---
+
+def insert_values(cursor, sql, rows, fetch=False):
+    # One multi-row statement for the whole batch ("VALUES %s" in sql)
+    rows = list(rows)
+    if not rows:
+        return [] if fetch else 0
+    result = execute_values(cursor, sql, rows, page_size=len(rows), fetch=fetch)
+    return result if fetch else cursor.rowcount
+
+
+def copy_frame(cursor, table, frame, columns=None):
+    columns = list(columns or frame.columns)
+    buf = io.StringIO()
+    frame.to_csv(buf, columns=columns, index=False, header=False)
+    buf.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def staging_table(cursor, table, columns):
+    # Temp table shaped like the target columns; emptied at every commit
+    name = f"{table}_staging_{zlib.crc32(','.join(columns).encode()):08x}"
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {name} ON COMMIT DELETE ROWS AS
+        SELECT {", ".join(columns)} FROM {table} WITH NO DATA
+    """)
+    return name
+
+
+def merge_frame(cursor, table, frame, conflict, action="DO NOTHING", returning=None, columns=None):
+    # COPY into a staging table, then one INSERT ... SELECT ... ON CONFLICT into
+    # the target. Returns the RETURNING rows if asked for, else the row count.
+    columns = list(columns or frame.columns)
+    staging = staging_table(cursor, table, columns)
+    cursor.execute(f"TRUNCATE {staging}")
+    copy_frame(cursor, staging, frame, columns)
+    cols = ", ".join(columns)
+    cursor.execute(f"""
+        INSERT INTO {table} ({cols})
+        SELECT {cols} FROM {staging}
+        ON CONFLICT {conflict} {action}
+        {f"RETURNING {returning}" if returning else ""}
+    """)
+    return cursor.fetchall() if returning else cursor.rowcount
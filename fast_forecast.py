@@ -0,0 +1,216 @@
+# fast_forecast.py
+# NumPy forecasting engine: seasonal-naive, simple exponential smoothing and
+# additive Holt-Winters with a weekly season. Every series is stacked into one
+# series x days matrix and every smoothing-parameter combination is run in the
+# same pass over the days, so hundreds of series fit in milliseconds.
+# Forecasts use the Prophet path's columns: ds, yhat, yhat_lower, yhat_upper.
+import os
+import numpy as np
+import pandas as pd
+
+# --- Configs ---
+# "auto" picks, per series, the model with the lowest one-step in-sample error
+FAST_FORECAST_MODEL = os.getenv("FAST_FORECAST_MODEL", "auto")
+SEASON_LENGTH = 7
+INTERVAL_Z = 1.2816  # 80% interval, Prophet's default interval_width
+
+MODELS = ("seasonal_naive", "ses", "holt_winters")
+SES_ALPHAS = np.linspace(0.05, 0.95, 19)
+HW_ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5, 0.7])
+HW_BETAS = np.array([0.0, 0.01, 0.05, 0.1])
+HW_GAMMAS = np.array([0.0, 0.05, 0.1, 0.3])
+
+
+def to_matrix(series):
+    # series: [(key, df[ds, y])]. Rows are right-aligned on each series' own last
+    # date; shorter series are padded with leading NaN and gaps are forward-filled.
+    days = [df["ds"].to_numpy().astype("datetime64[D]") for _, df in series]
+    values = [df["y"].to_numpy(dtype=float) for _, df in series]
+    firsts = np.array([d.min() for d in days])
+    lasts = np.array([d.max() for d in days])
+    T = int((lasts - firsts).astype(int).max()) + 1
+
+    Y = np.full((len(series), T), np.nan)
+    for i, (d, y) in enumerate(zip(days, values)):
+        Y[i, (d - lasts[i]).astype(int) + T - 1] = y
+
+    # Forward-fill gaps: each cell takes the value of the last observed column
+    cols = np.arange(T)
+    filled = np.where(~np.isnan(Y), cols[None, :], 0)
+    np.maximum.accumulate(filled, axis=1, out=filled)
+    Y = np.take_along_axis(Y, filled, axis=1)
+    Y[cols[None, :] < ((firsts - lasts).astype(int) + T - 1)[:, None]] = np.nan
+    return Y, pd.to_datetime(lasts)
+
+
+def _first_valid(Y):
+    valid = ~np.isnan(Y)
+    return np.where(valid.any(axis=1), valid.argmax(axis=1), Y.shape[1])
+
+
+def seasonal_naive(Y, horizon, m=SEASON_LENGTH):
+    # Returns (yhat, scale, mse): point forecasts, the h-step error standard
+    # deviation (both series x horizon) and the one-step in-sample MSE per series
+    S, T = Y.shape
+    steps = np.arange(horizon)
+    if T <= m:
+        return np.full((S, horizon), np.nan), np.full((S, horizon), np.nan), np.full(S, np.inf)
+    yhat = Y[:, T - m + steps % m]
+    resid = Y[:, m:] - Y[:, :-m]
+    count = (~np.isnan(resid)).sum(axis=1)
+    mse = np.where(count > 0, np.nansum(resid ** 2, axis=1) / np.maximum(count, 1), np.inf)
+    scale = np.sqrt(mse)[:, None] * np.sqrt(steps // m + 1)[None, :]
+    return yhat, scale, mse
+
+
+def ses(Y, horizon, alphas=SES_ALPHAS):
+    S, T = Y.shape
+    start = _first_valid(Y)
+    # Rows sorted by start date, so the rows active at day t are a prefix
+    order = np.argsort(start, kind="stable")
+    Ys, s0 = Y[order], start[order]
+    a = alphas[None, :]
+    level = np.repeat(Ys[np.arange(S), np.minimum(s0, T - 1)][:, None], len(alphas), axis=1)
+    sse = np.zeros((S, len(alphas)))
+    for t in range(1, T):
+        k = np.searchsorted(s0, t, side="left")  # rows with s0 < t
+        if k == 0:
+            continue
+        err = Ys[:k, t, None] - level[:k]
+        sse[:k] += err ** 2
+        level[:k] += a * err
+
+    rows = np.arange(S)
+    count = np.maximum(T - 1 - s0, 0)
+    best = sse.argmin(axis=1)
+    mse = np.where(count > 0, sse[rows, best] / np.maximum(count, 1), np.inf)
+    alpha = alphas[best]
+    steps = np.arange(horizon)
+    yhat = np.repeat(level[rows, best][:, None], horizon, axis=1)
+    scale = np.sqrt(mse)[:, None] * np.sqrt(1 + steps[None, :] * alpha[:, None] ** 2)
+    unsort = np.argsort(order)
+    return yhat[unsort], scale[unsort], mse[unsort]
+
+
+def holt_winters(Y, horizon, m=SEASON_LENGTH):
+    # Additive level/trend/season. Seasonal slots are indexed by absolute column
+    # t % m, which is the same weekday for every row since rows are right-aligned.
+    S, T = Y.shape
+    yhat = np.full((S, horizon), np.nan)
+    scale = np.full((S, horizon), np.nan)
+    mse = np.full(S, np.inf)
+    start = _first_valid(Y)
+    fit_rows = np.flatnonzero(T - start >= 2 * m)
+    if not len(fit_rows):
+        return yhat, scale, mse
+
+    # Rows sorted by start date, so the rows active at day t are a prefix
+    fit_rows = fit_rows[np.argsort(start[fit_rows], kind="stable")]
+    Ys, s0 = Y[fit_rows], start[fit_rows]
+    n = len(fit_rows)
+    rows = np.arange(n)
+
+    grid = np.array(np.meshgrid(HW_ALPHAS, HW_BETAS, HW_GAMMAS, indexing="ij")).reshape(3, -1)
+    a, b, g = (params[None, :] for params in grid)
+    G = grid.shape[1]
+
+    # Heuristic start: level/season from the first week, trend from the first two
+    window = s0[:, None] + np.arange(m)[None, :]
+    first = Ys[rows[:, None], window]
+    second = Ys[rows[:, None], window + m]
+    level0 = first.mean(axis=1)
+    trend0 = (second.mean(axis=1) - level0) / m
+    season0 = np.zeros((n, m))
+    season0[rows[:, None], window % m] = first - level0[:, None]
+
+    level = np.repeat(level0[:, None], G, axis=1)
+    trend = np.repeat(trend0[:, None], G, axis=1)
+    season = np.ascontiguousarray(np.repeat(season0.T[:, :, None], G, axis=2))  # (m, n, G)
+    sse = np.zeros((n, G))
+    for t in range(T):
+        k = np.searchsorted(s0, t, side="right")  # rows with s0 <= t
+        if k == 0:
+            continue
+        scored = np.searchsorted(s0 + m, t, side="right")  # past their first week
+        y = Ys[:k, t, None]
+        L, B, Sp = level[:k], trend[:k], season[t % m, :k]
+        if scored:
+            sse[:scored] += (y[:scored] - (L[:scored] + B[:scored] + Sp[:scored])) ** 2
+        new_level = a * (y - Sp) + (1 - a) * (L + B)
+        trend[:k] = b * (new_level - L) + (1 - b) * B
+        season[t % m, :k] = g * (y - new_level) + (1 - g) * Sp
+        level[:k] = new_level
+
+    count = T - s0 - m
+    best = sse.argmin(axis=1)
+    fit_mse = sse[rows, best] / count
+    alpha, beta, gamma = grid[:, best]
+
+    h = np.arange(1, horizon + 1)
+    phases = (T - 1 + h) % m
+    fit_yhat = (
+        level[rows, best][:, None]
+        + h[None, :] * trend[rows, best][:, None]
+        + season[phases][:, rows, best].T
+    )
+    # h-step variance: sigma^2 * (1 + sum_{j<h} c_j^2), c_j = alpha(1 + j beta) + gamma [j % m == 0]
+    j = np.arange(1, horizon)
+    c = alpha[:, None] * (1 + j[None, :] * beta[:, None]) + gamma[:, None] * (j % m == 0)[None, :]
+    cum = np.concatenate([np.zeros((n, 1)), np.cumsum(c ** 2, axis=1)], axis=1)
+
+    yhat[fit_rows] = fit_yhat
+    scale[fit_rows] = np.sqrt(fit_mse)[:, None] * np.sqrt(1 + cum)
+    mse[fit_rows] = fit_mse
+    return yhat, scale, mse
+
+
+FITTERS = {
+    "seasonal_naive": seasonal_naive,
+    "ses": ses,
+    "holt_winters": holt_winters,
+}
+
+
+def check_model(model):
+    if model != "auto" and model not in FITTERS:
+        raise ValueError(f"Unknown fast_forecast model {model!r}; expected 'auto' or one of {', '.join(MODELS)}")
+    return model
+
+
+def forecast_matrix(Y, horizon, model=FAST_FORECAST_MODEL):
+    # Returns (yhat, lower, upper, chosen, mse): chosen[i] is the model used for
+    # row i and mse[i] its one-step in-sample error.
+    # A named model falls back to the best feasible one for series too short for it.
+    check_model(model)
+    fitted = {name: FITTERS[name](Y, horizon) for name in (MODELS if model == "auto" else (model,) + MODELS)}
+    names = list(fitted)
+    mse = np.stack([fitted[name][2] for name in names])
+    if model == "auto":
+        pick = mse.argmin(axis=0)
+    else:
+        pick = np.where(np.isfinite(mse[0]), 0, mse.argmin(axis=0))
+
+    rows = np.arange(Y.shape[0])
+    yhat = np.stack([fitted[name][0] for name in names])[pick, rows]
+    scale = np.stack([fitted[name][1] for name in names])[pick, rows]
+    chosen = np.array(names, dtype=object)[pick]
+    return yhat, yhat - INTERVAL_Z * scale, yhat + INTERVAL_Z * scale, chosen, mse[pick, rows]
+
+
+def forecast_many(series, horizon, model=FAST_FORECAST_MODEL):
+    # series: [(key, df[ds, y])] -> ({key: forecast df}, {key: model name})
+    if not series:
+        return {}, {}
+    Y, last_dates = to_matrix(series)
+    yhat, lower, upper, chosen, _ = forecast_matrix(Y, horizon, model)
+    offsets = pd.to_timedelta(np.arange(1, horizon + 1), unit="D")
+    forecasts, models = {}, {}
+    for i, (key, _) in enumerate(series):
+        forecasts[key] = pd.DataFrame({
+            "ds": last_dates[i] + offsets,
+            "yhat": yhat[i],
+            "yhat_lower": lower[i],
+            "yhat_upper": upper[i],
+        })
+        models[key] = chosen[i]
+    return forecasts, models
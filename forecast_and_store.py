@@ -1,14 +1,38 @@
 import os
-import psycopg2
+import time
 import pandas as pd
 from prophet import Prophet
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dotenv import load_dotenv
 import smtplib
 from email.message import EmailMessage
+import db
+import fast_forecast
+import hierarchical_forecast
+import instrumentation
+import model_cache
+import snapshot_store
 
 load_dotenv()
 
+# --- Configs ---
+METRICS_TO_FORECAST = ['total_orders', 'total_revenue']
+REGIONS = ['Northeast', 'Midwest', 'South', 'West']
+FORECAST_HORIZON = 7
+MIN_HISTORY_DAYS = 7
+# Number of worker processes used to fit series concurrently (1 = fit in-process)
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", os.cpu_count() or 1))
+# "prophet", "numpy" (fast_forecast picks a model per series) or a fast_forecast
+# model name: "seasonal_naive", "ses", "holt_winters"
+FORECAST_ENGINE = os.getenv("FORECAST_ENGINE", "prophet")
+# Per-series overrides, e.g. "West=numpy,South:total_revenue=holt_winters"
+FORECAST_ENGINE_OVERRIDES = os.getenv("FORECAST_ENGINE_OVERRIDES", "")
+# FORECAST_HIERARCHY=1 also forecasts every region x category x user_segment node
+FORECAST_HIERARCHY = os.getenv("FORECAST_HIERARCHY", "0") == "1"
+ALL = hierarchical_forecast.ALL
+ENGINES = ("prophet", "numpy") + fast_forecast.MODELS
+
 # Email utility
 def send_email_alert(subject, body):
     try:
@@ -26,97 +50,298 @@ def send_email_alert(subject, body):
     except Exception as e:
         print(f"⚠️ Failed to send email alert: {e}")
 
-# Connect to DB
-conn = psycopg2.connect(
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT")
-)
-cursor = conn.cursor()
-
-metrics_to_forecast = ['total_orders', 'total_revenue']
-regions = ['Northeast', 'Midwest', 'South', 'West']
-forecast_horizon = 7
-forecast_summary = []
-
-print("🧹 Cleaning up old avg_order_value forecasts...")
-cursor.execute("DELETE FROM forecast_metrics WHERE metric = 'avg_order_value'")
-conn.commit()
-
-print("📈 Starting forecasting process...")
-for region in regions:
-    for metric_col in metrics_to_forecast:
-        print(f"📍 Region: {region} | Metric: {metric_col}")
-
-        cursor.execute(f"""
-            SELECT date, {metric_col} FROM daily_metrics
-            WHERE region = %s AND {metric_col} IS NOT NULL
-            ORDER BY date
-        """, (region,))
-        
-        rows = cursor.fetchall()
-        if len(rows) < 7:
-            print(f"⚠️ Not enough data to forecast {metric_col} for {region}. Skipping.")
+
+def load_daily_metrics(conn, regions=REGIONS, metrics=METRICS_TO_FORECAST):
+    # One query for every region x metric series, streamed in chunks
+    if snapshot_store.DATA_SOURCE == "snapshot":
+        history = snapshot_store.read_table(
+            "daily_metrics", ["date", "region", *metrics], [("region", "in", list(regions))]
+        )
+        return history.sort_values(["region", "date"], ignore_index=True)
+    # daily_metrics_live adds the consumer's live deltas, so today's partial day
+    # is current rather than as of the last aggregation run. NUMERIC values
+    # arrive as Decimal objects; each chunk is cast to floats as it is fetched,
+    # so only one chunk of Decimals is ever held
+    chunks = [
+        chunk.astype({metric: float for metric in metrics if chunk[metric].dtype == object})
+        for chunk in db.stream_frames(conn, f"""
+            SELECT date, region, {", ".join(metrics)} FROM daily_metrics_live
+            WHERE region = ANY(%s)
+            ORDER BY region, date
+        """, (list(regions),))
+    ]
+    conn.commit()
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+
+def split_series(history, regions=REGIONS, metrics=METRICS_TO_FORECAST):
+    by_region = dict(tuple(history.groupby("region", sort=False)))
+    for region in regions:
+        region_df = by_region.get(region)
+        for metric_col in metrics:
+            if region_df is None:
+                yield region, metric_col, pd.DataFrame(columns=["ds", "y"])
+                continue
+            df = region_df[["date", metric_col]].dropna()
+            df.columns = ["ds", "y"]
+            yield region, metric_col, df.reset_index(drop=True)
+
+
+def predict_trimmed(model):
+    future = model.make_future_dataframe(periods=FORECAST_HORIZON)
+    forecast = model.predict(future)
+    return forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(FORECAST_HORIZON).reset_index(drop=True)
+
+
+def check_engine(engine, setting="FORECAST_ENGINE"):
+    # Caught while reading the config, before any series is fitted
+    if engine not in ENGINES:
+        raise ValueError(f"{setting}: unknown engine {engine!r}; expected one of {', '.join(ENGINES)}")
+    return engine
+
+
+def parse_engine_overrides(spec=FORECAST_ENGINE_OVERRIDES, default=FORECAST_ENGINE):
+    check_engine(default)
+    overrides = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        target, sep, engine = item.partition("=")
+        if not sep:
+            raise ValueError(f"FORECAST_ENGINE_OVERRIDES: expected region[:metric]=engine, got {item!r}")
+        region, _, metric_col = target.partition(":")
+        overrides[(region.strip(), metric_col.strip() or None)] = check_engine(engine.strip(), "FORECAST_ENGINE_OVERRIDES")
+    return overrides
+
+
+def engine_for(region, metric_col, overrides, default=FORECAST_ENGINE):
+    # Most specific wins: region:metric, then region, then the global engine
+    return overrides.get((region, metric_col), overrides.get((region, None), default))
+
+
+def fast_model(engine):
+    return "auto" if engine == "numpy" else engine
+
+
+def run_fast_forecasts(series):
+    # All NumPy-engine series are fitted together, one batch per model choice
+    results = {}
+    by_model = {}
+    for region, metric_col, df, engine in series:
+        by_model.setdefault(fast_model(engine), []).append(((region, metric_col), df))
+    for model, batch in by_model.items():
+        start = time.perf_counter()
+        try:
+            forecasts, models = fast_forecast.forecast_many(batch, FORECAST_HORIZON, model=model)
+        except Exception as e:
+            # Only this batch's series go without a forecast
+            instrumentation.inc("forecast_failures_total", len(batch), engine=model)
+            print(f"❌ NumPy engine ({model}) failed for {len(batch)} series: {e}")
             continue
+        results.update(forecasts)
+        elapsed = time.perf_counter() - start
+        instrumentation.observe("forecast_batch_seconds", elapsed, engine=model)
+        for name in models.values():
+            instrumentation.observe("forecast_fit_seconds", elapsed / len(batch), engine=name, status="batch")
+        chosen = ", ".join(f"{name}: {list(models.values()).count(name)}" for name in sorted(set(models.values())))
+        print(f"⚡ NumPy engine fitted {len(batch)} series in {(time.perf_counter() - start) * 1000:.1f} ms ({chosen})")
+    return results
+
+
+def fit_series(region, metric_col, df):
+    # Runs in a worker process, so it only touches its arguments and its own cache entry.
+    # Returns the trimmed forecast, whether it came from a cache hit, warm start or
+    # cold fit, and the seconds spent.
+    started = time.perf_counter()
+    entry = model_cache.load_entry(region, metric_col) if model_cache.MODEL_CACHE_ENABLED else None
+    status = model_cache.classify(entry, df)
 
-        df = pd.DataFrame(rows, columns=["ds", "y"])
+    if status == "hit":
+        if entry["horizon"] == FORECAST_HORIZON:
+            return model_cache.cached_forecast(entry), status, time.perf_counter() - started
+        return predict_trimmed(model_cache.cached_model(entry)), status, time.perf_counter() - started
 
+    start = time.perf_counter()
+    model = None
+    if status == "warm":
         try:
+            init = model_cache.warm_start_params(model_cache.cached_model(entry))
             model = Prophet()
-            model.fit(df)
-
-            future = model.make_future_dataframe(periods=forecast_horizon)
-            forecast = model.predict(future)
-            forecast_trimmed = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(forecast_horizon)
+            model.fit(df, init=init)
         except Exception as e:
-            print(f"❌ Forecast failed for {region} - {metric_col}: {e}")
+            # e.g. a seasonality switched on as history grew, so the parameter shapes differ
+            print(f"⚠️ Warm start failed for {region} - {metric_col} ({e}), refitting from scratch")
+            model, status = None, "cold"
+    if model is None:
+        model = Prophet()
+        model.fit(df)
+    fit_seconds = time.perf_counter() - start
+
+    forecast = predict_trimmed(model)
+    if model_cache.MODEL_CACHE_ENABLED:
+        model_cache.save_entry(region, metric_col, model, df, forecast, FORECAST_HORIZON, fit_seconds)
+    return forecast, status, time.perf_counter() - started
+
+
+def run_forecasts(series, workers=FORECAST_WORKERS):
+    cache_counts = {"hit": 0, "warm": 0, "cold": 0}
+    overrides = parse_engine_overrides()
+    order = []
+    runnable = []
+    fast = []
+    for region, metric_col, df in series:
+        if len(df) < MIN_HISTORY_DAYS:
+            print(f"⚠️ Not enough data to forecast {metric_col} for {region}. Skipping.")
             continue
+        order.append((region, metric_col))
+        engine = engine_for(region, metric_col, overrides)
+        if engine == "prophet":
+            runnable.append((region, metric_col, df))
+        else:
+            fast.append((region, metric_col, df, engine))
+
+    results = run_fast_forecasts(fast) if fast else {}
+    if not runnable:
+        return {key: results[key] for key in order if key in results}
+
+    if workers <= 1:
+        for region, metric_col, df in runnable:
+            print(f"📍 Region: {region} | Metric: {metric_col}")
+            try:
+                results[(region, metric_col)], status, seconds = fit_series(region, metric_col, df)
+                cache_counts[status] += 1
+                instrumentation.observe("forecast_fit_seconds", seconds, engine="prophet", status=status)
+            except Exception as e:
+                instrumentation.inc("forecast_failures_total", engine="prophet")
+                print(f"❌ Forecast failed for {region} - {metric_col}: {e}")
+        print_cache_counts(cache_counts)
+        return {key: results[key] for key in order if key in results}
+
+    print(f"⚙️  Fitting {len(runnable)} series across {workers} worker processes...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(fit_series, region, metric_col, df): (region, metric_col)
+            for region, metric_col, df in runnable
+        }
+        for future in as_completed(futures):
+            region, metric_col = futures[future]
+            try:
+                results[(region, metric_col)], status, seconds = future.result()
+                cache_counts[status] += 1
+                instrumentation.observe("forecast_fit_seconds", seconds, engine="prophet", status=status)
+                print(f"📍 Region: {region} | Metric: {metric_col} ✅ ({status})")
+            except Exception as e:
+                instrumentation.inc("forecast_failures_total", engine="prophet")
+                print(f"❌ Forecast failed for {region} - {metric_col}: {e}")
+    print_cache_counts(cache_counts)
+
+    # Keep the region/metric order stable regardless of completion order
+    return {key: results[key] for key in order if key in results}
+
+
+def print_cache_counts(cache_counts):
+    print(
+        f"🗃️  Model cache: {cache_counts['hit']} hits, "
+        f"{cache_counts['warm']} warm starts, {cache_counts['cold']} cold fits"
+    )
+
+
+def forecast_frame(results, created_at, nodes=None):
+    # One frame for every series, rounded and stamped once per run. Region-level
+    # results are stored under category/user_segment 'All'.
+    frames = [
+        forecast_trimmed.assign(region=region, metric=metric_col, category=ALL, user_segment=ALL)
+        for (region, metric_col), forecast_trimmed in results.items()
+    ]
+    frames += [
+        forecast_trimmed.assign(region=region, metric=metric_col, category=category, user_segment=segment)
+        for (region, metric_col, category, segment), forecast_trimmed in (nodes or {}).items()
+    ]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    return pd.DataFrame({
+        "region": df["region"],
+        "metric": df["metric"],
+        "category": df["category"],
+        "user_segment": df["user_segment"],
+        "forecast_date": df["ds"].dt.date,
+        "forecast_value": df["yhat"].round(2),
+        "lower_bound": df["yhat_lower"].round(2),
+        "upper_bound": df["yhat_upper"].round(2),
+        "created_at": created_at,
+    })
+
 
+def store_forecasts(conn, results, nodes=None):
+    # Cleanup and every series' upsert go out in one transaction
+    df = forecast_frame(results, datetime.utcnow(), nodes)
+    try:
+        with conn.cursor() as cursor:
+            print("🧹 Cleaning up old avg_order_value forecasts...")
+            cursor.execute("DELETE FROM forecast_metrics WHERE metric = 'avg_order_value'")
+
+            if not df.empty:
+                db.insert_values(cursor, """
+                    INSERT INTO forecast_metrics (
+                        region, metric, category, user_segment, forecast_date,
+                        forecast_value, lower_bound, upper_bound, created_at
+                    )
+                    VALUES %s
+                    ON CONFLICT (region, metric, category, user_segment, forecast_date) DO UPDATE
+                    SET
+                        forecast_value = EXCLUDED.forecast_value,
+                        lower_bound = EXCLUDED.lower_bound,
+                        upper_bound = EXCLUDED.upper_bound,
+                        created_at = EXCLUDED.created_at
+                """, df.itertuples(index=False, name=None))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(df)
+
+
+def summarize(results):
+    forecast_summary = []
+    for (region, metric_col), forecast_trimmed in results.items():
         summary_lines = [f"📍 {region} – {metric_col}:"]
         for _, row in forecast_trimmed.iterrows():
-            forecast_date = row['ds'].date()
-            yhat = row['yhat']
-            yhat_lower = row['yhat_lower']
-            yhat_upper = row['yhat_upper']
-
-            cursor.execute("""
-                INSERT INTO forecast_metrics (
-                    region, metric, forecast_date, forecast_value,
-                    lower_bound, upper_bound, created_at
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (region, metric, forecast_date) DO UPDATE
-                SET
-                    forecast_value = EXCLUDED.forecast_value,
-                    lower_bound = EXCLUDED.lower_bound,
-                    upper_bound = EXCLUDED.upper_bound,
-                    created_at = EXCLUDED.created_at
-            """, (
-                region, metric_col, forecast_date,
-                round(yhat, 2),
-                round(yhat_lower, 2),
-                round(yhat_upper, 2),
-                datetime.utcnow()
-            ))
-
             summary_lines.append(
-                f"{forecast_date} → {yhat:.2f} (CI: {yhat_lower:.2f} – {yhat_upper:.2f})"
+                f"{row['ds'].date()} → {row['yhat']:.2f} (CI: {row['yhat_lower']:.2f} – {row['yhat_upper']:.2f})"
             )
-
         forecast_summary.append("\n".join(summary_lines))
+    return forecast_summary
 
-conn.commit()
-cursor.close()
-conn.close()
 
-# Send daily email summary
-if forecast_summary:
-    full_summary = "\n\n".join(forecast_summary)
-    send_email_alert(
-        subject=f"✅ Forecast Summary – {datetime.utcnow().date()}",
-        body=full_summary
-    )
+def forecast_and_email(conn):
+    print("📈 Starting forecasting process...")
+    history = load_daily_metrics(conn)
+    results = run_forecasts(split_series(history))
+    nodes = {}
+    if FORECAST_HIERARCHY:
+        # Reconciled region totals replace the region-level forecasts
+        totals, nodes = hierarchical_forecast.forecast_hierarchy(conn, results, FORECAST_HORIZON)
+        results.update(totals)
+    rows = store_forecasts(conn, results, nodes)
+    print(f"💾 Stored {rows} forecast rows for {len(results) + len(nodes)} series.")
+
+    # Send daily email summary
+    forecast_summary = summarize(results)
+    if forecast_summary:
+        full_summary = "\n\n".join(forecast_summary)
+        send_email_alert(
+            subject=f"✅ Forecast Summary – {datetime.utcnow().date()}",
+            body=full_summary
+        )
+    return rows
+
+
+def main():
+    with db.connection() as conn:
+        forecast_and_email(conn)
+    instrumentation.export()
+
+    print("🏁 All forecasts complete. Email sent.")
+
 
-print("🏁 All forecasts complete. Email sent.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# hierarchical_forecast.py
+# Forecasts for the region x category x user_segment hierarchy, read from
+# order_rollups. Per region, every node (each category x segment cell, the
+# category and segment subtotals and the region total) gets a base forecast
+# from the NumPy engine in one batch, then the levels are reconciled so every
+# subtotal equals the sum of its cells.
+import os
+import numpy as np
+import pandas as pd
+import db
+import fast_forecast
+import snapshot_store
+
+# --- Configs ---
+# "bottom_up" sums the cells; "ols" and "mint" project every level's base
+# forecast onto the coherent subspace ("mint" is the diagonal/WLS variant,
+# weighting each node by its in-sample one-step error variance)
+HIERARCHY_RECONCILIATION = os.getenv("HIERARCHY_RECONCILIATION", "mint")
+HIERARCHY_MODEL = os.getenv("HIERARCHY_MODEL", "auto")
+HIERARCHY_HISTORY_DAYS = int(os.getenv("HIERARCHY_HISTORY_DAYS", 180))
+HIERARCHY_MIN_HISTORY_DAYS = int(os.getenv("HIERARCHY_MIN_HISTORY_DAYS", 14))
+METRICS = ["total_orders", "total_revenue"]
+ALL = "All"
+
+
+def load_cells(conn, since):
+    if snapshot_store.DATA_SOURCE == "snapshot":
+        rollups = snapshot_store.read_table(
+            "order_rollups", ["date", "region", "category", "user_segment", *METRICS], since=since
+        )
+        return rollups.groupby(["date", "region", "category", "user_segment"], as_index=False)[METRICS].sum()
+    # Cast each chunk's NUMERIC sums (Decimal objects) to floats as it is fetched
+    chunks = [
+        chunk.astype({metric: float for metric in METRICS})
+        for chunk in db.stream_frames(conn, """
+            SELECT date, region, category, user_segment,
+                   SUM(total_orders) AS total_orders, SUM(total_revenue) AS total_revenue
+            FROM order_rollups
+            WHERE date >= %s
+            GROUP BY date, region, category, user_segment
+        """, (since,))
+    ]
+    conn.commit()
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+
+def summing_matrix(cells):
+    # cells: [(category, segment)] -> (node keys, S) where S maps cells to nodes
+    categories = sorted({category for category, _ in cells})
+    segments = sorted({segment for _, segment in cells})
+    nodes = list(cells)
+    nodes += [(category, ALL) for category in categories]
+    nodes += [(ALL, segment) for segment in segments]
+    nodes.append((ALL, ALL))
+    S = np.array([
+        [(node_cat in (ALL, cat)) and (node_seg in (ALL, seg)) for cat, seg in cells]
+        for node_cat, node_seg in nodes
+    ], dtype=float)
+    return nodes, S
+
+
+def reconcile(S, base, variance, method=HIERARCHY_RECONCILIATION):
+    # base: nodes x horizon; returns coherent forecasts of the same shape
+    n_cells = S.shape[1]
+    if method == "bottom_up":
+        return S @ base[:n_cells]
+    if method == "ols":
+        weights = np.ones(S.shape[0])
+    elif method == "mint":
+        weights = 1 / np.maximum(variance, 1e-9)
+    else:
+        raise ValueError(f"Unknown reconciliation method: {method}")
+    SW = S.T * weights[None, :]
+    G = np.linalg.solve(SW @ S, SW)
+    return S @ (G @ base)
+
+
+def build_blocks(cells):
+    # One block per (region, metric): the node x day matrix of the region's hierarchy
+    blocks = []
+    for region, region_cells in cells.groupby("region", sort=True):
+        days = pd.date_range(region_cells["date"].min(), region_cells["date"].max(), freq="D")
+        if len(days) < HIERARCHY_MIN_HISTORY_DAYS:
+            print(f"⚠️ Not enough rollup history for the {region} hierarchy. Skipping.")
+            continue
+        for metric_col in METRICS:
+            # A cell with no orders on a day sold nothing, so gaps are zeros
+            wide = region_cells.pivot_table(
+                index="date", columns=["category", "user_segment"], values=metric_col, aggfunc="sum"
+            )
+            wide.index = pd.to_datetime(wide.index)
+            wide = wide.reindex(days, fill_value=0).fillna(0)
+            nodes, S = summing_matrix(list(wide.columns))
+            blocks.append({
+                "region": region,
+                "metric": metric_col,
+                "nodes": nodes,
+                "S": S,
+                "values": S @ wide.to_numpy(dtype=float).T,
+                "last_date": days[-1],
+            })
+    return blocks
+
+
+def stack_blocks(blocks):
+    # Right-align every block into one matrix so all nodes fit in one pass
+    width = max(block["values"].shape[1] for block in blocks)
+    Y = np.full((sum(len(block["nodes"]) for block in blocks), width), np.nan)
+    row = 0
+    for block in blocks:
+        values = block["values"]
+        Y[row:row + len(values), width - values.shape[1]:] = values
+        block["rows"] = slice(row, row + len(values))
+        row += len(values)
+    return Y
+
+
+def forecast_hierarchy(conn, region_results, horizon, since=None):
+    # region_results: {(region, metric): forecast} from the region-level engine.
+    # Those are used as the base forecast of each region-total node, and the
+    # reconciled totals are returned in their place.
+    # Returns (totals {(region, metric): df}, nodes {(region, metric, category, segment): df}).
+    since = since or (pd.Timestamp.now("UTC").normalize() - pd.Timedelta(days=HIERARCHY_HISTORY_DAYS)).date()
+    cells = load_cells(conn, since)
+    if cells.empty:
+        print("⚠️ No rollups to build the hierarchy from.")
+        return {}, {}
+    blocks = build_blocks(cells)
+    if not blocks:
+        return {}, {}
+
+    yhat, lower, upper, _, mse = fast_forecast.forecast_matrix(stack_blocks(blocks), horizon, HIERARCHY_MODEL)
+    offsets = pd.to_timedelta(np.arange(1, horizon + 1), unit="D")
+    totals, nodes = {}, {}
+    for block in blocks:
+        rows = block["rows"]
+        base, base_lower, base_upper = yhat[rows].copy(), lower[rows].copy(), upper[rows].copy()
+        dates = block["last_date"] + offsets
+
+        top = region_results.get((block["region"], block["metric"]))
+        if top is not None and len(top) == horizon and (pd.to_datetime(top["ds"]).values == dates.values).all():
+            base[-1], base_lower[-1], base_upper[-1] = top["yhat"], top["yhat_lower"], top["yhat_upper"]
+
+        coherent = reconcile(block["S"], base, mse[rows])
+        # Intervals move with their point forecast
+        shift = coherent - base
+        for i, (category, segment) in enumerate(block["nodes"]):
+            forecast = pd.DataFrame({
+                "ds": dates,
+                "yhat": coherent[i],
+                "yhat_lower": base_lower[i] + shift[i],
+                "yhat_upper": base_upper[i] + shift[i],
+            })
+            if (category, segment) == (ALL, ALL):
+                totals[(block["region"], block["metric"])] = forecast
+            else:
+                nodes[(block["region"], block["metric"], category, segment)] = forecast
+
+    print(
+        f"🌳 Forecast {sum(len(block['nodes']) for block in blocks)} hierarchy nodes "
+        f"across {len(blocks)} region/metric trees ({HIERARCHY_RECONCILIATION} reconciliation)"
+    )
+    return totals, nodes
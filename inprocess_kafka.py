@@ -0,0 +1,243 @@
+# inprocess_kafka.py
+# A small in-process stand-in for the parts of confluent_kafka's Producer and
+# Consumer that this project uses, so the producer, consumer and benchmarks can
+# run offline without a broker.
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+
+TIMESTAMP_CREATE_TIME = 1
+
+
+class TopicPartition:
+    def __init__(self, topic, partition=-1, offset=-1001):
+        self.topic = topic
+        self.partition = partition
+        self.offset = offset
+
+    def __repr__(self):
+        return f"TopicPartition({self.topic!r}, {self.partition}, {self.offset})"
+
+
+class Message:
+    __slots__ = ("_topic", "_partition", "_offset", "_key", "_value", "_headers", "_timestamp", "_latency")
+
+    def __init__(self, topic, partition, offset, key, value, headers, timestamp, latency=0.0):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._headers = headers
+        self._timestamp = timestamp
+        self._latency = latency
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def headers(self):
+        return self._headers
+
+    def timestamp(self):
+        return TIMESTAMP_CREATE_TIME, self._timestamp
+
+    def latency(self):
+        return self._latency
+
+    def error(self):
+        return None
+
+    def __len__(self):
+        return len(self._value) if self._value is not None else 0
+
+
+class _Partition:
+    def __init__(self, retention):
+        self.retention = retention
+        self.messages = []
+        self.base_offset = 0  # offset of messages[0]
+
+    def append(self, msg):
+        self.messages.append(msg)
+        # Trim in bulk so appends stay amortized O(1) and fetches can slice
+        if len(self.messages) > 2 * self.retention:
+            dropped = len(self.messages) - self.retention
+            del self.messages[:dropped]
+            self.base_offset += dropped
+
+    def high_watermark(self):
+        return self.base_offset + len(self.messages)
+
+
+class InProcessBroker:
+    # Topics are created on first use with num_partitions partitions. Each
+    # partition keeps at most retention messages, like a size-based log retention.
+
+    def __init__(self, num_partitions=1, retention=1_000_000):
+        self.num_partitions = num_partitions
+        self.retention = retention
+        self.topics = defaultdict(lambda: [_Partition(self.retention) for _ in range(self.num_partitions)])
+        self.committed = {}
+        self.cond = threading.Condition()
+
+    def partitions_for(self, topic):
+        with self.cond:
+            return len(self.topics[topic])
+
+    def append(self, topic, partition, key, value, headers):
+        with self.cond:
+            part = self.topics[topic][partition]
+            msg = Message(topic, partition, part.high_watermark(), key, value, headers, int(time.time() * 1000))
+            part.append(msg)
+            self.cond.notify_all()
+            return msg
+
+    def fetch(self, topic, partition, offset, max_messages):
+        with self.cond:
+            part = self.topics[topic][partition]
+            start = max(offset - part.base_offset, 0)
+            return part.messages[start:start + max_messages]
+
+    def watermarks(self, topic, partition):
+        with self.cond:
+            part = self.topics[topic][partition]
+            return part.base_offset, part.high_watermark()
+
+    def wait(self, timeout):
+        with self.cond:
+            self.cond.wait(timeout)
+
+
+_default_broker = InProcessBroker()
+
+
+def get_broker():
+    return _default_broker
+
+
+class Producer:
+    def __init__(self, config=None, broker=None):
+        self.config = dict(config or {})
+        self.broker = broker or _default_broker
+        self.pending = deque()
+        self.round_robin = 0
+
+    def _partition_for(self, topic, key):
+        n = self.broker.partitions_for(topic)
+        if key is not None:
+            if isinstance(key, str):
+                key = key.encode("utf-8")
+            return zlib.crc32(key) % n
+        self.round_robin = (self.round_robin + 1) % n
+        return self.round_robin
+
+    def produce(self, topic, value=None, key=None, partition=-1, on_delivery=None,
+                callback=None, timestamp=0, headers=None):
+        started = time.perf_counter()
+        if partition < 0:
+            partition = self._partition_for(topic, key)
+        msg = self.broker.append(topic, partition, key, value, headers)
+        msg._latency = time.perf_counter() - started
+        report = on_delivery or callback
+        if report is not None:
+            self.pending.append((report, msg))
+
+    def poll(self, timeout=0):
+        served = 0
+        while self.pending:
+            report, msg = self.pending.popleft()
+            report(None, msg)
+            served += 1
+        return served
+
+    def flush(self, timeout=None):
+        self.poll(0)
+        return 0
+
+    def __len__(self):
+        return len(self.pending)
+
+
+class Consumer:
+    # Behaves like the only member of its consumer group: it is assigned every
+    # partition of the subscribed topics.
+
+    def __init__(self, config=None, broker=None):
+        self.config = dict(config or {})
+        self.broker = broker or _default_broker
+        self.group = self.config.get("group.id", "")
+        self.reset = self.config.get("auto.offset.reset", "latest")
+        self.positions = {}
+        self.closed = False
+
+    def subscribe(self, topics, on_assign=None, on_revoke=None, on_lost=None):
+        assignment = []
+        for topic in topics:
+            for partition in range(self.broker.partitions_for(topic)):
+                low, high = self.broker.watermarks(topic, partition)
+                committed = self.broker.committed.get((self.group, topic, partition))
+                if committed is None:
+                    committed = low if self.reset == "earliest" else high
+                self.positions[(topic, partition)] = committed
+                assignment.append(TopicPartition(topic, partition, committed))
+        if on_assign is not None:
+            on_assign(self, assignment)
+
+    def assignment(self):
+        return [TopicPartition(topic, partition) for topic, partition in self.positions]
+
+    def consume(self, num_messages=1, timeout=-1):
+        deadline = time.monotonic() + (timeout if timeout >= 0 else 3600)
+        while True:
+            batch = []
+            for (topic, partition), offset in self.positions.items():
+                if len(batch) >= num_messages:
+                    break
+                msgs = self.broker.fetch(topic, partition, offset, num_messages - len(batch))
+                if msgs:
+                    self.positions[(topic, partition)] = msgs[-1].offset() + 1
+                    batch.extend(msgs)
+            remaining = deadline - time.monotonic()
+            if batch or remaining <= 0:
+                return batch
+            self.broker.wait(min(remaining, 0.05))
+
+    def poll(self, timeout=-1):
+        msgs = self.consume(1, timeout)
+        return msgs[0] if msgs else None
+
+    def commit(self, message=None, offsets=None, asynchronous=True):
+        if offsets is not None:
+            for tp in offsets:
+                self.broker.committed[(self.group, tp.topic, tp.partition)] = tp.offset
+        elif message is not None:
+            self.broker.committed[(self.group, message.topic(), message.partition())] = message.offset() + 1
+        else:
+            for (topic, partition), offset in self.positions.items():
+                self.broker.committed[(self.group, topic, partition)] = offset
+        return None
+
+    def position(self, partitions):
+        return [
+            TopicPartition(tp.topic, tp.partition, self.positions.get((tp.topic, tp.partition), -1001))
+            for tp in partitions
+        ]
+
+    def get_watermark_offsets(self, partition, timeout=None, cached=False):
+        return self.broker.watermarks(partition.topic, partition.partition)
+
+    def close(self):
+        self.closed = True
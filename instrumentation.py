@@ -0,0 +1,277 @@
+# instrumentation.py
+# In-process metrics for the pipeline scripts: counters, gauges and latency
+# histograms with labels, timing helpers for hot paths, and optional
+# cProfile/tracemalloc capture per stage. Everything is exported locally, as a
+# Prometheus text file and/or HTTP endpoint plus a JSON run summary, so it
+# works without any monitoring stack.
+#
+#   METRICS_FILE=metrics.prom METRICS_SUMMARY=run_summary.json python backfill_orders.py
+import bisect
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configs ---
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_FILE = os.getenv("METRICS_FILE")  # Prometheus textfile-collector output
+METRICS_SUMMARY = os.getenv("METRICS_SUMMARY")  # JSON run summary
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # serve /metrics when set
+METRICS_PREFIX = os.getenv("METRICS_PREFIX", "forecast_pipeline")
+PROFILE_STAGES = os.getenv("PROFILE_STAGES", "0") == "1"
+TRACEMALLOC_STAGES = os.getenv("TRACEMALLOC_STAGES", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Seconds; wide enough for a 1 ms query and a multi-minute Prophet batch
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+        self.started_at = datetime.utcnow()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def render_prometheus(self):
+        lines = []
+
+        def full(name):
+            return f"{METRICS_PREFIX}_{name}"
+
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in pairs) + "}"
+
+        with self.lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({name for name, _ in series}):
+                    if name in self.help:
+                        lines.append(f"# HELP {full(name)} {self.help[name]}")
+                    lines.append(f"# TYPE {full(name)} {kind}")
+                    for (metric, labels), value in sorted(series.items()):
+                        if metric == name:
+                            lines.append(f"{full(name)}{fmt_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                if name in self.help:
+                    lines.append(f"# HELP {full(name)} {self.help[name]}")
+                lines.append(f"# TYPE {full(name)} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{full(name)}_bucket{fmt_labels(labels, [('le', le)])} {cumulative}")
+                    lines.append(f"{full(name)}_sum{fmt_labels(labels)} {histogram.sum}")
+                    lines.append(f"{full(name)}_count{fmt_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        def label_key(name, labels):
+            return name + "".join(f"[{k}={v}]" for k, v in labels)
+
+        with self.lock:
+            return {
+                "started_at": self.started_at.isoformat(),
+                "finished_at": datetime.utcnow().isoformat(),
+                "counters": {label_key(*key): value for key, value in sorted(self.counters.items())},
+                "gauges": {label_key(*key): value for key, value in sorted(self.gauges.items())},
+                "histograms": {
+                    label_key(*key): {
+                        "count": h.count,
+                        "sum": round(h.sum, 6),
+                        "mean": round(h.sum / h.count, 6) if h.count else None,
+                        "p50_le": h.quantile(0.5),
+                        "p95_le": h.quantile(0.95),
+                        "p99_le": h.quantile(0.99),
+                    }
+                    for key, h in sorted(self.histograms.items(), key=lambda item: item[0])
+                },
+            }
+
+
+registry = Registry()
+
+
+# --- Recording helpers (no-ops when METRICS_ENABLED=0) ---
+
+def inc(name, value=1, **labels):
+    if METRICS_ENABLED:
+        registry.inc(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    if METRICS_ENABLED:
+        registry.set(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    if METRICS_ENABLED:
+        registry.observe(name, value, **labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    # Observes the block's wall time in seconds, whether or not it raises
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profile_stage(stage, profile=PROFILE_STAGES, trace_memory=TRACEMALLOC_STAGES):
+    # Optional per-stage cProfile dump (<PROFILE_DIR>/<stage>.prof, open with
+    # pstats or snakeviz) and tracemalloc peak / top allocation sites
+    profiler = cProfile.Profile() if profile else None
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    if trace_memory:
+        tracemalloc.reset_peak()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{stage}.prof"))
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            set_gauge("stage_traced_peak_bytes", peak, stage=stage)
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(os.path.join(PROFILE_DIR, f"{stage}.allocations.txt"), "w") as f:
+                for stat in snapshot.statistics("lineno")[:25]:
+                    f.write(f"{stat}\n")
+            if started_tracing:
+                tracemalloc.stop()
+
+
+# --- Export ---
+
+def write_prometheus(path=METRICS_FILE):
+    # Write then rename so a scraper never reads a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(registry.render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def write_summary(path=METRICS_SUMMARY):
+    with open(path, "w") as f:
+        json.dump(registry.summary(), f, indent=2)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def serve(port=METRICS_PORT):
+    # Background /metrics endpoint; a second call in the same process is a no-op
+    global _server
+    if not port or _server is not None:
+        return _server
+    _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    print(f"📡 Serving metrics on :{port}/metrics")
+    return _server
+
+
+def export():
+    # Called at the end of a run; writes whichever outputs are configured
+    if METRICS_FILE:
+        write_prometheus(METRICS_FILE)
+    if METRICS_SUMMARY:
+        write_summary(METRICS_SUMMARY)
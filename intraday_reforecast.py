@@ -0,0 +1,198 @@
+# intraday_reforecast.py
+# Watches running same-day totals from the order stream against today's stored
+# forecast band for each (region, metric). Bands and the typical intraday
+# order curve are loaded once per day, so each event costs a couple of
+# multiplications and comparisons. Only series whose projected full-day actual
+# leaves its band (widened by INTRADAY_MARGIN) are refit and re-stored, with
+# the NumPy engine so a refit does not stall the consumer loop it runs in.
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import fast_forecast
+
+# --- Configs ---
+INTRADAY_MARGIN = float(os.getenv("INTRADAY_MARGIN", 0.10))
+# Projections from the first part of the day are too noisy to act on
+INTRADAY_MIN_DAY_SHARE = float(os.getenv("INTRADAY_MIN_DAY_SHARE", 0.25))
+INTRADAY_COOLDOWN_SECONDS = float(os.getenv("INTRADAY_COOLDOWN_SECONDS", 1800))
+INTRADAY_PROFILE_DAYS = int(os.getenv("INTRADAY_PROFILE_DAYS", 28))
+# "numpy" (fast_forecast picks a model per series) or a fast_forecast model name
+INTRADAY_ENGINE = os.getenv("INTRADAY_ENGINE", "numpy")
+METRICS = ["total_orders", "total_revenue"]
+
+
+def load_bands(cursor, day):
+    cursor.execute("""
+        SELECT region, metric, lower_bound, upper_bound FROM forecast_metrics
+        WHERE forecast_date = %s AND metric = ANY(%s)
+          AND category = 'All' AND user_segment = 'All'
+    """, (day, METRICS))
+    return {(region, metric): (float(lower), float(upper)) for region, metric, lower, upper in cursor.fetchall()}
+
+
+def load_day_profile(cursor, day):
+    # Per region, the share of a day's orders placed by the start of each hour
+    # (25 points, 0.0 ... 1.0), from recent rollups
+    cursor.execute("""
+        SELECT region, hour, SUM(total_orders) FROM order_rollups
+        WHERE date >= %s AND date < %s
+        GROUP BY region, hour
+    """, (day - timedelta(days=INTRADAY_PROFILE_DAYS), day))
+    hourly = defaultdict(lambda: np.zeros(24))
+    for region, hour, orders in cursor.fetchall():
+        hourly[region][hour] = float(orders)
+    profiles = {}
+    for region, counts in hourly.items():
+        if counts.sum() > 0:
+            profiles[region] = np.concatenate([[0.0], np.cumsum(counts) / counts.sum()])
+    return profiles
+
+
+def load_running_totals(cursor, day):
+    cursor.execute("""
+        SELECT region, COUNT(*), COALESCE(SUM(total_price), 0) FROM orders
+        WHERE timestamp >= %s AND timestamp < %s
+        GROUP BY region
+    """, (day, day + timedelta(days=1)))
+    totals = defaultdict(float)
+    for region, orders, revenue in cursor.fetchall():
+        totals[(region, "total_orders")] = float(orders)
+        totals[(region, "total_revenue")] = float(revenue)
+    return totals
+
+
+class BandMonitor:
+    def __init__(self, margin=INTRADAY_MARGIN, min_share=INTRADAY_MIN_DAY_SHARE,
+                 cooldown=INTRADAY_COOLDOWN_SECONDS):
+        # Fail at consumer startup, not at the first breach
+        fast_forecast.check_model("auto" if INTRADAY_ENGINE == "numpy" else INTRADAY_ENGINE)
+        self.margin = margin
+        self.min_share = min_share
+        self.cooldown = cooldown
+        self.day = None
+        self.bands = {}
+        self.profiles = {}
+        self.totals = defaultdict(float)
+        self.breached = {}  # (region, metric) -> projected full-day actual
+        self.last_refit = {}
+        self.stale = True
+
+    def load(self, conn, day=None):
+        day = day or datetime.utcnow().date()
+        with conn.cursor() as cursor:
+            bands = load_bands(cursor, day)
+            self.profiles = load_day_profile(cursor, day)
+            self.totals = load_running_totals(cursor, day)
+        conn.commit()
+        # Widen once here so the per-event check is two comparisons
+        self.bands = {
+            key: (lower * (1 - self.margin), upper * (1 + self.margin))
+            for key, (lower, upper) in bands.items()
+        }
+        if day != self.day:
+            self.breached.clear()
+            self.last_refit.clear()
+        self.day = day
+        self.stale = False
+        print(f"🎯 Intraday monitor watching {len(self.bands)} forecast bands for {day}")
+
+    def expected_share(self, region, timestamp):
+        hour_fraction = timestamp.hour + timestamp.minute / 60
+        profile = self.profiles.get(region)
+        if profile is None:
+            return hour_fraction / 24
+        hour = int(hour_fraction)
+        return profile[hour] + (profile[hour + 1] - profile[hour]) * (hour_fraction - hour)
+
+    def add(self, timestamp, region, total_price):
+        day = timestamp.date()
+        if day != self.day:
+            # A new day needs fresh bands; late events for past days are ignored
+            if self.day is None or day > self.day:
+                self.stale = True
+            return
+        orders_key, revenue_key = (region, "total_orders"), (region, "total_revenue")
+        self.totals[orders_key] += 1
+        self.totals[revenue_key] += float(total_price)
+        share = self.expected_share(region, timestamp)
+        if share < self.min_share:
+            return
+        self._check(orders_key, share)
+        self._check(revenue_key, share)
+
+    def add_rows(self, rows):
+        for timestamp, region, total_price, *_ in rows:
+            self.add(timestamp, region, total_price)
+
+    def _check(self, key, share):
+        band = self.bands.get(key)
+        if band is None:
+            return
+        total = self.totals[key]
+        if band[0] * share <= total <= band[1] * share:
+            return
+        if key not in self.breached and time.monotonic() - self.last_refit.get(key, -self.cooldown) < self.cooldown:
+            return
+        self.breached[key] = total / share
+
+    def due(self):
+        return self.stale or bool(self.breached)
+
+    def reforecast(self, conn):
+        if self.stale:
+            self.load(conn)
+            return 0
+        if not self.breached:
+            return 0
+        projections, self.breached = self.breached, {}
+        for key, projected in projections.items():
+            region, metric = key
+            print(f"🚨 {region} {metric} projected at {projected:,.2f}, outside today's band; refitting")
+        refit_series(conn, projections, self.day)
+        now = time.monotonic()
+        for key in projections:
+            self.last_refit[key] = now
+        self.load(conn, self.day)
+        return len(projections)
+
+
+def refit_series(conn, projections, day):
+    # Refit only the breached series, with today's projected total as the
+    # latest observation, and move today's band to the projection
+    from forecast_and_store import (
+        MIN_HISTORY_DAYS, load_daily_metrics, run_fast_forecasts, split_series, store_forecasts,
+    )
+
+    regions = sorted({region for region, _ in projections})
+    metrics = sorted({metric for _, metric in projections})
+    history = load_daily_metrics(conn, regions, metrics)
+    series = []
+    for region, metric_col, df in split_series(history, regions, metrics):
+        projected = projections.get((region, metric_col))
+        if projected is None:
+            continue
+        df = pd.concat([df[df["ds"] < day], pd.DataFrame({"ds": [day], "y": [projected]})], ignore_index=True)
+        if len(df) < MIN_HISTORY_DAYS:
+            print(f"⚠️ Not enough data to refit {metric_col} for {region}. Skipping.")
+            continue
+        series.append((region, metric_col, df, INTRADAY_ENGINE))
+
+    results = run_fast_forecasts(series) if series else {}
+    rows = store_forecasts(conn, results)
+    with conn.cursor() as cursor:
+        for (region, metric_col), projected in projections.items():
+            cursor.execute("""
+                UPDATE forecast_metrics
+                SET forecast_value = %(projected)s,
+                    lower_bound = %(projected)s - (forecast_value - lower_bound),
+                    upper_bound = %(projected)s + (upper_bound - forecast_value),
+                    created_at = NOW()
+                WHERE region = %(region)s AND metric = %(metric)s AND forecast_date = %(day)s
+                  AND category = 'All' AND user_segment = 'All'
+            """, {"projected": round(projected, 2), "region": region, "metric": metric_col, "day": day})
+    conn.commit()
+    print(f"💾 Re-stored {rows} forecast rows for {len(results)} breached series")
+    return rows
@@ -0,0 +1,86 @@
+# model_cache.py
+import hashlib
+import json
+import os
+from datetime import datetime
+import pandas as pd
+from prophet.serialize import model_to_json, model_from_json
+
+# --- Configs ---
+MODEL_CACHE_ENABLED = os.getenv("MODEL_CACHE", "1") == "1"
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", ".model_cache")
+
+
+def data_hash(df):
+    # Hash of the training frame exactly as Prophet sees it
+    payload = df[["ds", "y"]].to_csv(index=False, date_format="%Y-%m-%d").encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def cache_path(region, metric):
+    return os.path.join(MODEL_CACHE_DIR, f"{region}__{metric}.json")
+
+
+def load_entry(region, metric):
+    try:
+        with open(cache_path(region, metric)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_entry(region, metric, model, df, forecast, horizon, fit_seconds):
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    entry = {
+        "region": region,
+        "metric": metric,
+        "data_hash": data_hash(df),
+        # The newest day is usually still partial when the model is fitted, so
+        # warm starts match on everything before it
+        "prefix_hash": data_hash(df.head(len(df) - 1)),
+        "n_rows": len(df),
+        "horizon": horizon,
+        "fitted_at": datetime.utcnow().isoformat(),
+        "fit_seconds": round(fit_seconds, 3),
+        "model": model_to_json(model),
+        "forecast": forecast.assign(ds=forecast["ds"].dt.strftime("%Y-%m-%d")).to_dict(orient="list"),
+    }
+    # Write then rename so a crashed run never leaves a truncated entry behind
+    path = cache_path(region, metric)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+
+
+def classify(entry, df):
+    # "hit" when the data is unchanged, "warm" when only the last cached row
+    # (a partial day that has since grown) changed and/or rows were appended
+    if entry is None:
+        return "cold"
+    n_rows = entry["n_rows"]
+    if len(df) == n_rows and data_hash(df) == entry["data_hash"]:
+        return "hit"
+    if len(df) >= n_rows and data_hash(df.head(n_rows - 1)) == entry.get("prefix_hash"):
+        return "warm"
+    return "cold"
+
+
+def cached_model(entry):
+    return model_from_json(entry["model"])
+
+
+def cached_forecast(entry):
+    forecast = pd.DataFrame(entry["forecast"])
+    forecast["ds"] = pd.to_datetime(forecast["ds"])
+    return forecast
+
+
+def warm_start_params(model):
+    # Previous optimum in the shape Prophet.fit(init=...) expects
+    params = {}
+    for name in ["k", "m", "sigma_obs"]:
+        params[name] = model.params[name][0][0]
+    for name in ["delta", "beta"]:
+        params[name] = model.params[name][0]
+    return params
@@ -0,0 +1,215 @@
+# order_codec.py
+# Wire formats for order events. "json" is the original payload; "bin1" is a
+# fixed 42-byte little-endian record with epoch-micros timestamps, dictionary-coded
+# strings and prices in cents. The codec travels in the "codec" message header;
+# messages without one are treated as JSON.
+import json
+import os
+import struct
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from order_generator import ORDER_COLUMNS, REGIONS, CATEGORIES, DEVICE_TYPES, USER_SEGMENTS
+
+JSON = "json"
+BINARY = "bin1"
+CODEC_HEADER = "codec"
+ORDER_CODEC = os.getenv("ORDER_CODEC", JSON)
+
+# Dictionaries are part of the bin1 format: only ever append to them
+PRODUCTS = ['SKU-001', 'SKU-002', 'SKU-003', 'SKU-004']
+DICTIONARIES = {
+    "region": REGIONS,
+    "product_id": PRODUCTS,
+    "category": CATEGORIES,
+    "user_segment": USER_SEGMENTS,
+    "device_type": DEVICE_TYPES,
+}
+MISSING_CODE = 255
+
+RECORD_DTYPE = np.dtype([
+    ("ts_us", "<i8"),
+    ("order_id", "S10"),
+    ("user_id", "S8"),
+    ("region", "u1"),
+    ("product_id", "u1"),
+    ("category", "u1"),
+    ("user_segment", "u1"),
+    ("device_type", "u1"),
+    ("quantity", "u1"),
+    ("unit_price", "<i4"),
+    ("total_price", "<i4"),
+    ("promo_applied", "u1"),
+    ("hour", "u1"),
+])
+RECORD = struct.Struct("<q10s8s6Bii2B")
+assert RECORD.size == RECORD_DTYPE.itemsize
+
+_CODE_LOOKUP = {name: {value: code for code, value in enumerate(values)} for name, values in DICTIONARIES.items()}
+_VALUE_ARRAYS = {name: np.array(values + [None] * (256 - len(values)), dtype=object) for name, values in DICTIONARIES.items()}
+# JSON fields that must hold numbers; quantity and hour must also be whole
+NUMERIC_FIELDS = ["quantity", "unit_price", "total_price", "hour"]
+INTEGER_FIELDS = ["quantity", "hour"]
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+
+
+def headers_for(codec):
+    return [(CODEC_HEADER, codec.encode("ascii"))]
+
+
+def codec_of(msg):
+    for key, value in msg.headers() or []:
+        if key == CODEC_HEADER:
+            return value.decode("ascii")
+    return JSON
+
+
+# --- Encoding ---
+
+def _code(name, value):
+    return _CODE_LOOKUP[name].get(value, MISSING_CODE)
+
+
+def encode_order(order, codec=ORDER_CODEC):
+    if codec == JSON:
+        return json.dumps(order).encode("utf-8")
+    timestamp = order["timestamp"]
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    hour = order.get("hour")
+    return RECORD.pack(
+        (timestamp - _EPOCH) // _US,
+        order["order_id"][4:].encode("ascii"),
+        order["user_id"][5:].encode("ascii"),
+        _code("region", order["region"]),
+        _code("product_id", order["product_id"]),
+        _code("category", order.get("category")),
+        _code("user_segment", order.get("user_segment")),
+        _code("device_type", order["device_type"]),
+        order["quantity"],
+        round(order["unit_price"] * 100),
+        round(order["total_price"] * 100),
+        bool(order["promo_applied"]),
+        MISSING_CODE if hour is None else hour,
+    )
+
+
+def _codes(name, column):
+    return pd.Categorical(column, categories=DICTIONARIES[name]).codes.astype("u1", copy=False)
+
+
+def encode_frame(orders, codec=ORDER_CODEC):
+    # Encodes a generator frame into one payload per row
+    if codec == JSON:
+        records = orders.assign(timestamp=orders["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%S.%f"))
+        return [json.dumps(record).encode("utf-8") for record in records.to_dict(orient="records")]
+
+    records = np.empty(len(orders), dtype=RECORD_DTYPE)
+    records["ts_us"] = orders["timestamp"].values.astype("datetime64[us]").astype("<i8")
+    records["order_id"] = orders["order_id"].str.slice(4).values.astype("S10")
+    records["user_id"] = orders["user_id"].str.slice(5).values.astype("S8")
+    for name in DICTIONARIES:
+        records[name] = _codes(name, orders[name])  # -1 (unknown) wraps to 255
+    records["quantity"] = orders["quantity"].values
+    records["unit_price"] = np.rint(orders["unit_price"].values * 100)
+    records["total_price"] = np.rint(orders["total_price"].values * 100)
+    records["promo_applied"] = orders["promo_applied"].values
+    records["hour"] = orders["hour"].values
+    buf = records.tobytes()
+    size = RECORD_DTYPE.itemsize
+    return [buf[i:i + size] for i in range(0, len(buf), size)]
+
+
+# --- Decoding ---
+
+def decode_records(buffer):
+    # Zero-copy view of packed bin1 records as columns
+    records = np.frombuffer(buffer, dtype=RECORD_DTYPE)
+    hour = pd.array(records["hour"], dtype="Int64")
+    hour[records["hour"] == MISSING_CODE] = pd.NA
+    columns = {
+        "order_id": np.char.add("ORD-", records["order_id"].astype("U10")),
+        "timestamp": records["ts_us"].astype("datetime64[us]"),
+        "user_id": np.char.add("USER-", records["user_id"].astype("U8")),
+        "quantity": records["quantity"].astype("int64"),
+        "unit_price": records["unit_price"] / 100,
+        "total_price": records["total_price"] / 100,
+        "promo_applied": records["promo_applied"].astype(bool),
+        "hour": hour,
+    }
+    for name in DICTIONARIES:
+        columns[name] = _VALUE_ARRAYS[name][records[name]]
+    return pd.DataFrame(columns, columns=ORDER_COLUMNS)
+
+
+def decode_json(payloads):
+    # Messages that are not JSON objects, or whose fields do not validate, are
+    # logged and dropped so the rest of the batch (and its offsets) goes through
+    records = []
+    for payload in payloads:
+        try:
+            record = json.loads(bytes(payload).decode("utf-8"))
+        except ValueError as e:
+            print("⚠️ Skipping undecodable message:", e)
+            continue
+        if not isinstance(record, dict):
+            print(f"⚠️ Skipping message that is not a JSON object: {type(record).__name__}")
+            continue
+        records.append(record)
+    orders = pd.DataFrame.from_records(records).reindex(columns=ORDER_COLUMNS)
+    if orders.empty:
+        return orders
+
+    valid = orders["order_id"].map(lambda value: isinstance(value, str))
+    valid &= orders["timestamp"].map(_is_timestamp)
+    for column in NUMERIC_FIELDS:
+        raw = orders[column]
+        numbers = pd.to_numeric(raw, errors="coerce")
+        valid &= raw.isna() | numbers.notna()
+        if column in INTEGER_FIELDS:
+            valid &= numbers.isna() | (numbers % 1 == 0)
+        orders[column] = numbers
+    valid &= orders["total_price"].notna()
+    if not valid.all():
+        for order_id in orders.loc[~valid, "order_id"]:
+            print(f"⚠️ Skipping invalid order message: {order_id!r}")
+        orders = orders[valid].reset_index(drop=True)
+    for column in INTEGER_FIELDS:
+        orders[column] = orders[column].astype("Int64")
+    return orders
+
+
+def _is_timestamp(value):
+    if not isinstance(value, str):
+        return False
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def decode_batch(payloads):
+    # payloads: [(codec, bytes | memoryview)]. Binary payloads are concatenated
+    # once and viewed in place; JSON ones go through json.loads.
+    binary = [value for codec, value in payloads if codec == BINARY and len(value) == RECORD_DTYPE.itemsize]
+    if len(binary) < sum(1 for codec, _ in payloads if codec == BINARY):
+        print("⚠️ Skipping binary messages with an unexpected record size")
+    text = [value for codec, value in payloads if codec != BINARY]
+    frames = []
+    if binary:
+        frames.append(decode_records(b"".join(binary)))
+    if text:
+        frames.append(decode_json(text))
+    if not frames:
+        return pd.DataFrame(columns=ORDER_COLUMNS)
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def decode_order(codec, payload):
+    if codec == BINARY:
+        order = decode_records(payload).to_dict(orient="records")[0]
+        return {col: (None if pd.isna(value) else value) for col, value in order.items()}
+    order = json.loads(bytes(payload).decode("utf-8"))
+    return {col: order.get(col) for col in ORDER_COLUMNS}
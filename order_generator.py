@@ -0,0 +1,121 @@
+# order_generator.py
+import os
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+
+# --- Configs ---
+REGIONS = ['Northeast', 'Midwest', 'South', 'West']
+PRODUCT_IDS = ['SKU-001', 'SKU-002', 'SKU-003']
+CATEGORIES = ['Electronics', 'Clothing', 'Books', 'Home Goods', 'Toys']
+DEVICE_TYPES = ['mobile', 'desktop', 'tablet']
+USER_SEGMENTS = ['new_user', 'returning', 'VIP', 'guest']
+
+# Optional seed so simulations and backfills are reproducible
+ORDER_SEED = os.getenv("ORDER_SEED")
+
+ORDER_COLUMNS = [
+    "order_id", "timestamp", "product_id", "category", "user_id", "user_segment",
+    "region", "quantity", "unit_price", "total_price", "device_type", "promo_applied", "hour"
+]
+
+
+def make_rng(seed=None):
+    if seed is None and ORDER_SEED is not None:
+        seed = int(ORDER_SEED)
+    return np.random.default_rng(seed)
+
+
+# Volume rules shared by the daily simulation and backfills
+def holidays_for(year):
+    return [
+        date(year, 1, 1),    # New Year's
+        date(year, 7, 4),    # Independence Day
+        date(year, 12, 25),  # Christmas
+    ]
+
+
+def is_holiday(day):
+    return day in holidays_for(day.year)
+
+
+def is_promo_day(day):
+    return day.day == 10  # Every 10th of the month is a fake sale
+
+
+def orders_for_day(day):
+    if is_holiday(day):
+        return 100
+    if is_promo_day(day):
+        return 1000
+    if day.weekday() >= 5:  # Saturday/Sunday
+        return 300
+    return 500
+
+
+def _hex_ids(rng, n, prefix, n_hex):
+    # n_hex random hex characters per id, built from one bytes draw instead of n uuid4() calls
+    raw = rng.bytes(n * n_hex // 2).hex().encode("ascii")
+    ids = np.frombuffer(raw, dtype=f"S{n_hex}").astype(f"U{n_hex}")
+    return np.char.add(prefix, ids)
+
+
+def _choice(rng, choices, n):
+    return pd.Categorical.from_codes(rng.integers(0, len(choices), n), categories=choices)
+
+
+def generate_orders(n, day=None, rng=None, product_ids=PRODUCT_IDS, promo_applied=None):
+    # N orders as columns. With a day, timestamps are spread uniformly over it;
+    # without one they are left empty for the caller to stamp (live streams).
+    # promo_applied=None draws it at random, otherwise it is fixed for every row.
+    rng = rng if rng is not None else make_rng()
+
+    if day is not None:
+        seconds = rng.integers(0, 24 * 60 * 60, n)
+        timestamps = pd.Timestamp(day).normalize() + pd.to_timedelta(seconds, unit="s")
+        hours = seconds // 3600
+    else:
+        timestamps = pd.NaT
+        hours = np.full(n, -1)
+
+    quantity = rng.integers(1, 6, n)
+    unit_price = np.round(rng.uniform(10, 100, n), 2)
+    if promo_applied is None:
+        promo = rng.random(n) < 0.5
+    else:
+        promo = np.full(n, bool(promo_applied))
+
+    return pd.DataFrame({
+        "order_id": _hex_ids(rng, n, "ORD-", 10),
+        "timestamp": timestamps,
+        "product_id": _choice(rng, product_ids, n),
+        "category": _choice(rng, CATEGORIES, n),
+        "user_id": _hex_ids(rng, n, "USER-", 8),
+        "user_segment": _choice(rng, USER_SEGMENTS, n),
+        "region": _choice(rng, REGIONS, n),
+        "quantity": quantity,
+        "unit_price": unit_price,
+        "total_price": np.round(quantity * unit_price, 2),
+        "device_type": _choice(rng, DEVICE_TYPES, n),
+        "promo_applied": promo,
+        "hour": hours,
+    }, columns=ORDER_COLUMNS)
+
+
+def generate_day(day, rng=None, n=None, promo_applied=None):
+    # A day's orders following the weekday/holiday/promo volume rules
+    if isinstance(day, datetime):
+        day = day.date()
+    n = orders_for_day(day) if n is None else n
+    if promo_applied is None:
+        promo_applied = is_promo_day(day)
+    return generate_orders(n, day=day, rng=rng, promo_applied=promo_applied)
+
+
+def iter_order_chunks(total, chunk_size=10_000, rng=None, **kwargs):
+    rng = rng if rng is not None else make_rng()
+    remaining = total
+    while remaining > 0:
+        n = min(chunk_size, remaining)
+        yield generate_orders(n, rng=rng, **kwargs)
+        remaining -= n
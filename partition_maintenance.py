@@ -0,0 +1,197 @@
+# partition_maintenance.py
+# Keeps the monthly orders partitions in shape: creates partitions ahead of
+# today (and for any month that has spilled into orders_default), and retires
+# partitions that fall out of the retention window. --migrate converts a
+# pre-partitioning orders table in place.
+import os
+import re
+import sys
+from datetime import date, datetime
+from dotenv import load_dotenv
+import db
+from order_generator import ORDER_COLUMNS
+
+load_dotenv()
+
+# --- Configs ---
+PARTITION_MONTHS_AHEAD = int(os.getenv("ORDERS_PARTITION_MONTHS_AHEAD", 3))
+# 0 keeps every partition; otherwise months older than this are retired
+RETENTION_MONTHS = int(os.getenv("ORDERS_RETENTION_MONTHS", 0))
+# "detach" leaves the old partition as a standalone table; "drop" deletes it
+RETENTION_ACTION = os.getenv("ORDERS_RETENTION_ACTION", "detach")
+
+PARTITION_NAME = re.compile(r"^orders_p(\d{4})(\d{2})$")
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"orders_p{month:%Y%m}"
+
+
+def orders_kind(cursor):
+    # "p" for a partitioned table, "r" for a plain one, None if missing
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('orders')")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def is_partitioned(cursor):
+    return orders_kind(cursor) == "p"
+
+
+def existing_partitions(cursor):
+    # {month: table name} for the monthly partitions currently attached
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'orders'::regclass
+    """)
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def create_partition(cursor, month):
+    # Built standalone and attached afterwards so rows for this month that are
+    # sitting in orders_default can be moved across first
+    name = partition_name(month)
+    low, high = month, add_months(month, 1)
+    cursor.execute(f"CREATE TABLE {name} (LIKE orders INCLUDING DEFAULTS)")
+    cursor.execute(f"""
+        WITH moved AS (
+            DELETE FROM orders_default
+            WHERE timestamp >= %(low)s AND timestamp < %(high)s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, {"low": low, "high": high})
+    moved = cursor.rowcount
+    cursor.execute(f"""
+        ALTER TABLE orders ATTACH PARTITION {name}
+        FOR VALUES FROM (%(low)s) TO (%(high)s)
+    """, {"low": low, "high": high})
+    return moved
+
+
+def default_months(cursor):
+    cursor.execute("SELECT DISTINCT date_trunc('month', timestamp)::DATE FROM orders_default")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def ensure_partitions(cursor, first_day, last_day):
+    # Every month from first_day to last_day, plus any month found in orders_default
+    existing = existing_partitions(cursor)
+    months = set()
+    month = month_start(first_day)
+    while month <= last_day:
+        months.add(month)
+        month = add_months(month, 1)
+    months |= default_months(cursor)
+
+    created = 0
+    for month in sorted(months - set(existing)):
+        moved = create_partition(cursor, month)
+        created += 1
+        note = f" ({moved:,} rows moved out of orders_default)" if moved else ""
+        print(f"🧱 Created partition {partition_name(month)}{note}")
+    return created
+
+
+def apply_retention(cursor, today, retention_months=RETENTION_MONTHS, action=RETENTION_ACTION):
+    if retention_months <= 0:
+        return 0
+    cutoff = add_months(month_start(today), -retention_months)
+    retired = 0
+    for month, name in sorted(existing_partitions(cursor).items()):
+        if month >= cutoff:
+            continue
+        cursor.execute(f"ALTER TABLE orders DETACH PARTITION {name}")
+        if action == "drop":
+            cursor.execute(f"DROP TABLE {name}")
+            print(f"🗑️  Dropped partition {name}")
+        else:
+            print(f"📤 Detached partition {name}")
+        retired += 1
+    return retired
+
+
+def run_maintenance(conn, today=None):
+    today = today or datetime.utcnow().date()
+    with conn.cursor() as cursor:
+        if not is_partitioned(cursor):
+            print("⚠️ orders is not partitioned yet; run with --migrate first.")
+            return 0
+        created = ensure_partitions(cursor, month_start(today), add_months(month_start(today), PARTITION_MONTHS_AHEAD))
+        retired = apply_retention(cursor, today)
+    conn.commit()
+    return created + retired
+
+
+def migrate_legacy(conn, drop_legacy=False):
+    # Renames a plain orders table to orders_legacy, recreates orders from
+    # postgres_init.sql as a partitioned table and copies the rows across,
+    # keeping their ingest_seq so the aggregation watermark stays valid.
+    with conn.cursor() as cursor:
+        kind = orders_kind(cursor)
+        if kind != "r":
+            if kind == "p":
+                print("✅ orders is already partitioned.")
+            return 0
+        cursor.execute("ALTER TABLE orders RENAME TO orders_legacy")
+        for index in ("orders_pkey", "orders_ingest_seq_idx", "orders_region_timestamp_idx", "orders_timestamp_brin_idx"):
+            cursor.execute(f"ALTER INDEX IF EXISTS {index} RENAME TO {index.replace('orders', 'orders_legacy', 1)}")
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "postgres_init.sql")) as f:
+            cursor.execute(f.read())
+
+        cursor.execute("SELECT MIN(timestamp)::DATE, MAX(timestamp)::DATE FROM orders_legacy")
+        first_day, last_day = cursor.fetchone()
+        if first_day is not None:
+            ensure_partitions(cursor, first_day, last_day)
+
+        columns = ", ".join(ORDER_COLUMNS + ["ingest_seq"])
+        cursor.execute(f"""
+            INSERT INTO orders ({columns})
+            SELECT {columns} FROM orders_legacy
+            WHERE timestamp IS NOT NULL
+            ON CONFLICT (order_id, timestamp) DO NOTHING
+        """)
+        migrated = cursor.rowcount
+        cursor.execute("""
+            SELECT setval(pg_get_serial_sequence('orders', 'ingest_seq'), GREATEST(MAX(ingest_seq), 1))
+            FROM orders
+        """)
+        cursor.execute("SELECT COUNT(*) FROM orders_legacy WHERE timestamp IS NULL")
+        skipped = cursor.fetchone()[0]
+        if drop_legacy:
+            cursor.execute("DROP TABLE orders_legacy")
+    conn.commit()
+
+    print(f"🚚 Migrated {migrated:,} orders into the partitioned table.")
+    if skipped:
+        print(f"⚠️ {skipped:,} orders without a timestamp were not migrated.")
+    return migrated
+
+
+def main():
+    args = sys.argv[1:]
+    with db.connection() as conn:
+        if "--migrate" in args:
+            migrate_legacy(conn, drop_legacy="--drop-legacy" in args)
+        changed = run_maintenance(conn)
+    print(f"✅ Partition maintenance complete ({changed} partitions created or retired).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
--- orders table
+-- orders table, range-partitioned by month on timestamp. Monthly partitions
+-- (orders_pYYYYMM) are created ahead of time and retired by
+-- partition_maintenance.py; rows outside every partition land in orders_default.
+-- Unique keys on a partitioned table must include the partition key, hence
+-- PRIMARY KEY (order_id, timestamp).
 CREATE TABLE IF NOT EXISTS orders (
-  order_id VARCHAR PRIMARY KEY,
-  timestamp TIMESTAMP,
+  order_id VARCHAR NOT NULL,
+  timestamp TIMESTAMP NOT NULL,
   product_id VARCHAR,
   user_id VARCHAR,
   region VARCHAR,
@@ -9,8 +13,35 @@ CREATE TABLE IF NOT EXISTS orders (
   unit_price NUMERIC,
   total_price NUMERIC,
   device_type VARCHAR,
-  promo_applied BOOLEAN
-);
+  promo_applied BOOLEAN,
+  ingest_seq BIGSERIAL,
+  category VARCHAR,
+  user_segment VARCHAR,
+  hour INT,
+  PRIMARY KEY (order_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Databases created before partitioning keep a plain orders table until
+-- `python partition_maintenance.py --migrate` moves them over
+DO $$
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'orders'::regclass) = 'p' THEN
+    CREATE TABLE IF NOT EXISTS orders_default PARTITION OF orders DEFAULT;
+  END IF;
+END
+$$;
+
+-- columns added after the original schema (no-ops on a partitioned table)
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS category VARCHAR;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS user_segment VARCHAR;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS hour INT;
+
+-- ingest_seq is the high-water mark used by incremental aggregation
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS ingest_seq BIGSERIAL;
+CREATE INDEX IF NOT EXISTS orders_ingest_seq_idx ON orders (ingest_seq);
+-- Indexes on the parent cascade to every partition
+CREATE INDEX IF NOT EXISTS orders_region_timestamp_idx ON orders (region, timestamp);
+CREATE INDEX IF NOT EXISTS orders_timestamp_brin_idx ON orders USING BRIN (timestamp);
 
 -- daily metrics
 CREATE TABLE IF NOT EXISTS daily_metrics (
@@ -23,14 +54,148 @@ CREATE TABLE IF NOT EXISTS daily_metrics (
   PRIMARY KEY (date, region)
 );
 
--- forecasted metrics
+-- forecasted metrics; category/user_segment are 'All' for region-level rows
+-- and set for the hierarchy written by hierarchical_forecast.py
 CREATE TABLE IF NOT EXISTS forecast_metrics (
   region VARCHAR,
   metric VARCHAR,
+  category VARCHAR NOT NULL DEFAULT 'All',
+  user_segment VARCHAR NOT NULL DEFAULT 'All',
   forecast_date DATE,
   forecast_value NUMERIC,
   lower_bound NUMERIC,
   upper_bound NUMERIC,
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-  PRIMARY KEY (region, metric, forecast_date)
+  PRIMARY KEY (region, metric, category, user_segment, forecast_date)
+);
+
+ALTER TABLE forecast_metrics ADD COLUMN IF NOT EXISTS category VARCHAR NOT NULL DEFAULT 'All';
+ALTER TABLE forecast_metrics ADD COLUMN IF NOT EXISTS user_segment VARCHAR NOT NULL DEFAULT 'All';
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_index i
+    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+    WHERE i.indrelid = 'forecast_metrics'::regclass AND i.indisprimary AND a.attname = 'category'
+  ) THEN
+    ALTER TABLE forecast_metrics DROP CONSTRAINT IF EXISTS forecast_metrics_pkey;
+    ALTER TABLE forecast_metrics ADD PRIMARY KEY (region, metric, category, user_segment, forecast_date);
+  END IF;
+END
+$$;
+
+-- watermarks for incremental pipeline jobs
+CREATE TABLE IF NOT EXISTS pipeline_state (
+  name VARCHAR PRIMARY KEY,
+  watermark BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- days already loaded by backfill_orders.py, so reruns resume where they stopped
+CREATE TABLE IF NOT EXISTS backfill_progress (
+  seed BIGINT,
+  day DATE,
+  rows INT,
+  loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (seed, day)
+);
+
+-- dashboard rollups at (date, hour, region, category, user_segment) grain,
+-- maintained by aggregate_daily_metrics.py
+CREATE TABLE IF NOT EXISTS order_rollups (
+  date DATE,
+  hour INT,
+  region VARCHAR,
+  category VARCHAR,
+  user_segment VARCHAR,
+  total_orders INT,
+  total_revenue NUMERIC,
+  PRIMARY KEY (region, date, hour, category, user_segment)
+);
+
+-- live deltas appended by the Kafka consumer (daily_rollups.py) in the same
+-- transaction as their orders; aggregate_daily_metrics.py deletes a (date, region)
+-- group's rows when it recomputes that group. Readers add them to the batch tables.
+CREATE TABLE IF NOT EXISTS live_rollups (
+  date DATE,
+  hour INT,
+  region VARCHAR,
+  category VARCHAR,
+  user_segment VARCHAR,
+  total_orders INT,
+  total_revenue NUMERIC
+);
+CREATE INDEX IF NOT EXISTS live_rollups_date_region_idx ON live_rollups (date, region);
+
+-- daily totals including orders the cron aggregation has not picked up yet
+CREATE OR REPLACE VIEW daily_metrics_live AS
+  SELECT
+    date,
+    region,
+    SUM(total_orders)::INT AS total_orders,
+    SUM(total_revenue) AS total_revenue,
+    SUM(total_revenue) / NULLIF(SUM(total_orders), 0) AS avg_order_value,
+    BOOL_OR(is_promo_day) AS is_promo_day
+  FROM (
+    SELECT date, region, total_orders, total_revenue, is_promo_day FROM daily_metrics
+    UNION ALL
+    SELECT date, region, total_orders, total_revenue, EXTRACT(DAY FROM date) = 10 FROM live_rollups
+  ) merged
+  GROUP BY date, region;
+
+-- history series for the dashboard; NULL filters mean "All". Live deltas are
+-- merged in so today's history moves between cron aggregation runs.
+CREATE OR REPLACE FUNCTION get_history_rollup(
+  p_region VARCHAR,
+  p_since DATE,
+  p_category VARCHAR DEFAULT NULL,
+  p_segment VARCHAR DEFAULT NULL,
+  p_hour INT DEFAULT NULL
+)
+RETURNS TABLE (
+  date DATE,
+  total_orders BIGINT,
+  total_revenue NUMERIC,
+  is_promo_day BOOLEAN
+)
+LANGUAGE sql STABLE AS $$
+  SELECT
+    r.date,
+    SUM(r.total_orders)::BIGINT,
+    SUM(r.total_revenue),
+    COALESCE(BOOL_OR(dm.is_promo_day), EXTRACT(DAY FROM r.date) = 10)
+  FROM (
+    SELECT date, hour, region, category, user_segment, total_orders, total_revenue FROM order_rollups
+    UNION ALL
+    SELECT date, hour, region, category, user_segment, total_orders, total_revenue FROM live_rollups
+  ) r
+  LEFT JOIN daily_metrics dm
+    ON dm.date = r.date AND dm.region = r.region
+  WHERE r.region = p_region
+    AND r.date >= p_since
+    AND (p_category IS NULL OR r.category = p_category)
+    AND (p_segment IS NULL OR r.user_segment = p_segment)
+    AND (p_hour IS NULL OR r.hour = p_hour)
+  GROUP BY r.date
+  ORDER BY r.date;
+$$;
+
+-- distinct filter values for the dashboard sidebar, maintained by aggregate_daily_metrics.py
+CREATE TABLE IF NOT EXISTS order_dimensions (
+  dimension VARCHAR,
+  value VARCHAR,
+  PRIMARY KEY (dimension, value)
+);
+
+-- per-stage history written by archive/run_pipeline.py
+CREATE TABLE IF NOT EXISTS pipeline_runs (
+  stage VARCHAR,
+  status VARCHAR,
+  started_at TIMESTAMP,
+  finished_at TIMESTAMP,
+  wall_seconds NUMERIC,
+  rows BIGINT,
+  input_fingerprint VARCHAR,
+  error TEXT
 );
+CREATE INDEX IF NOT EXISTS pipeline_runs_stage_idx ON pipeline_runs (stage, finished_at);
@@ -0,0 +1,40 @@
+# result_cache.py
+import threading
+from collections import OrderedDict
+import instrumentation
+
+
+# Bounded LRU of query results, shared across sessions. Entries are dropped as
+# soon as the data version changes (new forecasts or a new aggregation run).
+class ResultCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.version = None
+        self.lock = threading.Lock()
+
+    def sync_version(self, version):
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                instrumentation.inc("dashboard_cache_hits_total", query=key[0])
+                return self.entries[key]
+            version = self.version
+        instrumentation.inc("dashboard_cache_misses_total", query=key[0])
+        value = compute()
+        with self.lock:
+            # Another session moved to a newer version while this computed, so
+            # the value may be older than what the cache now stands for
+            if self.version != version:
+                return value
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
@@ -1,28 +1,57 @@
 # simulate_orders.py
-import random
-import uuid
 from datetime import datetime
-from faker import Faker
+import pandas as pd
+from order_generator import generate_orders, make_rng
+import order_codec
 
-fake = Faker()
-
-REGIONS = ['Northeast', 'Midwest', 'South', 'West']
 PRODUCT_IDS = ['SKU-001', 'SKU-002', 'SKU-003', 'SKU-004']
-DEVICE_TYPES = ['mobile', 'desktop', 'tablet']
+CHUNK_SIZE = 1000
+
+_rng = make_rng()
+_buffer = []
+
+
+def generate_orders_batch(n):
+    # n orders stamped "now", as plain dicts ready to serialize
+    now = datetime.utcnow()
+    orders = generate_orders(n, rng=_rng, product_ids=PRODUCT_IDS)
+    orders["timestamp"] = now.isoformat()
+    orders["hour"] = now.hour
+    return orders.to_dict(orient="records")
+
+
+def _orders_now(n):
+    now = datetime.utcnow()
+    orders = generate_orders(n, rng=_rng, product_ids=PRODUCT_IDS)
+    orders["timestamp"] = pd.Timestamp(now)
+    orders["hour"] = now.hour
+    return orders
+
+
+def generate_payloads(n, codec=order_codec.ORDER_CODEC):
+    # n orders stamped "now", already encoded for the wire
+    return order_codec.encode_frame(_orders_now(n), codec)
+
+
+def generate_keyed_payloads(n, key_column="region", codec=order_codec.ORDER_CODEC):
+    # (message key, payload) pairs; key_column=None leaves messages unkeyed
+    orders = _orders_now(n)
+    payloads = order_codec.encode_frame(orders, codec)
+    if key_column is None:
+        return [(None, payload) for payload in payloads]
+    return list(zip(orders[key_column].str.encode("utf-8"), payloads))
+
 
 def generate_order():
-    order = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "order_id": f"ORD-{uuid.uuid4().hex[:10]}",
-        "product_id": random.choice(PRODUCT_IDS),
-        "user_id": f"USER-{uuid.uuid4().hex[:8]}",
-        "region": random.choice(REGIONS),
-        "quantity": random.randint(1, 5),
-        "unit_price": round(random.uniform(10, 100), 2),
-        "device_type": random.choice(DEVICE_TYPES),
-        "promo_applied": random.choice([True, False])
-    }
-    order["total_price"] = round(order["quantity"] * order["unit_price"], 2)
+    # Orders are generated in chunks and handed out one at a time
+    global _buffer
+    if not _buffer:
+        _buffer = generate_orders_batch(CHUNK_SIZE)
+        _buffer.reverse()
+    order = _buffer.pop()
+    now = datetime.utcnow()
+    order["timestamp"] = now.isoformat()
+    order["hour"] = now.hour
     return order
 
 if __name__ == "__main__":
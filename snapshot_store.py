@@ -0,0 +1,314 @@
+# snapshot_store.py
+# Date-partitioned Parquet snapshots of the analytical tables, kept up to date
+# incrementally. A manifest records each day's row file and a fingerprint of
+# its rows, plus the ingest_seq watermark each table was exported at; an export
+# only re-checks the days of orders ingested since then (live or backfilled, any
+# date), writes new days and rewrites the ones whose fingerprint moved. Readers prune
+# days through the manifest and scan memory-mapped Arrow with column and
+# predicate pushdown. DATA_SOURCE=snapshot points the dashboard and the
+# forecaster at these files instead of Postgres/Supabase.
+#
+#   python snapshot_store.py           # export new and changed days
+#   python snapshot_store.py --full    # rebuild every partition
+import argparse
+import base64
+import decimal
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+import db
+from aggregate_daily_metrics import AGGREGATION_SEQ_OVERLAP, WATERMARK_NAME
+
+load_dotenv()
+
+# --- Configs ---
+DATA_SOURCE = os.getenv("DATA_SOURCE", "db")  # db | snapshot
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_ROW_GROUP_ROWS = int(os.getenv("SNAPSHOT_ROW_GROUP_ROWS", 128_000))
+SNAPSHOT_COMPRESSION = os.getenv("SNAPSHOT_COMPRESSION", "zstd")
+
+# date: SQL for a row's partition day; range: indexed column to bound it by;
+# fingerprint: per-day aggregate that changes whenever a row does;
+# order: sort within a file, so row-group statistics prune on region;
+# watermark: the ingest_seq the table's contents are complete up to (raw orders
+# by their own sequence, aggregates by the aggregation's watermark)
+AGGREGATE_WATERMARK = f"SELECT COALESCE(MAX(watermark), 0) FROM pipeline_state WHERE name = '{WATERMARK_NAME}'"
+PARTITIONED_TABLES = {
+    "orders": {
+        "date": "timestamp::date",
+        "range": "timestamp",
+        "fingerprint": "COUNT(*) || ':' || COALESCE(MAX(ingest_seq), 0)",
+        "order": "region, timestamp",
+        "watermark": "SELECT COALESCE(MAX(ingest_seq), 0) FROM orders",
+    },
+    "daily_metrics": {
+        "date": "date",
+        "range": "date",
+        "fingerprint": "md5(string_agg(t::text, ',' ORDER BY t::text))",
+        "order": "region, date",
+        "watermark": AGGREGATE_WATERMARK,
+    },
+    "order_rollups": {
+        "date": "date",
+        "range": "date",
+        "fingerprint": "md5(string_agg(t::text, ',' ORDER BY t::text))",
+        "order": "region, category, user_segment, hour",
+        "watermark": AGGREGATE_WATERMARK,
+    },
+}
+# Small tables rewritten whole on every export
+FULL_TABLES = ["forecast_metrics", "order_dimensions", "live_rollups"]
+
+_mmap_fs = pafs.LocalFileSystem(use_mmap=True)
+
+
+# --- Manifest ---
+
+def manifest_path():
+    return os.path.join(SNAPSHOT_DIR, "manifest.json")
+
+
+def load_manifest():
+    try:
+        with open(manifest_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"updated_at": None, "tables": {}}
+
+
+def save_manifest(manifest):
+    manifest["updated_at"] = datetime.utcnow().isoformat()
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    tmp_path = f"{manifest_path()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path())
+
+
+def _decode_schema(entry):
+    encoded = entry.get("schema")
+    return pa.ipc.read_schema(pa.py_buffer(base64.b64decode(encoded))) if encoded else None
+
+
+def _merge_schema(entry, table):
+    # One schema per table across all its files, so a column that is all NULL
+    # (or all integers) on some day still reads back with the table's type
+    schema = _decode_schema(entry)
+    schema = table.schema if schema is None else pa.unify_schemas([schema, table.schema], promote_options="permissive")
+    entry["schema"] = base64.b64encode(schema.serialize().to_pybytes()).decode("ascii")
+    return schema
+
+
+# --- Export ---
+
+def _arrow_table(frame):
+    # NUMERIC columns arrive as Decimal objects; store them as doubles
+    for column in frame.columns:
+        if frame[column].dtype == object:
+            sample = frame[column].dropna()
+            if not sample.empty and isinstance(sample.iloc[0], decimal.Decimal):
+                frame[column] = frame[column].astype(float)
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+def _write_file(relative_path, table, schema):
+    path = os.path.join(SNAPSHOT_DIR, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(
+        table.cast(pa.schema([schema.field(name) for name in table.column_names])), tmp_path,
+        row_group_size=SNAPSHOT_ROW_GROUP_ROWS, compression=SNAPSHOT_COMPRESSION,
+    )
+    os.replace(tmp_path, path)
+
+
+def table_watermark(conn, table):
+    with conn.cursor() as cursor:
+        cursor.execute(PARTITIONED_TABLES[table]["watermark"])
+        seq = cursor.fetchone()[0]
+    conn.commit()
+    return seq
+
+
+def touched_days(conn, since_seq):
+    # Days of every order ingested after since_seq, including backfilled history.
+    # The overlap re-checks orders that committed below the last watermark, as
+    # the aggregation does.
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT DISTINCT timestamp::date FROM orders WHERE ingest_seq > %s
+        """, (max(since_seq - AGGREGATION_SEQ_OVERLAP, 0),))
+        days = sorted(day for day, in cursor.fetchall())
+    conn.commit()
+    return days
+
+
+def day_fingerprints(conn, table, days=None):
+    # Every day of the table when days is None; otherwise one range scan per day
+    spec = PARTITIONED_TABLES[table]
+    fingerprints = {}
+    with conn.cursor() as cursor:
+        if days is None:
+            cursor.execute(f"SELECT {spec['date']} AS day, {spec['fingerprint']} FROM {table} t GROUP BY 1")
+            fingerprints.update((day.isoformat(), fingerprint) for day, fingerprint in cursor.fetchall())
+        for day in days or []:
+            cursor.execute(f"""
+                SELECT {spec['fingerprint']} FROM {table} t
+                WHERE {spec['range']} >= %s AND {spec['range']} < %s
+                HAVING COUNT(*) > 0
+            """, (day, day + timedelta(days=1)))
+            row = cursor.fetchone()
+            if row is not None:
+                fingerprints[day.isoformat()] = row[0]
+    conn.commit()
+    return fingerprints
+
+
+def export_partitioned(conn, table, manifest, full=False):
+    spec = PARTITIONED_TABLES[table]
+    entry = manifest["tables"].setdefault(table, {"partitions": {}})
+    partitions = entry["partitions"]
+    if full:
+        entry.pop("schema", None)
+    # Read before the fingerprints, so rows landing mid-export are re-checked next time
+    seq = table_watermark(conn, table)
+    days = None if full or not partitions or "seq" not in entry else touched_days(conn, entry["seq"])
+
+    current = day_fingerprints(conn, table, days)
+    checked = set(partitions) if days is None else {day.isoformat() for day in days} & set(partitions)
+    removed = checked - set(current)
+    changed = sorted(day for day, fingerprint in current.items()
+                     if full or partitions.get(day, {}).get("fingerprint") != fingerprint)
+
+    rows = 0
+    for day in changed:
+        start = date.fromisoformat(day)
+        frame = db.read_frame(conn, f"""
+            SELECT * FROM {table}
+            WHERE {spec['range']} >= %s AND {spec['range']} < %s
+            ORDER BY {spec['order']}
+        """, (start, start + timedelta(days=1)))
+        conn.commit()
+        arrow_table = _arrow_table(frame)
+        relative_path = os.path.join(table, f"date={day}", "part-0.parquet")
+        _write_file(relative_path, arrow_table, _merge_schema(entry, arrow_table))
+        partitions[day] = {"path": relative_path, "rows": len(frame), "fingerprint": current[day]}
+        rows += len(frame)
+
+    for day in removed:
+        path = os.path.join(SNAPSHOT_DIR, partitions.pop(day)["path"])
+        if os.path.exists(path):
+            os.remove(path)
+
+    entry["seq"] = seq
+    save_manifest(manifest)
+    print(f"🗂️  {table}: wrote {len(changed)} partitions ({rows:,} rows), removed {len(removed)}, "
+          f"{len(partitions) - len(changed)} unchanged")
+    return rows
+
+
+def export_full(conn, table, manifest):
+    frame = db.read_frame(conn, f"SELECT * FROM {table}")
+    conn.commit()
+    entry = manifest["tables"][table] = {}
+    arrow_table = _arrow_table(frame)
+    relative_path = os.path.join(table, "part-0.parquet")
+    _write_file(relative_path, arrow_table, _merge_schema(entry, arrow_table))
+    entry.update({"path": relative_path, "rows": len(frame)})
+    save_manifest(manifest)
+    print(f"🗂️  {table}: wrote {len(frame):,} rows")
+    return len(frame)
+
+
+def export_snapshots(conn, tables=None, full=False):
+    tables = tables or list(PARTITIONED_TABLES) + FULL_TABLES
+    manifest = load_manifest()
+    rows = 0
+    for table in tables:
+        if table in PARTITIONED_TABLES:
+            rows += export_partitioned(conn, table, manifest, full=full)
+        else:
+            rows += export_full(conn, table, manifest)
+    return rows
+
+
+# --- Read ---
+
+def read_table(table, columns=None, filters=None, since=None, until=None):
+    # filters use pyarrow's DNF tuples, e.g. [("region", "=", "West"), ("hour", "in", [9, 10])];
+    # since/until (inclusive dates) prune whole partitions before anything is opened
+    entry = load_manifest()["tables"].get(table)
+    if entry is None:
+        raise FileNotFoundError(f"No snapshot of {table} in {SNAPSHOT_DIR}; run python snapshot_store.py first")
+    if "partitions" in entry:
+        low = since.isoformat() if since is not None else ""
+        high = until.isoformat() if until is not None else "9999"
+        paths = [part["path"] for day, part in sorted(entry["partitions"].items()) if low <= day <= high]
+    else:
+        paths = [entry["path"]]
+    schema = _decode_schema(entry)
+    if not paths or schema is None:
+        return pd.DataFrame(columns=columns or [])
+    dataset = ds.dataset(
+        [os.path.join(SNAPSHOT_DIR, path) for path in paths],
+        schema=schema, format="parquet", filesystem=_mmap_fs,
+    )
+    expression = pq.filters_to_expression(filters) if filters else None
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def version():
+    # Changes whenever an export writes anything, like the dashboard's DB version check
+    return load_manifest()["updated_at"]
+
+
+def history_rollup(region, since, category=None, segment=None, hour=None):
+    # Snapshot counterpart of the get_history_rollup SQL function: batch rollups
+    # plus the consumer's live deltas, promo flag from daily_metrics
+    filters = [("region", "=", region)]
+    if category is not None:
+        filters.append(("category", "=", category))
+    if segment is not None:
+        filters.append(("user_segment", "=", segment))
+    if hour is not None:
+        filters.append(("hour", "=", hour))
+    columns = ["date", "total_orders", "total_revenue"]
+    frames = [read_table("order_rollups", columns, filters, since=since)]
+    if "live_rollups" in load_manifest()["tables"]:
+        # Not partitioned, so the cutoff is a row filter rather than partition pruning
+        frames.append(read_table("live_rollups", columns, filters + [("date", ">=", since)]))
+    rollups = pd.concat([frame for frame in frames if not frame.empty] or frames[:1], ignore_index=True)
+    if rollups.empty:
+        return pd.DataFrame(columns=["date", "total_orders", "total_revenue", "is_promo_day"])
+    history = rollups.groupby("date", as_index=False)[["total_orders", "total_revenue"]].sum()
+    promo = read_table("daily_metrics", ["date", "is_promo_day"], [("region", "=", region)], since=since)
+    history = history.merge(promo, on="date", how="left")
+    # Days with no daily_metrics row yet (live only) fall back to the promo rule, as in SQL
+    promo_rule = pd.Series([day.day == 10 for day in history["date"]], index=history.index)
+    history["is_promo_day"] = history["is_promo_day"].astype("boolean").fillna(promo_rule).astype(bool)
+    return history.sort_values("date").reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Parquet snapshots of the analytical tables")
+    parser.add_argument("--full", action="store_true", help="rewrite every partition")
+    parser.add_argument("--tables", help=f"comma-separated subset of {', '.join(list(PARTITIONED_TABLES) + FULL_TABLES)}")
+    args = parser.parse_args()
+
+    tables = [table.strip() for table in args.tables.split(",")] if args.tables else None
+    start = time.perf_counter()
+    with db.connection() as conn:
+        rows = export_snapshots(conn, tables, full=args.full)
+    db.close_pool()
+    print(f"✅ Snapshots in {SNAPSHOT_DIR} up to date ({rows:,} rows written in {time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
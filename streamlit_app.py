@@ -1,9 +1,15 @@
 import os
+import tempfile
+import time
 import pandas as pd
 import altair as alt
 import streamlit as st
 from supabase import create_client, Client
 import datetime
+import instrumentation
+import snapshot_store
+from order_fetcher import OrderFetcher
+from result_cache import ResultCache
 
 # Initialize Supabase connection
 @st.cache_resource
@@ -12,13 +18,62 @@ def init_connection():
     key: str = st.secrets["connections"]["supabase"]["SUPABASE_KEY"]
     return create_client(url, key)
 
-supabase: Client = init_connection()
+# DATA_SOURCE=snapshot reads the local Parquet snapshots kept by snapshot_store.py
+LOCAL_SNAPSHOTS = snapshot_store.DATA_SOURCE == "snapshot"
+supabase: Client = None if LOCAL_SNAPSHOTS else init_connection()
 
-# Fetch forecasted metrics for a selected region and metric
-def get_forecast(region, metric):
+
+# Query latency and cache metrics on METRICS_PORT, shared by every session
+@st.cache_resource
+def start_metrics_server():
+    return instrumentation.serve()
+
+start_metrics_server()
+
+DIMENSIONS_TTL_SECONDS = 600
+RESULT_CACHE_SIZE = 128
+# Today's history moves with the consumer's live deltas between aggregation runs,
+# so history results are only reused within this window
+HISTORY_LIVE_SECONDS = 60
+
+
+@st.cache_resource
+def get_result_cache():
+    return ResultCache(RESULT_CACHE_SIZE)
+
+
+# Cheap version check: newest forecast timestamp plus the aggregation watermark
+def get_data_version():
+    if LOCAL_SNAPSHOTS:
+        return snapshot_store.version(), None
+    forecast_resp = supabase.table("forecast_metrics").select("created_at").order("created_at", desc=True).limit(1).execute()
+    watermark_resp = supabase.table("pipeline_state").select("watermark").eq("name", "daily_metrics").execute()
+    return (
+        forecast_resp.data[0]["created_at"] if forecast_resp.data else None,
+        watermark_resp.data[0]["watermark"] if watermark_resp.data else None,
+    )
+
+
+def forecast_rows(region, metrics, category, segment):
+    if LOCAL_SNAPSHOTS:
+        df = snapshot_store.read_table(
+            "forecast_metrics", ["region", "metric", "forecast_date", "forecast_value"],
+            [("region", "=", region), ("metric", "in", metrics), ("category", "=", category), ("user_segment", "=", segment)],
+        )
+        return df.sort_values("forecast_date")
+    response = supabase.table("forecast_metrics").select("region, metric, forecast_date, forecast_value").eq("region", region).eq("category", category).eq("user_segment", segment).in_("metric", metrics).order("forecast_date").execute()
+    return pd.DataFrame(response.data)
+
+
+# Fetch forecasted metrics for a selected region and metric. Category and
+# segment pick the matching node of the forecast hierarchy ('All' = region level).
+@instrumentation.timed("dashboard_query_seconds", query="forecast")
+def get_forecast(region, metric, category="All", segment="All"):
+    empty = pd.DataFrame(columns=["forecast_date", "forecast_value", "type"])
     if metric == "avg_order_value":
-        response = supabase.table("forecast_metrics").select("region, metric, forecast_date, forecast_value").eq("region", region).in_("metric", ["total_orders", "total_revenue"]).execute()
-        df_raw = pd.DataFrame(response.data)
+        df_raw = forecast_rows(region, ["total_orders", "total_revenue"], category, segment)
+        if df_raw.empty:
+            return empty
         df_pivot = df_raw.pivot(index="forecast_date", columns="metric", values="forecast_value")
         df_pivot = df_pivot.dropna()
         df_pivot["forecast_value"] = df_pivot["total_revenue"] / df_pivot["total_orders"]
@@ -27,66 +82,79 @@ def get_forecast(region, metric):
         df_pivot["forecast_date"] = pd.to_datetime(df_pivot["forecast_date"])
         return df_pivot[["forecast_date", "forecast_value", "type"]]
     else:
-        response = supabase.table("forecast_metrics").select("forecast_date, forecast_value").eq("region", region).eq("metric", metric).order("forecast_date").execute()
-        df = pd.DataFrame(response.data)
+        df = forecast_rows(region, [metric], category, segment)
+        if df.empty:
+            return empty
+        df = df[["forecast_date", "forecast_value"]]
         df["type"] = "Forecast"
         df["forecast_date"] = pd.to_datetime(df["forecast_date"])
         return df
 
-# Fetch historical data based on selected filters
-def get_history(region, metric, category, segment, hour, lookback_days):
-    rows = []
-    page_size = 1000
-    start = 0
-    while True:
-        batch = supabase.table("orders")\
-            .select("timestamp, region, category, user_segment, total_price")\
-            .eq("region", region)\
-            .range(start, start + page_size - 1)\
-            .execute()
-        rows.extend(batch.data)
-        if len(batch.data) < page_size:
-            break
-        start += page_size
-
-    response = type('obj', (object,), {'data': rows})
-    df_orders = pd.DataFrame(response.data)
-
-    if df_orders.empty:
+# Fetch historical data based on selected filters.
+# Filters are pushed down to the order_rollups table, so the cost follows the
+# lookback window rather than the number of raw orders. get_history_rollup also
+# adds the consumer's live_rollups, so the current day is not frozen at the last
+# aggregation run.
+@instrumentation.timed("dashboard_query_seconds", query="history")
+def get_history(region, metric, category, segment, hour, cutoff_date):
+    filters = {
+        "category": None if category == "All" else category,
+        "segment": None if segment == "All" else segment,
+        "hour": None if hour == "All" else int(hour),
+    }
+    if LOCAL_SNAPSHOTS:
+        df_rollup = snapshot_store.history_rollup(region, cutoff_date, **filters)
+    else:
+        response = supabase.rpc("get_history_rollup", {
+            "p_region": region,
+            "p_since": cutoff_date.isoformat(),
+            "p_category": filters["category"],
+            "p_segment": filters["segment"],
+            "p_hour": filters["hour"],
+        }).execute()
+        df_rollup = pd.DataFrame(response.data)
+
+    if df_rollup.empty:
         return pd.DataFrame()
 
-    df_orders["timestamp"] = pd.to_datetime(df_orders["timestamp"])
-    cutoff_date = pd.Timestamp.now() - pd.Timedelta(days=lookback_days)
-    df_orders = df_orders[df_orders["timestamp"] >= cutoff_date]
-
-    if category != "All":
-        df_orders = df_orders[df_orders["category"] == category]
-    if segment != "All":
-        df_orders = df_orders[df_orders["user_segment"] == segment]
-    if hour != "All":
-        df_orders = df_orders[df_orders["timestamp"].dt.hour == int(hour)]
-
-    df_orders["forecast_date"] = df_orders["timestamp"].dt.floor("D")
+    total_orders = df_rollup["total_orders"].astype(float)
+    total_revenue = df_rollup["total_revenue"].astype(float)
 
     if metric == "total_revenue":
-        agg = df_orders.groupby("forecast_date")["total_price"].sum()
+        values = total_revenue
     elif metric == "total_orders":
-        agg = df_orders.groupby("forecast_date")["total_price"].count()
+        values = total_orders
     elif metric == "avg_order_value":
-        agg = df_orders.groupby("forecast_date")["total_price"].mean()
+        values = total_revenue / total_orders
     else:
         st.error(f"Unsupported metric: {metric}")
         st.stop()
 
-    df_metrics = agg.reset_index().rename(columns={"total_price": "forecast_value"})
-    df_metrics["type"] = "Historical"
+    return pd.DataFrame({
+        "forecast_date": pd.to_datetime(df_rollup["date"]),
+        "forecast_value": values,
+        "type": "Historical",
+        "region": region,
+        "is_promo_day": df_rollup["is_promo_day"],
+    })
 
-    promo_resp = supabase.table("daily_metrics").select("date, region, is_promo_day").eq("region", region).execute()
-    df_promo = pd.DataFrame(promo_resp.data)
-    df_promo["date"] = pd.to_datetime(df_promo["date"]).dt.floor("D")
 
-    df = df_metrics.merge(df_promo, left_on=["forecast_date"], right_on=["date"], how="left")
-    return df.drop(columns="date")
+# Distinct sidebar filter values from the small order_dimensions catalog
+@st.cache_data(ttl=DIMENSIONS_TTL_SECONDS)
+def get_dimensions():
+    if LOCAL_SNAPSHOTS:
+        rows = snapshot_store.read_table("order_dimensions", ["dimension", "value"]).to_dict(orient="records")
+    else:
+        rows = supabase.table("order_dimensions").select("dimension, value").execute().data
+    values = {"category": set(), "user_segment": set(), "hour": set()}
+    for row in rows:
+        if row["dimension"] in values and row["value"]:
+            values[row["dimension"]].add(row["value"])
+    return (
+        sorted(values["category"]),
+        sorted(values["user_segment"]),
+        sorted(int(h) for h in values["hour"]),
+    )
 
 
 # Sidebar filter controls
@@ -96,21 +164,25 @@ metric = st.sidebar.radio("Metric", ['total_orders', 'total_revenue', 'avg_order
 
 lookback_days = st.sidebar.selectbox("Lookback Period", [7, 14, 30, 60, 90], index=2)
 
-category_resp = supabase.table("orders").select("category").execute()
-segment_resp = supabase.table("orders").select("user_segment").execute()
-hour_resp = supabase.table("orders").select("hour").order("hour").execute()
-
-categories = sorted({row["category"] for row in category_resp.data if row["category"]})
-segments = sorted({row["user_segment"] for row in segment_resp.data if row["user_segment"]})
-hours = sorted({row["hour"] for row in hour_resp.data if row["hour"] is not None})
+categories, segments, hours = get_dimensions()
 
 selected_category = st.sidebar.selectbox("Product Category", ["All"] + categories)
 selected_segment = st.sidebar.selectbox("User Segment", ["All"] + segments)
 selected_hour = st.sidebar.selectbox("Hour of Day", ["All"] + [str(h) for h in hours])
 
 # Pull and combine forecast and history data
-df_forecast = get_forecast(region, metric)
-df_history = get_history(region, metric, selected_category, selected_segment, selected_hour, lookback_days)
+result_cache = get_result_cache()
+result_cache.sync_version(get_data_version())
+history_cutoff = (pd.Timestamp.now() - pd.Timedelta(days=lookback_days)).date()
+df_forecast = result_cache.get_or_compute(
+    ("forecast", region, metric, selected_category, selected_segment),
+    lambda: get_forecast(region, metric, selected_category, selected_segment)
+)
+df_history = result_cache.get_or_compute(
+    ("history", region, metric, selected_category, selected_segment, selected_hour, history_cutoff,
+     None if LOCAL_SNAPSHOTS else int(time.time() // HISTORY_LIVE_SECONDS)),
+    lambda: get_history(region, metric, selected_category, selected_segment, selected_hour, history_cutoff)
+)
 df_combined = pd.concat([df_forecast, df_history]) if not df_history.empty else df_forecast
 
 promo_dates = df_history[df_history['is_promo_day'] == True]['forecast_date'].tolist() if not df_history.empty else []
@@ -137,6 +209,10 @@ chart = base + promo_overlay
 
 # Display title and chart
 st.title("📈 Forecast Dashboard")
+if df_forecast.empty:
+    st.info("No forecast is available for this category and segment yet.")
+elif selected_hour != "All":
+    st.caption("Forecasts are daily totals; the hour filter applies to the history line only.")
 st.altair_chart(chart, use_container_width=True)
 
 # Show forecast table
@@ -150,3 +226,25 @@ st.download_button(
     file_name=f"forecast_{region}_{metric}.csv",
     mime='text/csv'
 )
+
+# Raw orders for the current filters, paged by keyset and written to a temp
+# file slice by slice instead of being built up as one DataFrame
+if not LOCAL_SNAPSHOTS:
+    st.subheader("🧾 Raw Orders")
+    if st.button("Prepare raw orders CSV"):
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=lookback_days)
+        # The temp file is closed (and deleted) once Streamlit has its contents
+        with tempfile.TemporaryFile("w+", newline="") as raw_csv:
+            with st.spinner("Fetching raw orders..."), instrumentation.timer("dashboard_query_seconds", query="raw_orders"):
+                n_orders = OrderFetcher(supabase).write_csv(
+                    raw_csv, cutoff, region=region, category=selected_category, user_segment=selected_segment,
+                    hour=None if selected_hour == "All" else int(selected_hour),
+                )
+            raw_csv.seek(0)
+            raw_data = raw_csv.read()
+        st.download_button(
+            label=f"Download {n_orders:,} raw orders",
+            data=raw_data,
+            file_name=f"orders_{region}_{lookback_days}d.csv",
+            mime='text/csv'
+        )
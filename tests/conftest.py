@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Scripts import each other as top-level modules, from the root and from archive/
+sys.path[:0] = [ROOT, os.path.join(ROOT, "archive")]
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+import fast_forecast
+
+
+def weekly_series(days=70, level=100.0, seed=0):
+    rng = np.random.default_rng(seed)
+    ds = pd.date_range("2026-01-01", periods=days, freq="D")
+    season = np.tile([0, 5, 10, 5, 0, -10, -10], days // 7 + 1)[:days]
+    return pd.DataFrame({"ds": ds, "y": level + season + rng.normal(0, 1, days)})
+
+
+@pytest.mark.parametrize("model", ["auto", *fast_forecast.MODELS])
+def test_forecast_shape_and_dates(model):
+    df = weekly_series()
+    forecasts, models = fast_forecast.forecast_many([("West", df)], 7, model=model)
+    forecast = forecasts["West"]
+    assert list(forecast.columns) == ["ds", "yhat", "yhat_lower", "yhat_upper"]
+    assert len(forecast) == 7
+    assert forecast["ds"].iloc[0] == df["ds"].iloc[-1] + pd.Timedelta(days=1)
+    assert (forecast["yhat_lower"] <= forecast["yhat"]).all()
+    assert (forecast["yhat"] <= forecast["yhat_upper"]).all()
+    assert models["West"] in fast_forecast.MODELS
+
+
+def test_seasonal_naive_repeats_last_week():
+    df = weekly_series()
+    forecasts, _ = fast_forecast.forecast_many([("West", df)], 7, model="seasonal_naive")
+    assert np.allclose(forecasts["West"]["yhat"].to_numpy(), df["y"].to_numpy()[-7:])
+
+
+def test_auto_tracks_a_weekly_pattern():
+    df = weekly_series()
+    forecasts, _ = fast_forecast.forecast_many([("West", df.iloc[:-7])], 7)
+    error = np.abs(forecasts["West"]["yhat"].to_numpy() - df["y"].to_numpy()[-7:])
+    assert error.mean() < 5
+
+
+def test_series_of_different_lengths_and_gaps():
+    long = weekly_series(70)
+    short = weekly_series(21, level=10.0).drop(index=[5, 6])
+    forecasts, _ = fast_forecast.forecast_many([("long", long), ("short", short)], 3)
+    assert forecasts["short"]["ds"].iloc[0] == short["ds"].iloc[-1] + pd.Timedelta(days=1)
+    assert forecasts["short"]["yhat"].between(-10, 40).all()
+    assert forecasts["long"]["yhat"].between(70, 130).all()
+
+
+def test_unknown_model_is_rejected():
+    with pytest.raises(ValueError, match="Unknown fast_forecast model"):
+        fast_forecast.forecast_many([("West", weekly_series())], 7, model="arima")
+
+
+def test_engine_config_is_validated():
+    pytest.importorskip("prophet")
+    import forecast_and_store
+
+    assert forecast_and_store.parse_engine_overrides("West=numpy,South:total_revenue=ses", "prophet") == {
+        ("West", None): "numpy", ("South", "total_revenue"): "ses",
+    }
+    with pytest.raises(ValueError, match="FORECAST_ENGINE_OVERRIDES"):
+        forecast_and_store.parse_engine_overrides("West=arima", "prophet")
+    with pytest.raises(ValueError, match="FORECAST_ENGINE"):
+        forecast_and_store.parse_engine_overrides("", "prohpet")
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+hierarchical_forecast = pytest.importorskip("hierarchical_forecast")
+ALL = hierarchical_forecast.ALL
+
+
+def hierarchy():
+    cells = [("Books", "VIP"), ("Books", "guest"), ("Toys", "VIP")]
+    return hierarchical_forecast.summing_matrix(cells)
+
+
+def assert_coherent(nodes, S, coherent):
+    n_cells = S.shape[1]
+    bottom = coherent[:n_cells]
+    for i, (category, segment) in enumerate(nodes):
+        members = [j for j, (cat, seg) in enumerate(nodes[:n_cells])
+                   if category in (ALL, cat) and segment in (ALL, seg)]
+        assert np.allclose(coherent[i], bottom[members].sum(axis=0))
+
+
+def test_summing_matrix_nodes():
+    nodes, S = hierarchy()
+    assert nodes[-1] == (ALL, ALL)
+    assert ("Books", ALL) in nodes and (ALL, "VIP") in nodes
+    assert S.shape == (len(nodes), 3)
+    assert S[-1].tolist() == [1, 1, 1]
+
+
+@pytest.mark.parametrize("method", ["bottom_up", "ols", "mint"])
+def test_reconciled_forecasts_add_up(method):
+    nodes, S = hierarchy()
+    rng = np.random.default_rng(1)
+    base = rng.uniform(5, 50, size=(len(nodes), 7))  # deliberately incoherent
+    variance = rng.uniform(0.5, 5, size=len(nodes))
+    coherent = hierarchical_forecast.reconcile(S, base, variance, method=method)
+    assert coherent.shape == base.shape
+    assert_coherent(nodes, S, coherent)
+
+
+def test_coherent_base_is_left_unchanged():
+    nodes, S = hierarchy()
+    bottom = np.arange(21, dtype=float).reshape(3, 7)
+    base = S @ bottom
+    for method in ["bottom_up", "ols", "mint"]:
+        assert np.allclose(hierarchical_forecast.reconcile(S, base, np.ones(len(nodes)), method=method), base)
+
+
+def test_unknown_method_is_rejected():
+    nodes, S = hierarchy()
+    with pytest.raises(ValueError):
+        hierarchical_forecast.reconcile(S, np.ones((len(nodes), 7)), np.ones(len(nodes)), method="topdown")
+
+
+def test_build_blocks_fills_missing_days_with_zero():
+    days = pd.date_range("2026-01-01", periods=hierarchical_forecast.HIERARCHY_MIN_HISTORY_DAYS, freq="D").date
+    cells = pd.DataFrame({
+        "date": list(days) + [days[0]],
+        "region": "West",
+        "category": ["Books"] * len(days) + ["Toys"],
+        "user_segment": "VIP",
+        "total_orders": 1.0,
+        "total_revenue": 10.0,
+    })
+    blocks = hierarchical_forecast.build_blocks(cells)
+    orders = next(block for block in blocks if block["metric"] == "total_orders")
+    total = orders["values"][orders["nodes"].index((ALL, ALL))]
+    assert total[0] == 2 and (total[1:] == 1).all()
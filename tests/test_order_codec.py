@@ -0,0 +1,116 @@
+import json
+from datetime import date
+import pandas as pd
+import pytest
+import order_codec
+from order_generator import ORDER_COLUMNS, generate_orders, make_rng
+
+GOOD = {
+    "order_id": "ORD-000001", "timestamp": "2026-01-05T10:15:00.123456", "product_id": "SKU-001",
+    "user_id": "USER-0001", "region": "West", "quantity": 2, "unit_price": 9.99, "total_price": 19.98,
+    "device_type": "mobile", "promo_applied": False, "category": "Books", "user_segment": "VIP", "hour": 10,
+}
+
+
+def json_payload(record):
+    return (order_codec.JSON, json.dumps(record).encode("utf-8"))
+
+
+def test_binary_round_trip():
+    orders = generate_orders(200, day=date(2026, 1, 5), rng=make_rng(7))
+    payloads = order_codec.encode_frame(orders, codec=order_codec.BINARY)
+    decoded = order_codec.decode_batch([(order_codec.BINARY, payload) for payload in payloads])
+
+    assert list(decoded.columns) == ORDER_COLUMNS
+    assert (decoded["order_id"] == orders["order_id"]).all()
+    assert (decoded["timestamp"].values == orders["timestamp"].values.astype("datetime64[us]")).all()
+    assert (decoded["region"] == orders["region"]).all()
+    assert (decoded["quantity"] == orders["quantity"]).all()
+    assert (decoded["total_price"] - orders["total_price"]).abs().max() < 0.005
+
+
+def test_encode_order_matches_encode_frame():
+    orders = generate_orders(5, day=date(2026, 1, 5), rng=make_rng(3))
+    framed = order_codec.encode_frame(orders, codec=order_codec.BINARY)
+    for payload, order in zip(framed, orders.to_dict(orient="records")):
+        assert order_codec.encode_order(order, codec=order_codec.BINARY) == payload
+
+
+def test_json_round_trip():
+    decoded = order_codec.decode_batch([json_payload(GOOD)])
+    assert decoded.to_dict(orient="records")[0]["order_id"] == GOOD["order_id"]
+    assert decoded["quantity"].dtype == "Int64"
+    assert decoded["hour"].iloc[0] == 10
+
+
+@pytest.mark.parametrize("poison", [
+    {**GOOD, "quantity": 2.5},
+    {**GOOD, "hour": "x"},
+    {**GOOD, "total_price": None},
+    {**GOOD, "timestamp": "not a time"},
+    5,
+    [1],
+])
+def test_poison_json_is_dropped(poison):
+    decoded = order_codec.decode_batch([json_payload(poison), json_payload({**GOOD, "order_id": "ORD-000002"})])
+    assert decoded["order_id"].tolist() == ["ORD-000002"]
+
+
+def test_numeric_strings_are_coerced():
+    decoded = order_codec.decode_batch([json_payload({**GOOD, "quantity": "2"})])
+    assert decoded["quantity"].tolist() == [2]
+
+
+def test_undecodable_payloads_are_dropped():
+    payloads = [
+        (order_codec.JSON, b"{not json"),
+        (order_codec.BINARY, b"short"),
+        json_payload(GOOD),
+    ]
+    decoded = order_codec.decode_batch(payloads)
+    assert decoded["order_id"].tolist() == [GOOD["order_id"]]
+
+
+class FakeMessage:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def value(self):
+        return self.payload
+
+    def headers(self):
+        return order_codec.headers_for(order_codec.JSON)
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self, asynchronous=True):
+        self.commits += 1
+
+
+class FakeConnection:
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def test_poison_message_does_not_block_flush(monkeypatch):
+    pytest.importorskip("confluent_kafka")
+    pytest.importorskip("psycopg2")
+    from kafka_consumer import BatchIngestor
+
+    consumer = FakeConsumer()
+    ingestor = BatchIngestor(consumer, FakeConnection())
+    written = []
+    monkeypatch.setattr(ingestor, "_write_frame", lambda orders: written.append(orders) or [])
+    for record in [5, {**GOOD, "quantity": 2.5}, GOOD]:
+        ingestor.add(FakeMessage(json.dumps(record).encode("utf-8")))
+
+    assert ingestor.flush() == 1
+    assert consumer.commits == 1
+    assert pd.concat(written)["order_id"].tolist() == [GOOD["order_id"]]
+    assert ingestor.payloads == []
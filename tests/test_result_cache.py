@@ -0,0 +1,66 @@
+from result_cache import ResultCache
+
+
+class Counter:
+    def __init__(self, value="fresh"):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def test_second_lookup_is_a_hit():
+    cache = ResultCache(4)
+    cache.sync_version(("v1", 1))
+    compute = Counter()
+    assert cache.get_or_compute(("forecast", "West"), compute) == "fresh"
+    assert cache.get_or_compute(("forecast", "West"), compute) == "fresh"
+    assert compute.calls == 1
+
+
+def test_same_version_keeps_entries():
+    cache = ResultCache(4)
+    cache.sync_version("v1")
+    compute = Counter()
+    cache.get_or_compute(("forecast", "West"), compute)
+    cache.sync_version("v1")
+    cache.get_or_compute(("forecast", "West"), compute)
+    assert compute.calls == 1
+
+
+def test_new_version_drops_entries():
+    cache = ResultCache(4)
+    cache.sync_version("v1")
+    compute = Counter()
+    cache.get_or_compute(("forecast", "West"), compute)
+    cache.sync_version("v2")
+    assert not cache.entries
+    cache.get_or_compute(("forecast", "West"), compute)
+    assert compute.calls == 2
+
+
+def test_value_computed_across_a_version_change_is_not_stored():
+    cache = ResultCache(4)
+    cache.sync_version("v1")
+
+    def stale():
+        # Another session sees new data while this one is still computing
+        cache.sync_version("v2")
+        return "stale"
+
+    assert cache.get_or_compute(("history", "West"), stale) == "stale"
+    assert ("history", "West") not in cache.entries
+    assert cache.get_or_compute(("history", "West"), Counter()) == "fresh"
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(2)
+    cache.sync_version("v1")
+    cache.get_or_compute(("forecast", "a"), Counter("a"))
+    cache.get_or_compute(("forecast", "b"), Counter("b"))
+    # Touch "a" so "b" becomes the oldest
+    cache.get_or_compute(("forecast", "a"), Counter())
+    cache.get_or_compute(("forecast", "c"), Counter("c"))
+    assert list(cache.entries) == [("forecast", "a"), ("forecast", "c")]
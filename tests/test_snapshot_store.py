@@ -0,0 +1,93 @@
+import warnings
+from datetime import date
+import pandas as pd
+import pytest
+
+snapshot_store = pytest.importorskip("snapshot_store")
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_store, "SNAPSHOT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def write_partitioned(manifest, table, frame):
+    # What export_partitioned writes, minus the database
+    entry = manifest["tables"].setdefault(table, {"partitions": {}})
+    for day, rows in frame.groupby("date"):
+        arrow_table = snapshot_store._arrow_table(rows.reset_index(drop=True))
+        path = f"{table}/date={day.isoformat()}/part-0.parquet"
+        snapshot_store._write_file(path, arrow_table, snapshot_store._merge_schema(entry, arrow_table))
+        entry["partitions"][day.isoformat()] = {"path": path, "rows": len(rows), "fingerprint": "x"}
+
+
+def write_full(manifest, table, frame):
+    entry = manifest["tables"][table] = {}
+    arrow_table = snapshot_store._arrow_table(frame)
+    path = f"{table}/part-0.parquet"
+    snapshot_store._write_file(path, arrow_table, snapshot_store._merge_schema(entry, arrow_table))
+    entry.update({"path": path, "rows": len(frame)})
+
+
+def rollup(day, region, orders, revenue, hour=9, category="Books", segment="VIP"):
+    return {"date": day, "hour": hour, "region": region, "category": category,
+            "user_segment": segment, "total_orders": orders, "total_revenue": revenue}
+
+
+def test_manifest_round_trip(snapshot_dir):
+    assert snapshot_store.load_manifest() == {"updated_at": None, "tables": {}}
+    manifest = snapshot_store.load_manifest()
+    manifest["tables"]["orders"] = {"partitions": {"2026-01-05": {"path": "p", "rows": 3, "fingerprint": "3:9"}}, "seq": 9}
+    snapshot_store.save_manifest(manifest)
+
+    loaded = snapshot_store.load_manifest()
+    assert loaded["tables"] == manifest["tables"]
+    assert loaded["updated_at"] is not None
+    assert snapshot_store.version() == loaded["updated_at"]
+
+
+def test_schema_is_unified_across_days(snapshot_dir):
+    # A column that is all NULL on one day still reads back with the table's type
+    manifest = snapshot_store.load_manifest()
+    frame = pd.DataFrame([
+        {"date": date(2026, 1, 5), "region": "West", "category": None},
+        {"date": date(2026, 1, 6), "region": "West", "category": "Books"},
+    ])
+    write_partitioned(manifest, "order_rollups", frame)
+    snapshot_store.save_manifest(manifest)
+
+    table = snapshot_store.read_table("order_rollups")
+    assert sorted(table["category"].dropna()) == ["Books"]
+    pruned = snapshot_store.read_table("order_rollups", since=date(2026, 1, 6))
+    assert pruned["date"].tolist() == [date(2026, 1, 6)]
+
+
+def test_history_rollup_matches_sql(snapshot_dir):
+    manifest = snapshot_store.load_manifest()
+    write_partitioned(manifest, "order_rollups", pd.DataFrame([
+        rollup(date(2026, 1, 9), "West", 4, 40.0),
+        rollup(date(2026, 1, 9), "West", 1, 10.0, hour=10),
+        rollup(date(2026, 1, 9), "South", 7, 70.0),
+    ]))
+    write_partitioned(manifest, "daily_metrics", pd.DataFrame([
+        {"date": date(2026, 1, 9), "region": "West", "total_orders": 5, "is_promo_day": True},
+    ]))
+    write_full(manifest, "live_rollups", pd.DataFrame([
+        rollup(date(2026, 1, 9), "West", 2, 20.0),
+        rollup(date(2026, 1, 10), "West", 3, 30.0),
+        rollup(date(2026, 1, 1), "West", 99, 990.0),
+    ]))
+    snapshot_store.save_manifest(manifest)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", FutureWarning)
+        history = snapshot_store.history_rollup("West", date(2026, 1, 5))
+    assert history["date"].tolist() == [date(2026, 1, 9), date(2026, 1, 10)]
+    assert history["total_orders"].tolist() == [7, 3]
+    assert history["total_revenue"].tolist() == [70.0, 30.0]
+    # The 10th has no daily_metrics row yet, so the promo rule applies
+    assert history["is_promo_day"].tolist() == [True, True]
+
+    hourly = snapshot_store.history_rollup("West", date(2026, 1, 5), hour=10)
+    assert hourly["total_orders"].tolist() == [1]